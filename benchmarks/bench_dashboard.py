@@ -0,0 +1,354 @@
+# benchmarks/bench_dashboard.py
+"""
+Офлайн-бенчмарк дашборда: синтетический флот + замер хендлеров целиком (Telegram заглушен).
+
+    python benchmarks/bench_dashboard.py --projects 5 --workers 1000 --fails 500 --inv-keys 8
+    python benchmarks/bench_dashboard.py --out before.json
+    python benchmarks/bench_dashboard.py --out after.json --compare before.json
+
+Где живет флот:
+    * по умолчанию - in-process Redis (pip install fakeredis lupa), ничего поднимать не нужно;
+    * --redis-url redis://localhost:6379/15 - настоящий локальный Redis. База должна быть пустой
+      (или --flush, тогда она будет очищена ДО и ПОСЛЕ прогона).
+
+config.py бота не читается вообще: бенчмарк подставляет свой конфиг, так что боевая база
+и токен не используются. Результат - JSON с отсортированными ключами, его удобно диффать между коммитами.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STATUSES = ["Working 🟢", "Working 🟢", "Working 🟢", "Sleeping 💤", "Errors 🔴"]
+
+
+# === ⚙️ ОКРУЖЕНИЕ ===
+def install_config(redis_url: str):
+    cfg = types.ModuleType("config")
+    cfg.TG_BOT_TOKEN = "123456:BENCHMARKBENCHMARKBENCHMARKBENCHMAR"
+    cfg.TG_USER_ID = "1"
+    cfg.REDIS_URL = redis_url
+    sys.modules["config"] = cfg
+
+
+def make_clients(redis_url: str):
+    """Sync-клиент для генератора флота. Для fakeredis пул бота подменяется на in-process сервер."""
+    import redis
+    import redis.asyncio as aioredis
+
+    if redis_url:
+        install_config(redis_url)
+        return redis.Redis.from_url(redis_url, decode_responses=True)
+
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("❌ Нужен fakeredis (pip install fakeredis lupa) или --redis-url на локальный Redis")
+
+    server = fakeredis.FakeServer()
+
+    def from_url(url, **kwargs):
+        return aioredis.ConnectionPool(connection_class=fakeredis.FakeAsyncConnection, server=server,
+                                       decode_responses=True)
+
+    aioredis.BlockingConnectionPool.from_url = staticmethod(from_url)
+    install_config("redis://in-process")
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+# === 🏭 СИНТЕТИЧЕСКИЙ ФЛОТ ===
+def project_name(i: int) -> str:
+    return f"bench{i:02d}"  # без "_" - имя проекта идет в callback_data через split("_")
+
+
+def worker_name(i: int, group_size: int) -> str:
+    return f"srv{i // group_size:03d}_{i % group_size}" if group_size > 1 else f"srv{i:04d}"
+
+
+def wallet(i: int) -> str:
+    return "0x" + f"{i:040x}"
+
+
+def generate_fleet(client, args) -> dict:
+    """Заполняет базу и возвращает цели для хендлеров"""
+    from modules.status_store import encode_status, PROJECTS_KEY, STATUS_TTL
+    from modules.inventory import inventory_key
+    from modules.timeseries import queue_sample
+    from modules.status_store import short_wallet_id
+
+    rnd = random.Random(args.seed)
+    now = time.time()
+    inv_names = [f"🪙 Metric {k}" for k in range(args.inv_keys)]
+
+    for p in range(args.projects):
+        proj = project_name(p)
+        pipe = client.pipeline(transaction=False)
+        totals = {name: 0 for name in inv_names}
+        for w in range(args.workers):
+            status = rnd.choice(STATUSES)
+            age = rnd.uniform(0, 600)
+            if rnd.random() < 0.05: age = 7200  # "упавшие" воркеры -> offline
+            done = rnd.randint(0, args.accounts)
+            fail = rnd.randint(0, done // 10)
+            inv = {name: rnd.randint(0, 1000) for name in inv_names}
+            for name, v in inv.items(): totals[name] += v
+            data = {"status": status, "account": wallet(w), "last_updated": now - age, "heartbeat": 3600,
+                    "done": done, "total": args.accounts, "success": done - fail, "fail": fail,
+                    "position": done + 1, "inv": inv}
+            if "Error" in status: data["error"] = "<b>Bench:</b> synthetic error"
+            pipe.hset(f"status:{proj}", worker_name(w, args.group_size), encode_status(data))
+            if w % 500 == 499:
+                pipe.execute()
+        pipe.expire(f"status:{proj}", STATUS_TTL)
+        pipe.sadd(PROJECTS_KEY, proj)
+        if totals: pipe.hset(inventory_key(proj), mapping=totals)
+        pipe.execute()
+
+    # Упавшие кошельки и история скорости - у целевого воркера (его открывают хендлеры ниже)
+    proj, dev = project_name(0), worker_name(0, args.group_size)
+    pipe = client.pipeline(transaction=False)
+    for i in range(args.fails):
+        addr = wallet(10 ** 6 + i)
+        logs = [f"12:00:{s:02d} | ERROR | Module{s} | synthetic failure line {s}" for s in range(args.log_lines)]
+        pipe.zadd(f"failures:{proj}:{dev}", {addr: now - i})
+        pipe.hset(f"fail_logs:{proj}:{dev}", addr, json.dumps(logs))
+        pipe.hset(f"fail_ids:{proj}:{dev}", short_wallet_id(addr), addr)
+        if i % 500 == 499:
+            pipe.execute()
+    pipe.execute()
+
+    if args.samples:
+        pipe = client.pipeline(transaction=False)
+        for m in range(args.samples):
+            queue_sample(pipe, proj, dev, now - m * 60, 3, 2, 1)
+        pipe.execute()
+
+    return {"project": proj, "device": dev, "group": dev.rsplit("_", 1)[0],
+            "wallet_id": short_wallet_id(wallet(10 ** 6)) if args.fails else None}
+
+
+# === 🤖 ЗАГЛУШКИ TELEGRAM ===
+class StubMessage:
+    def __init__(self, bot_module):
+        self._bot = bot_module
+        self.sent = 0
+        self.bytes = 0
+
+    async def edit_text(self, text, reply_markup=None, parse_mode=None, **kwargs):
+        self.sent += 1
+        self.bytes += len(text)
+
+    async def answer(self, text, **kwargs):
+        self.sent += 1
+        self.bytes += len(text)
+
+    async def answer_document(self, document, caption=None, **kwargs):
+        # Поток читаем до конца - как это сделал бы aiogram при загрузке
+        async for chunk in document.read(self._bot.bot):
+            self.bytes += len(chunk)
+        self.sent += 1
+
+
+class StubCallback:
+    def __init__(self, bot_module, data: str):
+        self.data = data
+        self.message = StubMessage(bot_module)
+        self.from_user = types.SimpleNamespace(id=1)
+
+    async def answer(self, text=None, show_alert=False, **kwargs):
+        pass
+
+
+# === ⏱ ЗАМЕРЫ ===
+async def measure(bot_module, name: str, make_call, repeat: int, warmup: int) -> dict:
+    from modules.perf import HandlerIO, current_io, percentile
+
+    durations, calls, out_bytes = [], [], 0
+    for i in range(warmup + repeat):
+        io = HandlerIO()
+        token = current_io.set(io)
+        started = time.perf_counter()
+        try:
+            result = await make_call()
+        finally:
+            elapsed = time.perf_counter() - started
+            current_io.reset(token)
+        if i >= warmup:
+            durations.append(elapsed)
+            calls.append(io.redis_calls)
+            if isinstance(result, StubCallback): out_bytes = result.message.bytes
+    return {
+        "name": name, "runs": repeat,
+        "mean_ms": round(sum(durations) / len(durations) * 1000, 3),
+        "p50_ms": round(percentile(sorted(durations), 0.50) * 1000, 3),
+        "p95_ms": round(percentile(sorted(durations), 0.95) * 1000, 3),
+        "min_ms": round(min(durations) * 1000, 3),
+        "redis_calls": round(sum(calls) / len(calls), 1),
+        "output_bytes": out_bytes,
+    }
+
+
+def handler_cases(bot_module, t: dict) -> list:
+    p, d, g = t["project"], t["device"], t["group"]
+
+    def via_callback(handler, data):
+        async def run():
+            cb = StubCallback(bot_module, data)
+            await handler(cb)
+            return cb
+        return run
+
+    cases = [
+        ("handler:menu_projects", via_callback(bot_module.show_projects_menu, "menu_projects")),
+        ("handler:proj", via_callback(bot_module.show_devices, f"proj_{p}")),
+        ("handler:group", via_callback(bot_module.open_device_group, f"group_{p}|{g}")),
+        ("handler:dev", via_callback(bot_module.show_stats_handler, f"dev_{p}|{d}")),
+        ("handler:fails", via_callback(bot_module.show_fails_menu, f"fails_{p}|{d}")),
+        ("handler:fails_last_page", via_callback(bot_module.show_fails_menu, f"fails_{p}|{d}|999999")),
+        ("handler:dl_all_txt", via_callback(bot_module.dl_all_handler, f"dl_all_{p}|{d}")),
+        ("handler:dl_all_csv", via_callback(bot_module.dl_all_handler, f"dl_all_{p}|{d}|csv")),
+        ("handler:data_backup", via_callback(bot_module.data_backup_handler, "data_backup")),
+    ]
+    if t["wallet_id"]:
+        cases.append(("handler:err", via_callback(bot_module.show_specific_error, f"err_{p}|{d}|{t['wallet_id']}")))
+    return cases
+
+
+def function_cases(bot_module, t: dict) -> list:
+    """Чистые функции, которые дергаются на каждый клик, - на всем флоте проекта"""
+    workers = list(bot_module.fleet_snapshot.get(t["project"], {}).values())
+    now = time.time()
+
+    async def analyze():
+        for stats in workers: bot_module.analyze_worker_status(stats, now)
+
+    async def time_data():
+        for stats in workers: bot_module.format_time_data(stats.get("last_updated", 0))
+
+    async def state_counts():
+        bot_module.fleet_state_counts()
+
+    async def resync():
+        await bot_module.resync_snapshot()
+
+    async def fleet_inventory():
+        bot_module.format_fleet_inventory(await bot_module.load_fleet_inventory(sorted(bot_module.fleet_snapshot)))
+
+    return [
+        ("fn:analyze_worker_status[project]", analyze),
+        ("fn:format_time_data[project]", time_data),
+        ("fn:fleet_state_counts[fleet]", state_counts),
+        ("fn:fleet_inventory[fleet]", fleet_inventory),
+        ("fn:resync_snapshot[fleet]", resync),
+    ]
+
+
+# === 📊 ОТЧЕТ ===
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def print_table(results: list, baseline: dict = None):
+    head = f"{'case':<36}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'redis':>8}"
+    if baseline: head += f"{'Δ mean':>10}"
+    print(head)
+    print("-" * len(head))
+    for row in results:
+        line = (f"{row['name']:<36}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}"
+                f"{row['p95_ms']:>10.2f}{row['redis_calls']:>8.1f}")
+        base = (baseline or {}).get(row["name"])
+        if base and base.get("mean_ms"):
+            line += f"{(row['mean_ms'] / base['mean_ms'] - 1) * 100:>+9.1f}%"
+        elif baseline:
+            line += f"{'new':>10}"
+        print(line)
+
+
+async def run(args):
+    client = make_clients(args.redis_url)
+    if args.redis_url:
+        if args.flush:
+            client.flushdb()
+        elif client.dbsize():
+            sys.exit("❌ База не пустая: укажите пустой номер БД или --flush")
+
+    print(f"🏭 Флот: {args.projects} проектов × {args.workers} воркеров, "
+          f"{args.fails} упавших кошельков, {args.inv_keys} ключей инвентаря")
+    gen_started = time.perf_counter()
+    targets = generate_fleet(client, args)
+    print(f"   сгенерирован за {time.perf_counter() - gen_started:.1f} с")
+
+    import bot as bot_module
+    try:
+        await bot_module.resync_snapshot()
+        await bot_module.backfill_worker_indexes()  # генератор пишет статусы напрямую, без индексов
+        cases = handler_cases(bot_module, targets) + function_cases(bot_module, targets)
+        if args.only:
+            cases = [c for c in cases if any(part in c[0] for part in args.only.split(","))]
+        results = [await measure(bot_module, name, call, args.repeat, args.warmup) for name, call in cases]
+    finally:
+        await bot_module.r.aclose()
+        await bot_module.redis_pool.disconnect()
+        await bot_module.bot.session.close()
+        if args.redis_url and args.flush:
+            client.flushdb()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {row["name"]: row for row in json.load(f)["results"]}
+    print_table(results, baseline)
+
+    if args.out:
+        report = {
+            "meta": {
+                "git": git_revision(), "python": platform.python_version(),
+                "backend": "redis" if args.redis_url else "fakeredis",
+                "projects": args.projects, "workers": args.workers, "fails": args.fails,
+                "inv_keys": args.inv_keys, "group_size": args.group_size, "repeat": args.repeat,
+                "seed": args.seed,
+            },
+            "results": sorted(results, key=lambda row: row["name"]),
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"💾 {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хендлеров Universal Status Bot на синтетическом флоте")
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1000, help="воркеров в каждом проекте")
+    parser.add_argument("--group-size", type=int, default=4, help="воркеров в одной папке (srvNNN_i)")
+    parser.add_argument("--fails", type=int, default=200, help="упавших кошельков у целевого воркера")
+    parser.add_argument("--log-lines", type=int, default=10, help="строк лога на упавший кошелек")
+    parser.add_argument("--inv-keys", type=int, default=6, help="ключей инвентаря у воркера")
+    parser.add_argument("--accounts", type=int, default=500, help="аккаунтов у воркера (total)")
+    parser.add_argument("--samples", type=int, default=120, help="минутных точек скорости у целевого воркера")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", help="замерять только кейсы, в имени которых есть подстрока (через запятую)")
+    parser.add_argument("--redis-url", help="локальный Redis вместо in-process (БД должна быть пустой)")
+    parser.add_argument("--flush", action="store_true", help="очистить БД --redis-url до и после прогона")
+    parser.add_argument("--out", help="сохранить результат в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона - показать изменение в %%")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,42 @@
 import asyncio
+import csv
+import uuid
 import json
-import redis
-import re
+import redis.asyncio as aioredis
+import hmac
+import html
 import io
+import secrets
+import shlex
+import signal
+import socket
+import tempfile
 import time
+from collections import OrderedDict
 from datetime import datetime
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, BaseMiddleware, types, F
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.types import InlineKeyboardButton, CallbackQuery, BufferedInputFile
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, CallbackQuery, BufferedInputFile, InputFile
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramServerError
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+from redis.exceptions import ResponseError
 import config
+from modules.status_store import PROJECTS_KEY, STATUS_CHANNEL, STATUS_TTL, short_wallet_id, decode_status
+from modules.settings_cache import (SettingsCache, SETTINGS_CHANNEL, SETTINGS_KEY, make_change_message,
+                                   make_reload_message, queue_settings, migrate_legacy_settings)
+from modules.commands import command_channel, make_command, reply_key
+from modules.backup import iter_backup_gzip, iter_backup_file, restore_records, gzip_stream
+from modules.timeseries import read_throughput, ts_keys
+from modules.inventory import inventory_key, drop_worker_inventory, parse_inventory
+from modules.metrics import Registry, Counter, Gauge, Histogram, serve as serve_metrics
+from modules.perf import PerfRing, HandlerIO, current_io, track_redis, track_telegram
+from modules.send_scheduler import SendScheduler, digest_text, TG_TEXT_LIMIT
+from modules.log_blob import iter_log_blob, blob_key
+from modules.alert_stream import ALERT_CHANNEL, ALERT_STREAM, ALERT_GROUP, DASHBOARD_ALIVE_KEY, ALIVE_TTL
+from modules.worker_index import (PAGE_LUA, CLAIM_DEADLINE_LUA, SORT_TO_INDEX, INDEX_MODES, DEADLINES_KEY, index_key,
+                                  page_args, queue_index, queue_remove, queue_silent, deadline_member, status_deadline)
 
 # --- НАСТРОЙКИ ---
 bot = Bot(token=config.TG_BOT_TOKEN)
@@ -20,76 +46,664 @@ dp = Dispatcher()
 DEFAULT_OFFLINE_TIMEOUT = 900  # 15 минут
 SAFETY_BUFFER = 300  # 5 минут
 
-try:
-    r = redis.Redis.from_url(config.REDIS_URL, decode_responses=True, ssl_cert_reqs=None)
-    r.ping()
-    print("✅ Бот успешно подключен к Redis")
-except Exception as e:
-    print(f"❌ Ошибка Redis: {e}")
-    exit(1)
-
-
-# === 🛡 ЛОГИКА ПРОВЕРКИ УВЕДОМЛЕНИЙ ===
-def is_notification_enabled(project_name: str, msg_type: str) -> bool:
-    if msg_type == "worker_finished" or msg_type == "log_delivery":
-        if r.get("settings:mute_all") == "1": return False
-        if r.get(f"settings:mute:{project_name}") == "1": return False
-        return True
-
-    if "log" in msg_type:
-        check_type = "log"
-    elif "error" in msg_type:
-        check_type = "error"
-    elif "success" in msg_type:
-        check_type = "success"
-    else:
-        check_type = "info"
+# === 📈 МЕТРИКИ (/metrics для Prometheus) ===
+# Считаются всегда, HTTP-эндпоинт поднимается только если задан BOT_METRICS_PORT.
+BOT_METRICS_PORT = getattr(config, 'BOT_METRICS_PORT', None)
+BOT_METRICS_HOST = getattr(config, 'BOT_METRICS_HOST', "127.0.0.1")
+
+metrics_registry = Registry()
+REDIS_SECONDS = Histogram("usbot_redis_command_seconds", "Время команды Redis (PIPELINE - весь пайплайн целиком)",
+                          ["command"], registry=metrics_registry)
+TELEGRAM_SECONDS = Histogram("usbot_telegram_request_seconds", "Время запроса к Telegram Bot API",
+                             ["method"], registry=metrics_registry)
+TELEGRAM_ERRORS = Counter("usbot_telegram_errors_total", "Ошибки запросов к Telegram Bot API",
+                          ["method"], registry=metrics_registry)
+ALERT_LAG_SECONDS = Histogram("usbot_alert_lag_seconds", "Задержка алерта: от отправки воркером до обработки ботом",
+                              registry=metrics_registry)
+HANDLER_SECONDS = Histogram("usbot_handler_seconds", "Время хендлера aiogram целиком",
+                            ["handler"], registry=metrics_registry)
+
+# ⏱ Последние замеры каждого хендлера (для /perf)
+perf_ring = PerfRing()
+
+
+class TimedRedis(aioredis.Redis):
+    """
+    Redis-клиент, который пишет время каждой команды и пайплайна в REDIS_SECONDS,
+    а внутри хендлера - еще и число вызовов/байт для /perf.
+    """
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await super().execute_command(*args, **options)
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            REDIS_SECONDS.observe(elapsed, command=str(args[0]).upper())
+            track_redis(1, elapsed, args, result)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class TimedPipeline(aioredis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        commands = [args for args, _ in self.command_stack]
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await super().execute(raise_on_error)
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            REDIS_SECONDS.observe(elapsed, command="PIPELINE")
+            track_redis(len(commands), elapsed, commands, result)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            TELEGRAM_ERRORS.inc(method=name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            TELEGRAM_SECONDS.observe(elapsed, method=name)
+            track_telegram(elapsed)
+
+
+class HandlerPerfMiddleware(BaseMiddleware):
+    """Замеряет каждый хендлер: общее время + сколько из него ушло на Redis и Telegram"""
+
+    async def __call__(self, handler, event, data):
+        handler_obj = data.get("handler")
+        name = getattr(getattr(handler_obj, "callback", None), "__name__", type(event).__name__)
+        io = HandlerIO()
+        token = current_io.set(io)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            duration = time.perf_counter() - started
+            current_io.reset(token)
+            perf_ring.add(name, duration, io)
+            HANDLER_SECONDS.observe(duration, handler=name)
+
+
+bot.session.middleware(TelegramMetricsMiddleware())
+dp.callback_query.middleware(HandlerPerfMiddleware())
+dp.message.middleware(HandlerPerfMiddleware())
+
+# 🔌 ПУЛ СОЕДИНЕНИЙ REDIS (asyncio)
+# Все хендлеры делят один пул: медленный запрос к Upstash не блокирует event loop,
+# а параллельные нажатия кнопок получают свои соединения из пула.
+REDIS_MAX_CONNECTIONS = getattr(config, 'REDIS_MAX_CONNECTIONS', 20)
+REDIS_POOL_TIMEOUT = getattr(config, 'REDIS_POOL_TIMEOUT', 10)  # ожидание свободного соединения
+REDIS_SOCKET_TIMEOUT = getattr(config, 'REDIS_SOCKET_TIMEOUT', 10)
+REDIS_CONNECT_TIMEOUT = getattr(config, 'REDIS_CONNECT_TIMEOUT', 5)
+REDIS_HEALTH_CHECK_INTERVAL = getattr(config, 'REDIS_HEALTH_CHECK_INTERVAL', 30)
+
+_redis_kwargs = {
+    "max_connections": REDIS_MAX_CONNECTIONS,
+    "timeout": REDIS_POOL_TIMEOUT,
+    "socket_timeout": REDIS_SOCKET_TIMEOUT,
+    "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+    "socket_keepalive": True,
+    "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+    "retry_on_timeout": True,
+    "decode_responses": True,
+}
+if config.REDIS_URL.startswith("rediss://"):
+    _redis_kwargs["ssl_cert_reqs"] = None
+
+redis_pool = aioredis.BlockingConnectionPool.from_url(config.REDIS_URL, **_redis_kwargs)
+r = TimedRedis(connection_pool=redis_pool)
+# Бинарный клиент для сжатых логов воркеров (logblob:*) - свой маленький пул без декодирования
+redis_raw_pool = aioredis.BlockingConnectionPool.from_url(
+    config.REDIS_URL, **{**_redis_kwargs, "decode_responses": False, "max_connections": 2})
+r_raw = TimedRedis(connection_pool=redis_raw_pool)
+
+# === 📇 РЕЕСТР ПРОЕКТОВ ===
+# SMEMBERS реестра + HGETALL статусов пайплайном (пачками) вместо KEYS status:* + N отдельных запросов.
+# Проекты, у которых хэш статусов уже истек, вычищаются из реестра отдельным маленьким скриптом.
+FLEET_LOAD_BATCH = 100  # проектов на один пайплайн
+
+# Удаляет проект из реестра, только если его статусы так и не появились (воркер мог записать их только что)
+PRUNE_PROJECT_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 0 then return redis.call('SREM', KEYS[1], ARGV[1]) end
+return 0
+"""
+prune_project_script = r.register_script(PRUNE_PROJECT_LUA)
+
+
+async def load_fleet() -> dict:
+    """Все проекты и их воркеры: {project: {worker: json_str}}"""
+    projects = sorted(await r.smembers(PROJECTS_KEY))
+    fleet, empty = {}, []
+    for i in range(0, len(projects), FLEET_LOAD_BATCH):
+        chunk = projects[i:i + FLEET_LOAD_BATCH]
+        async with r.pipeline(transaction=False) as pipe:
+            for proj in chunk:
+                pipe.hgetall(f"status:{proj}")
+            results = await pipe.execute()
+        for proj, workers in zip(chunk, results):
+            if workers:
+                fleet[proj] = workers
+            else:
+                empty.append(proj)
+    for proj in empty:
+        await prune_project_script(keys=[PROJECTS_KEY, f"status:{proj}"], args=[proj])
+    return fleet
+
+
+async def get_project_names() -> list:
+    return sorted(await r.smembers(PROJECTS_KEY))
+
+
+async def backfill_project_registry():
+    """Разовая миграция: регистрирует проекты старых воркеров (SCAN, без блокировки сервера)"""
+    found = set()
+    async for key in r.scan_iter(match="status:*", count=500):
+        parts = key.split(":")
+        if len(parts) > 1: found.add(parts[1])
+    if found:
+        await r.sadd(PROJECTS_KEY, *found)
+    return len(found)
+
+
+# === 🧠 СНИМОК ФЛОТА В ПАМЯТИ ===
+# {project: {worker: stats_dict}}. Меню рисуются отсюда, без похода в Redis.
+# Патчится по анонсам воркеров (канал status_updates), раз в SNAPSHOT_RESYNC_INTERVAL
+# сверяется с Redis полностью (страховка от потерянных сообщений и удаленных воркеров).
+SNAPSHOT_RESYNC_INTERVAL = getattr(config, 'SNAPSHOT_RESYNC_INTERVAL', 60)
+SNAPSHOT_DRAIN_BATCH = 500  # дельт за одно пробуждение, потом снова проверяем, не пора ли сверка
+
+fleet_snapshot = {}
+snapshot_stats = {"synced_at": 0.0, "deltas": 0, "resyncs": 0}
+
+
+async def resync_snapshot():
+    """Полная перезагрузка снимка. Дельты, пришедшие во время загрузки, не теряются."""
+    started = time.time()
+    fleet = await load_fleet()
+
+    fresh = {}
+    for proj, workers in fleet.items():
+        decoded = {}
+        for name, json_str in workers.items():
+            stats = decode_status(json_str)
+            if stats is not None: decoded[name] = stats
+        fresh[proj] = decoded
+
+    for proj, workers in fleet_snapshot.items():
+        for name, stats in workers.items():
+            if float(stats.get("last_updated", 0)) > started:
+                fresh.setdefault(proj, {})[name] = stats
+
+    fleet_snapshot.clear()
+    fleet_snapshot.update(fresh)
+    snapshot_stats["synced_at"] = time.time()
+    snapshot_stats["resyncs"] += 1
+
+
+async def ensure_snapshot():
+    if not snapshot_stats["synced_at"]:
+        await resync_snapshot()
+
+
+def apply_status_delta(delta: dict):
+    proj = delta.get("project")
+    name = delta.get("worker")
+    stats = decode_status(delta.get("status"))
+    if not proj or not name or stats is None: return
+    fleet_snapshot.setdefault(proj, {})[name] = stats
+    snapshot_stats["deltas"] += 1
+
+
+def forget_worker(proj: str, name: str):
+    workers = fleet_snapshot.get(proj)
+    if workers is None: return
+    workers.pop(name, None)
+    if not workers: fleet_snapshot.pop(proj, None)
+
+
+async def snapshot_listener():
+    pubsub = r.pubsub()
+    await pubsub.subscribe(STATUS_CHANNEL)
+    print("🧠 Snapshot Listener запущен...")
+
+    while True:
+        try:
+            if time.time() - snapshot_stats["synced_at"] >= SNAPSHOT_RESYNC_INTERVAL:
+                await resync_snapshot()
 
-    proj_setting = r.get(f"settings:notify:{project_name}:{check_type}")
-    if proj_setting is not None: return proj_setting == "1"
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SNAPSHOT_RESYNC_INTERVAL)
+            drained = 0
+            while message:
+                try:
+                    apply_status_delta(json.loads(message['data']))
+                except (TypeError, ValueError):
+                    pass
+                drained += 1
+                if drained >= SNAPSHOT_DRAIN_BATCH: break  # при постоянном потоке дельт сверка тоже должна идти
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0)
+        except asyncio.CancelledError:
+            await pubsub.aclose()
+            raise
+        except Exception as e:
+            print(f"Snapshot Error: {e}")
+            await asyncio.sleep(5)
+            # Пока не было связи, могли пропустить дельты
+            snapshot_stats["synced_at"] = 0.0
+
+# === 🐕 СТОРОЖ ОФЛАЙНА ===
+# Воркеры сами пишут свой дедлайн (last_updated + heartbeat) в watchdog:deadlines при каждой записи статуса.
+# Тик = один ZRANGEBYSCORE по просроченным (O(log n + просроченные)), без обхода флота.
+WATCHDOG_INTERVAL = getattr(config, 'WATCHDOG_INTERVAL', 30)  # сек между проверками
+WATCHDOG_BATCH = 100  # максимум алертов за один тик
+
+# (project, worker) -> last_updated на момент алерта; по нему ловим возвращение в строй
+silent_workers = {}
+
+claim_deadline_script = r.register_script(CLAIM_DEADLINE_LUA)
+
+
+async def watchdog_tick(now: float) -> int:
+    expired = await r.zrangebyscore(DEADLINES_KEY, "-inf", now - SAFETY_BUFFER,
+                                    start=0, num=WATCHDOG_BATCH, withscores=True)
+    sent = 0
+    for member, deadline in expired:
+        proj, _, name = member.partition("|")
+        stats = fleet_snapshot.get(proj, {}).get(name)
+        # Снимок еще не знает воркера, а статус в базе есть - не захватываем, разберемся на следующем тике
+        if stats is None and await r.hexists(f"status:{proj}", name): continue
+        # Захват: алерт шлет только тот, кто реально удалил (второй инстанс / повторный тик получат 0).
+        # Удаляем, только если дедлайн не изменился - иначе воркер уже продлил его свежим статусом
+        if not await claim_deadline_script(keys=[DEADLINES_KEY], args=[member, repr(deadline)]): continue
+        if stats is None: continue  # воркер удален из базы - просто чистим дедлайн
+        last_ts = float(stats.get("last_updated", 0))
+        silent_workers[(proj, name)] = last_ts
+        await queue_silent(r, proj, name, stats)
+        minutes = int((now - last_ts) / 60)
+        await deliver_alert({
+            "type": "worker_silent", "project": proj, "worker": name,
+            "text": f"Сигнала нет уже {minutes} мин. (статус: {stats.get('status', 'Unknown')})\n"
+                    f"Скорее всего процесс упал или сервер выключен."
+        })
+        sent += 1
+
+    for (proj, name), last_ts in list(silent_workers.items()):
+        stats = fleet_snapshot.get(proj, {}).get(name)
+        if stats is None:
+            silent_workers.pop((proj, name), None)
+        elif float(stats.get("last_updated", 0)) > last_ts:
+            silent_workers.pop((proj, name), None)
+            await deliver_alert({"type": "worker_recovered", "project": proj, "worker": name,
+                                 "text": f"Снова на связи: {stats.get('status', 'Unknown')}"})
+    return sent
+
+
+async def watchdog_loop():
+    print("🐕 Watchdog запущен...")
+    while True:
+        try:
+            await ensure_snapshot()
+            await watchdog_tick(time.time())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Watchdog Error: {e}")
+        await asyncio.sleep(WATCHDOG_INTERVAL)
 
-    global_setting = r.get(f"settings:notify:GLOBAL:{check_type}")
-    if global_setting is not None: return global_setting == "1"
 
-    return True
+async def backfill_watchdog() -> int:
+    """Дедлайны для работающих воркеров, записанных до появления сторожа. Уже просроченных не трогаем."""
+    now = time.time()
+    added = 0
+    async with r.pipeline(transaction=False) as pipe:
+        for proj, workers in fleet_snapshot.items():
+            for name, stats in workers.items():
+                deadline = status_deadline(stats)
+                if deadline is None or deadline + SAFETY_BUFFER <= now: continue
+                pipe.zadd(DEADLINES_KEY, {deadline_member(proj, name): deadline}, nx=True)
+                added += 1
+        if added: await pipe.execute()
+    return added
+
+
+# === ⚙️ НАСТРОЙКИ (КЭШ) ===
+# Все settings:* живут в памяти. Проверка уведомлений больше не ходит в Redis.
+# Любое изменение из бота рассылается в settings_changed - воркеры обновляют свои копии.
+settings = SettingsCache()
+
+
+async def save_settings(changes: dict):
+    """Пишет настройки (value=None - удалить) и рассылает изменение всем кэшам"""
+    async with r.pipeline(transaction=False) as pipe:
+        queue_settings(pipe, changes)
+        pipe.publish(SETTINGS_CHANNEL, make_change_message(changes))
+        await pipe.execute()
+    settings.apply_changes(changes)
+
+
+async def settings_listener():
+    pubsub = r.pubsub()
+    await pubsub.subscribe(SETTINGS_CHANNEL)
+
+    while True:
+        try:
+            if settings.is_stale():
+                await settings.aload(r)
+
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=settings.max_age)
+            if message and settings.apply_message(message['data']):
+                await settings.aload(r)
+        except asyncio.CancelledError:
+            await pubsub.aclose()
+            raise
+        except Exception as e:
+            print(f"Settings Listener Error: {e}")
+            await asyncio.sleep(5)
+            settings.loaded_at = 0.0
 
 
 # === ФОНОВАЯ ЗАДАЧА: СЛУШАТЕЛЬ ===
+# Основной транспорт - поток alerts:stream с группой (см. modules/alert_stream.py),
+# старый канал telegram_alerts слушаем для воркеров прошлых версий.
+ALERT_BATCH_SIZE = 100  # Сколько сообщений максимум забираем за одно пробуждение
+ALERT_WAIT_TIMEOUT = 30  # Сек. ожидания сообщения (просыпаемся сразу, как оно пришло)
+ALERT_STREAM_BLOCK_MS = int(min(5, REDIS_SOCKET_TIMEOUT / 2) * 1000)  # XREADGROUP BLOCK короче таймаута сокета
+ALERT_CONSUMER = getattr(config, 'ALERT_CONSUMER', None) or socket.gethostname()  # имя реплики в группе
+ALERT_CLAIM_IDLE = getattr(config, 'ALERT_CLAIM_IDLE', 300)  # сек без XACK - запись забирает живая реплика
+ALERT_CLAIM_INTERVAL = 60  # как часто искать зависшие записи (сек)
+ALERT_TOUCH_INTERVAL = ALERT_CLAIM_IDLE / 3  # как часто сбрасывать idle у своих записей в очереди отправки (сек)
+STREAM_BACKLOG_MAX = 1000  # сколько своих неподтвержденных записей разбираем при старте
+STREAM_BACKPRESSURE_PAUSE = 1  # сек: очередь отправки полна - поток не читаем, записи ждут в Redis
+
+# 📤 Лимиты исходящих сообщений (очередь отправки, см. modules/send_scheduler.py)
+SEND_GLOBAL_RATE = getattr(config, 'SEND_GLOBAL_RATE', 25)  # сообщений/сек на весь бот
+SEND_CHAT_RATE = getattr(config, 'SEND_CHAT_RATE', 1)  # сообщений/сек в один чат
+SEND_CHAT_BURST = getattr(config, 'SEND_CHAT_BURST', 3)  # сколько можно отправить подряд без паузы
+DIGEST_WINDOW = getattr(config, 'DIGEST_WINDOW', 30)  # окно склейки однотипных алертов (сек)
+SEND_QUEUE_MAX = getattr(config, 'SEND_QUEUE_MAX', 500)
+SEND_DRAIN_TIMEOUT = 5  # сколько при остановке ждем отправки хвоста очереди (сек)
+
+# 📈 Счетчики слушателя (читаются в "О боте" и метриках)
+alert_stats = {
+    "received": 0,  # всего получено из канала
+    "delivered": 0,  # отправлено в Telegram (после фильтра настроек)
+    "failed": 0,  # ошибки декодирования/отправки
+    "batches": 0,  # сколько раз просыпались
+    "max_batch": 0,  # самая большая пачка
+    "last_lag": 0.0,  # задержка последнего алерта (сек): от отправки воркером до обработки
+    "max_lag": 0.0,
+}
+
+
+Counter("usbot_alerts_total", "Алерты из канала воркеров (event: received / delivered / failed)", ["event"],
+        registry=metrics_registry).set_function(
+    lambda: {(event,): alert_stats[event] for event in ("received", "delivered", "failed")})
+Gauge("usbot_alert_queue_depth", "Сообщения в очереди отправки в Telegram",
+      registry=metrics_registry).set_function(lambda: outbox.pending())
+Counter("usbot_send_total", "Очередь отправки (event: queued / sent / merged / retried / failed / dropped)",
+        ["event"], registry=metrics_registry).set_function(
+    lambda: {(event,): value for event, value in outbox.stats.items()})
+
+
+def decode_alert(message: dict, now: float):
+    """{'data': JSON} (сообщение канала или поля записи потока) -> алерт; None - битое сообщение"""
+    try:
+        data = json.loads(message['data'])
+    except (TypeError, ValueError, KeyError):
+        alert_stats["failed"] += 1
+        return None
+    sent_ts = data.get("ts")
+    if sent_ts:
+        lag = max(0.0, now - float(sent_ts))
+        ALERT_LAG_SECONDS.observe(lag)
+        alert_stats["last_lag"] = lag
+        if lag > alert_stats["max_lag"]: alert_stats["max_lag"] = lag
+    return data
+
+
+def count_alert_batch(size: int):
+    alert_stats["batches"] += 1
+    alert_stats["received"] += size
+    if size > alert_stats["max_batch"]: alert_stats["max_batch"] = size
+
+
+def decode_alert_batch(raw_messages: list) -> list:
+    """Декодирует пачку сообщений канала и обновляет счетчики задержки"""
+    now = time.time()
+    alerts = []
+    for message in raw_messages:
+        data = decode_alert(message, now)
+        if data is not None: alerts.append(data)
+    return alerts
+
+
+ALERT_TITLES = {
+    "error": "🔴 <b>ALARM",
+    "success": "✅ <b>FINISHED",
+    "worker_finished": "🏁 <b>JOB COMPLETED",
+    "worker_silent": "🔇 <b>WORKER SILENT",
+    "worker_recovered": "🟢 <b>BACK ONLINE",
+}
+
+
+async def send_alert(chat_id, data: dict, texts: list, count: int):
+    """Отправка из очереди: одиночный алерт или дайджест из count штук"""
+    msg_type = data.get("type")
+    header = f"🤖 <b>{data.get('project')}</b> | {data.get('worker')}"
+
+    if msg_type == "log_delivery":
+        filename = f"log_{data.get('worker')}_{datetime.now().strftime('%H-%M')}.txt"
+        caption = f"📄 <b>Log Received</b>\n{header}"
+        blob_id = data.get("blob")
+        if blob_id:
+            # Лог лежит сжатым в Redis - распаковываем прямо в загрузку документа
+            document = StreamInputFile(lambda: iter_log_blob(r_raw, blob_id, data.get("chunks", 0)), filename)
+            caption += f"\n{data.get('text')}"
+        else:
+            document = BufferedInputFile(data.get("text", "").encode('utf-8'), filename=filename)  # старый воркер
+        await bot.send_document(chat_id, document=document, caption=caption, parse_mode="HTML")
+        if blob_id: await r_raw.delete(blob_key(blob_id))
+    else:
+        title = ALERT_TITLES[msg_type] + (f" ×{count}" if count > 1 else "")
+        prefix = f"{title}:</b>\n{header}\n\n"
+        body = digest_text(texts, count, TG_TEXT_LIMIT - len(prefix))
+        await bot.send_message(chat_id, prefix + body, parse_mode="HTML")
+    alert_stats["delivered"] += count
+
+
+# 📬 Записи потока: в очереди отправки (чтобы не взять свою же запись повторно через XAUTOCLAIM)
+# и уже отправленные/отброшенные - их подтверждаем одним XACK перед следующим чтением
+alerts_inflight = set()
+alerts_to_ack = []
+
+
+def ack_alerts(refs: list):
+    alerts_to_ack.extend(refs)
+    alerts_inflight.difference_update(refs)
+
+
+def release_alerts(refs: list):
+    """Вытеснены из переполненной очереди: без XACK - запись остается в pending и будет прочитана снова"""
+    alerts_inflight.difference_update(refs)
+
+
+async def flush_acks():
+    if not alerts_to_ack: return
+    ids = alerts_to_ack[:]
+    alerts_to_ack.clear()
+    try:
+        await r.xack(ALERT_STREAM, ALERT_GROUP, *ids)
+    except Exception:
+        alerts_to_ack.extend(ids)
+        raise
+
+
+outbox = SendScheduler(send_alert, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE,
+                       chat_burst=SEND_CHAT_BURST, digest_window=DIGEST_WINDOW, max_pending=SEND_QUEUE_MAX,
+                       retry_on=(TelegramNetworkError, TelegramServerError), on_done=ack_alerts,
+                       on_drop=release_alerts)
+
+
+async def deliver_alert(data: dict, ref=None):
+    """
+    Фильтр настроек + постановка в очередь отправки (сама отправка - в outbox.run).
+    ref - id записи потока: подтверждается, когда алерт отправлен или не нужен.
+    """
+    msg_type = data.get("type", "info")
+    if (msg_type not in ALERT_TITLES and msg_type != "log_delivery") \
+            or not settings.is_notification_enabled(data.get("project"), msg_type):
+        if ref is not None: ack_alerts([ref])
+        return
+    if not outbox.submit(config.TG_USER_ID, data, coalesce=msg_type != "log_delivery", ref=ref):
+        alert_stats["failed"] += 1
+
+
+async def consume_stream_entries(entries: list):
+    """Записи потока -> очередь отправки. Битые и уже обрезанные MAXLEN записи сразу подтверждаем."""
+    now = time.time()
+    count_alert_batch(len(entries))
+    for entry_id, fields in entries:
+        if entry_id in alerts_inflight: continue
+        data = decode_alert(fields, now) if fields else None
+        if data is None:
+            ack_alerts([entry_id])
+            continue
+        alerts_inflight.add(entry_id)
+        try:
+            await deliver_alert(data, ref=entry_id)
+        except Exception as e:
+            # Без XACK: запись останется в pending и будет подобрана через XAUTOCLAIM
+            alerts_inflight.discard(entry_id)
+            alert_stats["failed"] += 1
+            print(f"Listener Error: {e}")
+
+
+async def ensure_alert_group():
+    try:
+        await r.xgroup_create(ALERT_STREAM, ALERT_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e): raise
+
+
+async def touch_inflight_alerts():
+    """
+    Записи, которые ждут в нашей очереди отправки (при SEND_CHAT_RATE=1 это может быть дольше ALERT_CLAIM_IDLE),
+    не должна забрать и отправить повторно другая реплика: XCLAIM JUSTID на себя обнуляет их idle.
+    """
+    ids = list(alerts_inflight)
+    for i in range(0, len(ids), 500):
+        await r.xclaim(ALERT_STREAM, ALERT_GROUP, ALERT_CONSUMER, 0, ids[i:i + 500], justid=True)
+
+
+async def reclaim_alerts():
+    """Забирает записи, которые реплика (или прошлый запуск) прочитала, но не подтвердила за ALERT_CLAIM_IDLE"""
+    start = "0-0"
+    while outbox.room():
+        result = await r.xautoclaim(ALERT_STREAM, ALERT_GROUP, ALERT_CONSUMER, int(ALERT_CLAIM_IDLE * 1000),
+                                    start_id=start, count=min(ALERT_BATCH_SIZE, outbox.room()))
+        start, entries = result[0], result[1]
+        if entries: await consume_stream_entries(entries)
+        if start == "0-0": break
+
+
+async def alert_stream_listener():
+    """
+    Основной слушатель алертов: XREADGROUP из потока (BLOCK - просыпаемся сразу, как запись пришла).
+    Заодно продлевает dashboard:alive (по нему воркеры понимают, что писать в поток есть смысл)
+    и раз в ALERT_CLAIM_INTERVAL подбирает зависшие записи.
+    Читаем не больше, чем влезает в очередь отправки: поток - надежный буфер, пусть алерты ждут в нем.
+    """
+    ready = False  # группа создана, alive выставлен, свой backlog разобран
+    last_alive = last_claim = last_touch = time.monotonic()
+    while True:
+        try:
+            now = time.monotonic()
+            if not ready:
+                # Внутри retry: если Redis недоступен при старте (или поток удалили), пробуем снова через паузу
+                await ensure_alert_group()
+                await r.set(DASHBOARD_ALIVE_KEY, ALERT_CONSUMER, ex=ALIVE_TTL)
+                last_alive = now
+                # Свои неподтвержденные записи с прошлого запуска (то же имя реплики) - сразу, не дожидаясь XAUTOCLAIM
+                response = await r.xreadgroup(ALERT_GROUP, ALERT_CONSUMER, {ALERT_STREAM: "0"},
+                                              count=max(1, min(STREAM_BACKLOG_MAX, outbox.room())))
+                for _stream, entries in response or []:
+                    if entries: await consume_stream_entries(entries)
+                ready = True
+                print(f"📡 Alert Stream запущен (реплика {ALERT_CONSUMER})...")
+            if now - last_alive >= ALIVE_TTL / 3:
+                await r.set(DASHBOARD_ALIVE_KEY, ALERT_CONSUMER, ex=ALIVE_TTL)
+                last_alive = now
+            if now - last_touch >= ALERT_TOUCH_INTERVAL:
+                await touch_inflight_alerts()
+                last_touch = now
+            if now - last_claim >= ALERT_CLAIM_INTERVAL:
+                await reclaim_alerts()
+                last_claim = now
+            await flush_acks()
+
+            room = outbox.room()
+            if not room:
+                await asyncio.sleep(STREAM_BACKPRESSURE_PAUSE)
+                continue
+            response = await r.xreadgroup(ALERT_GROUP, ALERT_CONSUMER, {ALERT_STREAM: ">"},
+                                          count=min(ALERT_BATCH_SIZE, room), block=ALERT_STREAM_BLOCK_MS)
+            for _stream, entries in response or []:
+                await consume_stream_entries(entries)
+        except asyncio.CancelledError:
+            raise
+        except ResponseError as e:
+            if "NOGROUP" in str(e):
+                ready = False  # поток удалили (сброс базы) - на следующем круге создаем заново
+            else:
+                print(f"Stream Listener Error: {e}")
+                await asyncio.sleep(5)
+        except Exception as e:
+            print(f"Stream Listener Error: {e}")
+            await asyncio.sleep(5)
+
+
 async def alert_listener():
+    """
+    Слушатель старого канала telegram_alerts (воркеры прошлых версий): ждем сообщение
+    и просыпаемся сразу, забираем всё, что накопилось, и обрабатываем пачкой.
+    """
     pubsub = r.pubsub()
-    pubsub.subscribe("telegram_alerts")
+    await pubsub.subscribe(ALERT_CHANNEL)
     print("📡 Alert Listener запущен...")
 
     while True:
         try:
-            message = pubsub.get_message(ignore_subscribe_messages=True)
-            if message:
-                data = json.loads(message['data'])
-                msg_type = data.get("type", "info")
-                worker = data.get("worker")
-                project = data.get("project")
-                text = data.get("text")
-
-                if is_notification_enabled(project, msg_type):
-                    header = f"🤖 <b>{project}</b> | {worker}"
-
-                    if msg_type == "error":
-                        await bot.send_message(config.TG_USER_ID, f"🔴 <b>ALARM:</b>\n{header}\n\n{text}",
-                                               parse_mode="HTML")
-                    elif msg_type == "success":
-                        await bot.send_message(config.TG_USER_ID, f"✅ <b>FINISHED:</b>\n{header}\n\n{text}",
-                                               parse_mode="HTML")
-                    elif msg_type == "worker_finished":
-                        await bot.send_message(config.TG_USER_ID, f"🏁 <b>JOB COMPLETED:</b>\n{header}\n\n{text}",
-                                               parse_mode="HTML")
-                    elif msg_type == "log_delivery":
-                        file_obj = io.BytesIO(text.encode('utf-8'))
-                        file_obj.name = f"log_{worker}_{datetime.now().strftime('%H-%M')}.txt"
-                        input_file = BufferedInputFile(file_obj.getvalue(), filename=file_obj.name)
-                        await bot.send_document(config.TG_USER_ID, document=input_file,
-                                                caption=f"📄 <b>Log Received</b>\n{header}", parse_mode="HTML")
-
-            await asyncio.sleep(0.5)
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=ALERT_WAIT_TIMEOUT)
+            if not message:
+                continue
+
+            # Дочитываем всё, что уже лежит в буфере соединения
+            raw_batch = [message]
+            while len(raw_batch) < ALERT_BATCH_SIZE:
+                extra = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0)
+                if not extra: break
+                raw_batch.append(extra)
+
+            count_alert_batch(len(raw_batch))
+            for data in decode_alert_batch(raw_batch):
+                try:
+                    await deliver_alert(data)
+                except Exception as e:
+                    alert_stats["failed"] += 1
+                    print(f"Listener Error: {e}")
+        except asyncio.CancelledError:
+            await pubsub.aclose()
+            raise
         except Exception as e:
             print(f"Listener Error: {e}")
             await asyncio.sleep(5)
@@ -106,22 +720,6 @@ def get_status_emoji(status_text: str) -> str:
     return "⚪️"
 
 
-def parse_progress(stats: dict):
-    prog_str = str(stats.get('progress', ''))
-    match = re.search(r"(\d+)/(\d+).*?✅\s*(\d+).*?❌\s*(\d+)", prog_str)
-    if match:
-        return {
-            "type": "detailed", "total": int(match.group(2)),
-            "success": int(match.group(3)), "fails": int(match.group(4)),
-            "done": int(match.group(3)) + int(match.group(4))
-        }
-    pos_current = stats.get('pos_current')
-    pos_total = stats.get('pos_total')
-    if pos_current and pos_total:
-        return {"type": "simple", "current": int(pos_current), "total": int(pos_total)}
-    return None
-
-
 def make_progress_bar(current, total, length=10):
     if total == 0: return f"[{'□' * length}]"
     percent = current / total
@@ -149,6 +747,18 @@ def format_time_data(raw_time):
         return str(raw_time), ""
 
 
+class StreamInputFile(InputFile):
+    """Документ, который уходит в Telegram кусками из async-генератора (без сборки файла в памяти)"""
+
+    def __init__(self, stream_factory, filename: str):
+        super().__init__(filename=filename)
+        self.stream_factory = stream_factory
+
+    async def read(self, bot):
+        async for chunk in self.stream_factory():
+            yield chunk
+
+
 async def safe_edit_text(callback: CallbackQuery, text: str, reply_markup=None):
     try:
         await callback.message.edit_text(text, reply_markup=reply_markup, parse_mode="HTML")
@@ -163,7 +773,7 @@ def analyze_worker_status(stats: dict, now: float):
     st = str(stats.get("status", "Unknown")).lower()
     ts = float(stats.get("last_updated", 0))
 
-    w_heartbeat = int(stats.get("heartbeat_threshold", DEFAULT_OFFLINE_TIMEOUT))
+    w_heartbeat = int(stats.get("heartbeat", DEFAULT_OFFLINE_TIMEOUT))
     dynamic_limit = w_heartbeat + SAFETY_BUFFER
 
     time_diff = now - ts
@@ -179,6 +789,25 @@ def analyze_worker_status(stats: dict, now: float):
     return st, emoji, is_error, is_active
 
 
+def fleet_state_counts() -> dict:
+    """{(project, state): кол-во воркеров} по снимку; state: active / sleep / error / offline"""
+    now = time.time()
+    counts = {}
+    for proj, workers in list(fleet_snapshot.items()):
+        for stats in list(workers.values()):
+            st, _, is_err, is_act = analyze_worker_status(stats, now)
+            if st.startswith("offline"):
+                state = "offline"
+            else:
+                state = "error" if is_err else "active" if is_act else "sleep"
+            counts[(proj, state)] = counts.get((proj, state), 0) + 1
+    return counts
+
+
+Gauge("usbot_workers", "Воркеры по состоянию (из снимка флота)", ["project", "state"],
+      registry=metrics_registry).set_function(fleet_state_counts)
+
+
 # ==========================================
 # 👇 ГЛАВНОЕ МЕНЮ
 # ==========================================
@@ -210,14 +839,55 @@ async def back_to_start_handler(callback: CallbackQuery):
 # ==========================================
 # 👇 МЕНЮ ПРОЕКТОВ
 # ==========================================
+async def load_fleet_inventory(projects: list) -> dict:
+    """Итоги лута по проектам: один пайплайн HGETALL inv:{p}, без разбора статусов воркеров"""
+    if not projects: return {}
+    async with r.pipeline(transaction=False) as pipe:
+        for proj in projects:
+            pipe.hgetall(inventory_key(proj))
+        raw = await pipe.execute()
+    return {proj: parse_inventory(inv) for proj, inv in zip(projects, raw) if inv}
+
+
+def format_fleet_inventory(per_project: dict, listed=None) -> str:
+    """Итог по всему флоту + строки по проектам (только listed, если передан - текущая страница)"""
+    if not per_project: return ""
+    fleet = {}
+    lines = []
+    for proj in sorted(per_project):
+        inv = per_project[proj]
+        for k, v in inv.items():
+            fleet[k] = fleet.get(k, 0) + v
+        if listed is None or proj in listed:
+            lines.append(f"• {proj}: " + " | ".join(f"{k} <b>{v}</b>" for k, v in sorted(inv.items())))
+
+    text = "\n🎒 <b>Лут флота:</b> " + " | ".join(f"{k} <b>{round(v, 4)}</b>" for k, v in sorted(fleet.items()))
+    if len(per_project) > 1 and lines:
+        text += "\n" + "\n".join(lines)
+    return text + "\n"
+
+
+PROJECTS_PAGE_SIZE = 20
+
+
 @dp.callback_query(F.data == "menu_projects")
 async def show_projects_menu(callback: CallbackQuery):
+    await render_projects_page(callback, 0)
+
+
+@dp.callback_query(F.data.startswith("projpage_"))
+async def show_projects_page(callback: CallbackQuery):
+    await render_projects_page(callback, int(callback.data.split("_")[1]))
+
+
+async def render_projects_page(callback: CallbackQuery, page: int):
     builder = InlineKeyboardBuilder()
-    keys = r.keys("status:*")
+    await ensure_snapshot()
+    sort_mode = settings.get("settings:sort_proj")
 
     stats_list = []
 
-    if not keys:
+    if not fleet_snapshot:
         text = "📂 <b>Активные проекты</b>\n\n(Список пуст)"
         builder.row(InlineKeyboardButton(text="♻️ Обновить", callback_data="menu_projects"))
         builder.row(InlineKeyboardButton(text="🔙 В главное меню", callback_data="menu_start"))
@@ -226,11 +896,7 @@ async def show_projects_menu(callback: CallbackQuery):
 
     now = time.time()
 
-    for key in keys:
-        parts = key.split(":")
-        if len(parts) < 2: continue
-        proj_name = parts[1]
-
+    for proj_name, workers_data in fleet_snapshot.items():
         active = 0
         errors = 0
         sleep = 0
@@ -238,13 +904,11 @@ async def show_projects_menu(callback: CallbackQuery):
         max_ts = 0.0
 
         try:
-            workers_data = r.hgetall(key)
-            for _, w_json in workers_data.items():
-                w_stats = json.loads(w_json)
+            for _, w_stats in workers_data.items():
                 ts = float(w_stats.get("last_updated", 0))
                 if ts > max_ts: max_ts = ts
 
-                acc_count = int(w_stats.get("pos_total", 0))
+                acc_count = w_stats.get("total", 0)
                 total_scale_accs += acc_count
 
                 st, _, is_err, is_act = analyze_worker_status(w_stats, now)
@@ -265,7 +929,7 @@ async def show_projects_menu(callback: CallbackQuery):
             "scale": total_scale_accs
         })
 
-    sort_mode = r.get("settings:sort_proj") or "scale"
+    sort_mode = sort_mode or "scale"
 
     if sort_mode == "scale":
         stats_list.sort(key=lambda x: x["scale"], reverse=True)
@@ -274,12 +938,25 @@ async def show_projects_menu(callback: CallbackQuery):
     else:
         stats_list.sort(key=lambda x: x["name"])
 
-    text = f"📂 <b>Проекты</b> (Sort: {sort_mode.title()})\nВыберите проект:"
+    pages = max(1, (len(stats_list) + PROJECTS_PAGE_SIZE - 1) // PROJECTS_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    page_items = stats_list[page * PROJECTS_PAGE_SIZE:(page + 1) * PROJECTS_PAGE_SIZE]
 
-    for item in stats_list:
+    text = f"📂 <b>Проекты</b> (Sort: {sort_mode.title()})\n"
+    text += format_fleet_inventory(await load_fleet_inventory([item["name"] for item in stats_list]),
+                                   listed={item["name"] for item in page_items})
+    text += "\nВыберите проект:"
+    if pages > 1: text += f"\n📄 Страница {page + 1}/{pages}"
+
+    for item in page_items:
         btn_text = f"🔹 {item['name']} (🟢{item['active']} | 💤{item['sleep']} | 🔴{item['errors']})"
         builder.row(InlineKeyboardButton(text=btn_text, callback_data=f"proj_{item['name']}"))
 
+    nav = []
+    if page > 0: nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"projpage_{page - 1}"))
+    if page + 1 < pages: nav.append(InlineKeyboardButton(text="➡️", callback_data=f"projpage_{page + 1}"))
+    if nav: builder.row(*nav)
+
     builder.row(InlineKeyboardButton(text="♻️ Обновить", callback_data="menu_projects"))
     builder.row(InlineKeyboardButton(text="🔙 В главное меню", callback_data="menu_start"))
 
@@ -289,105 +966,170 @@ async def show_projects_menu(callback: CallbackQuery):
 # ==========================================
 # 👇 МЕНЮ ВОРКЕРОВ (С ДЕТАЛЬНОЙ ГРУППИРОВКОЙ)
 # ==========================================
-@dp.callback_query(F.data.startswith("proj_"))
-async def show_devices(callback: CallbackQuery):
-    project_name = callback.data.split("_")[1]
-    devices_data = r.hgetall(f"status:{project_name}")
-    builder = InlineKeyboardBuilder()
-    now = time.time()
+WORKERS_PAGE_SIZE = 20
 
-    if not devices_data:
-        await safe_edit_text(callback, f"📂 <b>{project_name}</b>\nСписок пуст.", builder.as_markup())
-        return
+# Курсоры страниц живут в памяти бота: в callback_data (лимит 64 байта) не влезет
+# "проект + имя воркера-якоря", поэтому в кнопку кладем только короткий токен.
+PAGE_CURSORS_LIMIT = 2000
+page_cursors = OrderedDict()
 
-    # 1. Сначала собираем все данные
-    all_workers = []
-    for dev_name, json_str in devices_data.items():
-        try:
-            stats = json.loads(json_str)
-            st, emoji, is_err, is_act = analyze_worker_status(stats, now)
-            all_workers.append({
-                "name": dev_name, "raw_stats": stats,
-                "st": st, "emoji": emoji, "is_err": is_err, "is_act": is_act
-            })
-        except:
-            continue
+worker_page_script = r.register_script(PAGE_LUA)
 
-    # 2. Группируем воркеров
-    groups = {}
 
-    # Сортируем по имени
-    all_workers.sort(key=lambda x: x["name"])
+def make_page_cursor(project_name: str, mode: str, anchor: str, score: float, direction: str) -> str:
+    """callback_data кнопки: wpage_{токен}|{проект} (проект - чтобы после вытеснения курсора открыть его начало)"""
+    token = uuid.uuid4().hex[:10]
+    page_cursors[token] = (project_name, mode, anchor, score, direction)
+    while len(page_cursors) > PAGE_CURSORS_LIMIT:
+        page_cursors.popitem(last=False)
+    data = f"wpage_{token}|{project_name}"
+    return data if len(data.encode()) <= 64 else f"wpage_{token}"
 
-    for w in all_workers:
-        # Пытаемся найти родителя (всё что до последнего подчеркивания)
-        parts = w["name"].split("_")
-        if len(parts) == 1:
-            base_name = w["name"]
-        else:
-            base_name = "_".join(parts[:-1])
 
-        if base_name not in groups:
-            groups[base_name] = []
-        groups[base_name].append(w)
+def worker_base_name(name: str) -> str:
+    """Родитель для группировки - всё до последнего подчеркивания"""
+    parts = name.split("_")
+    return name if len(parts) == 1 else "_".join(parts[:-1])
 
-    final_list = []
 
-    for base, members in groups.items():
-        # Если в группе только 1 элемент, показываем как есть (без папки)
-        # Исключение: если имя элемента отличается от базы (редкий случай), лучше всё равно показать.
-        # Но для красоты: Single показываем как Single.
-        if len(members) == 1:
-            final_list.append({"type": "single", "data": members[0]})
-        else:
-            # Считаем статистику внутри группы
-            g_active = sum(1 for m in members if m['is_act'])
-            g_errors = sum(1 for m in members if m['is_err'])
-            g_total = len(members)
-            g_sleep = g_total - g_active - g_errors
-
-            final_list.append({
-                "type": "group",
-                "name": base,
-                "stats": (g_active, g_sleep, g_errors),  # Сохраняем цифры
-                "members": members
-            })
-
-    # Сортировка: Сначала папки, потом одиночные (или наоборот, как удобнее)
-    # Сейчас сортируем просто по алфавиту имен
-    final_list.sort(key=lambda x: x["name"] if x["type"] == "group" else x["data"]["name"])
-
-    # 3. Рендерим кнопки
-    for item in final_list:
-        if item["type"] == "single":
-            w = item["data"]
-            btn_txt = f"{w['emoji']} {w['name']} | {w['st'].title()}"
-            builder.row(InlineKeyboardButton(text=btn_txt, callback_data=f"dev_{project_name}|{w['name']}"))
+async def fetch_worker_rows(project_name: str, names: list) -> dict:
+    """Статусы строк страницы: из снимка, а кого в нем нет - одним HMGET"""
+    devices = fleet_snapshot.get(project_name, {})
+    rows = {n: devices[n] for n in names if n in devices}
+    missing = [n for n in names if n not in rows]
+    if missing:
+        for name, raw in zip(missing, await r.hmget(f"status:{project_name}", missing)):
+            stats = decode_status(raw) if raw else None
+            if stats: rows[name] = stats
+
+        gone = [n for n in missing if n not in rows]
+        if gone:
+            # Хэш статусов уже без этих воркеров - чистим индексы на лету
+            async with r.pipeline(transaction=False) as pipe:
+                for name in gone: queue_remove(pipe, project_name, name)
+                await pipe.execute()
+    return rows
+
+
+@dp.callback_query(F.data.startswith("proj_"))
+async def show_devices(callback: CallbackQuery):
+    project_name = callback.data.split("_")[1]
+    mode = SORT_TO_INDEX.get(settings.get("settings:sort_dev") or "priority", "prio")
+    await render_worker_page(callback, project_name, mode)
+
+
+@dp.callback_query(F.data.startswith("wpage_"))
+async def show_devices_page(callback: CallbackQuery):
+    token, _, project_name = callback.data.split("_", 1)[1].partition("|")
+    cursor = page_cursors.get(token)
+    if not cursor:
+        await callback.answer("Страница устарела, открываю начало списка")
+        if project_name:
+            mode = SORT_TO_INDEX.get(settings.get("settings:sort_dev") or "priority", "prio")
+            await render_worker_page(callback, project_name, mode)
         else:
-            # 🔥 ПАПКА С ДЕТАЛЬНОЙ СТАТИСТИКОЙ
-            base = item["name"]
-            act, slp, err = item["stats"]
-
-            # Формируем красивую строку: 📂 Name | 🟢1 💤2 🔴0
-            stats_str = f"🟢{act} 💤{slp}"
-            if err > 0:
-                stats_str += f" 🔴{err}"  # Красный показываем только если есть ошибки, или всегда (по желанию)
-            else:
-                stats_str += f" 🔴0"
+            await render_projects_page(callback, 0)
+        return
+    project_name, mode, anchor, score, direction = cursor
+    await render_worker_page(callback, project_name, mode, anchor, score, direction)
+
+
+async def render_worker_page(callback: CallbackQuery, project_name: str, mode: str,
+                             anchor: str = "", anchor_score: float = 0, direction: str = "next"):
+    await ensure_snapshot()
+    builder = InlineKeyboardBuilder()
+    now = time.time()
 
-            btn_txt = f"📂 {base} | {stats_str}"
-            builder.row(InlineKeyboardButton(text=btn_txt, callback_data=f"group_{project_name}|{base}"))
+    start, total, flat = await worker_page_script(keys=[index_key(project_name, mode)],
+                                                  args=page_args(mode, anchor, direction, WORKERS_PAGE_SIZE,
+                                                                 anchor_score))
+    page = [(flat[i], float(flat[i + 1])) for i in range(0, len(flat), 2)]
+    rows = await fetch_worker_rows(project_name, [name for name, _ in page])
+    devices_data = fleet_snapshot.get(project_name, {})
 
-    # Статистика проекта (общая)
-    active = sum(1 for w in all_workers if w['is_act'])
-    errors = sum(1 for w in all_workers if w['is_err'])
-    sleep = len(all_workers) - active - errors
+    if not total and not devices_data:
+        builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="menu_projects"))
+        await safe_edit_text(callback, f"📂 <b>{project_name}</b>\nСписок пуст.", builder.as_markup())
+        return
 
+    # 1. Строки страницы (в порядке индекса) + группировка внутри страницы
+    page_workers = []
+    for name, _ in page:
+        stats = rows.get(name)
+        if not stats: continue
+        st, emoji, is_err, is_act = analyze_worker_status(stats, now)
+        page_workers.append({"name": name, "st": st, "emoji": emoji, "is_err": is_err, "is_act": is_act})
+
+    # Один проход по снимку: счетчики проекта и групп (🟢 / 💤 / 🔴)
+    project_counts = [0, 0, 0]
+    group_counts = {}
+    for dev_name, stats in devices_data.items():
+        _, _, is_err, is_act = analyze_worker_status(stats, now)
+        idx = 2 if is_err else 0 if is_act else 1
+        project_counts[idx] += 1
+        group_counts.setdefault(worker_base_name(dev_name), [0, 0, 0])[idx] += 1
+
+    shown_groups = set()
+    for w in page_workers:
+        base = worker_base_name(w["name"])
+        counts = group_counts.get(base)
+        if not counts or sum(counts) <= 1:
+            btn_txt = f"{w['emoji']} {w['name']} | {w['st'].title()}"
+            builder.row(InlineKeyboardButton(text=btn_txt, callback_data=f"dev_{project_name}|{w['name']}"))
+            continue
+        if base in shown_groups: continue
+        shown_groups.add(base)
+
+        # 🔥 ПАПКА С ДЕТАЛЬНОЙ СТАТИСТИКОЙ (по всем членам группы, не только этой страницы)
+        act, slp, err = counts
+        btn_txt = f"📂 {base} | 🟢{act} 💤{slp} 🔴{err}"
+        builder.row(InlineKeyboardButton(text=btn_txt, callback_data=f"group_{project_name}|{base}"))
+
+    # 2. Навигация: якорь - крайний воркер текущей страницы
+    nav = []
+    if start > 0 and page:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=make_page_cursor(
+            project_name, mode, page[0][0], page[0][1], "prev")))
+    if start + len(page) < total and page:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=make_page_cursor(
+            project_name, mode, page[-1][0], page[-1][1], "next")))
+    if nav: builder.row(*nav)
+
+    active, sleep, errors = project_counts
+    sort_label = {"prio": "Priority", "seen": "Latest", "az": "A-Z"}[mode]
     text = f"📂 <b>Project: {project_name}</b>\n🟢 Active: {active} | 💤 Sleep: {sleep} | 🔴 Problems: {errors}"
+    if total > len(page):
+        text += f"\n📄 {start + 1}-{start + len(page)} из {total} (Sort: {sort_label})"
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="menu_projects"))
     await safe_edit_text(callback, text, builder.as_markup())
 
 
+async def backfill_worker_indexes() -> int:
+    """Индексы для воркеров, записанных до их появления (или после потери): сверка ZCARD со снимком"""
+    projects = list(fleet_snapshot)
+    if not projects: return 0
+    async with r.pipeline(transaction=False) as pipe:
+        for proj in projects:
+            pipe.zcard(index_key(proj, "az"))
+        counts = await pipe.execute()
+
+    now = time.time()
+    rebuilt = 0
+    for proj, count in zip(projects, counts):
+        workers = fleet_snapshot.get(proj, {})
+        if count == len(workers): continue
+        async with r.pipeline(transaction=False) as pipe:
+            for mode in INDEX_MODES:
+                pipe.delete(index_key(proj, mode))
+            for name, stats in workers.items():
+                deadline = status_deadline(stats)
+                silent = deadline is not None and deadline + SAFETY_BUFFER <= now
+                queue_index(pipe, proj, name, stats, STATUS_TTL, watch=False, silent=silent)
+            await pipe.execute()
+        rebuilt += 1
+    return rebuilt
+
+
 # ==========================================
 # 👇 ПРОСМОТР ГРУППЫ (НОВОЕ МЕНЮ)
 # ==========================================
@@ -396,20 +1138,20 @@ async def open_device_group(callback: CallbackQuery):
     _, payload = callback.data.split("_", 1)
     project_name, base_name = payload.split("|")
 
-    devices_data = r.hgetall(f"status:{project_name}")
+    await ensure_snapshot()
+    devices_data = fleet_snapshot.get(project_name, {})
     builder = InlineKeyboardBuilder()
     now = time.time()
 
     # Собираем всех, кто относится к этой группе
     members = []
-    for dev_name, json_str in devices_data.items():
+    for dev_name, stats in devices_data.items():
         # Проверка: начинается ли имя с base_name + "_" ИЛИ равно base_name
         is_child = dev_name.startswith(f"{base_name}_")
         is_self = dev_name == base_name
 
         if is_child or is_self:
             try:
-                stats = json.loads(json_str)
                 st, emoji, is_err, is_act = analyze_worker_status(stats, now)
                 members.append({
                     "name": dev_name, "st": st, "emoji": emoji,
@@ -453,8 +1195,33 @@ async def show_stats_handler(callback: CallbackQuery):
     await render_device_page(callback, project, device)
 
 
+def format_throughput(speed: dict, done: int, total: int, now: float) -> str:
+    """Скорость / успешность / ETA из time-series воркера"""
+    lines = []
+    per_hour = speed.get("per_hour")
+    if per_hour is not None:
+        lines.append(f"⚡ <b>Speed:</b> {per_hour:.1f} акк/час")
+
+    rates = [(label, speed.get(key)) for label, key in (("1ч", "success_1h"), ("6ч", "success_6h"), ("24ч", "success_24h"))]
+    rates = [f"{label}: {val}%" for label, val in rates if val is not None]
+    if rates: lines.append("🎯 <b>Success:</b> " + " | ".join(rates))
+
+    left = total - done if total else 0
+    if per_hour and left > 0:
+        eta_sec = left / per_hour * 3600
+        finish = datetime.fromtimestamp(now + eta_sec).strftime("%d.%m %H:%M")
+        hours, minutes = divmod(int(eta_sec // 60), 60)
+        lines.append(f"⏳ <b>ETA:</b> {hours}ч {minutes}м (≈ {finish})")
+    return "\n".join(lines)
+
+
 async def render_device_page(callback: CallbackQuery, project_name: str, device_name: str):
-    json_str = r.hget(f"status:{project_name}", device_name)
+    await ensure_snapshot()
+    stats = fleet_snapshot.get(project_name, {}).get(device_name)
+    fail_count, speed = await asyncio.gather(
+        count_failures(project_name, device_name),
+        read_throughput(r, project_name, device_name, time.time())
+    )
     builder = InlineKeyboardBuilder()
 
     # В кнопке Назад теперь надо понять, куда возвращаться: в проект или в группу?
@@ -483,24 +1250,23 @@ async def render_device_page(callback: CallbackQuery, project_name: str, device_
         InlineKeyboardButton(text="📥 Get Log", callback_data=f"cmd_log_{project_name}|{device_name}"),
         InlineKeyboardButton(text="🔄 Обновить", callback_data=f"force_update_{project_name}|{device_name}")
     )
-    fail_count = r.scard(f"failures:{project_name}:{device_name}")
+    builder.row(InlineKeyboardButton(text="🔎 Поиск в логе", callback_data=f"logsearch_{project_name}|{device_name}"))
     btn_text = f"📄 Failed Wallets ({fail_count})" if fail_count > 0 else "📄 Failed Wallets"
     builder.row(InlineKeyboardButton(text=btn_text, callback_data=f"fails_{project_name}|{device_name}"))
     builder.row(InlineKeyboardButton(text="🔙 К списку", callback_data=f"proj_{project_name}"))
 
-    if not json_str:
+    if not stats:
         await safe_edit_text(callback, "❌ Данные потеряны", reply_markup=builder.as_markup())
         return
 
-    stats = json.loads(json_str)
     st = stats.get('status', 'Unknown')
-    acc = stats.get('current_account', 'N/A')
+    acc = stats.get('account', 'N/A')
 
     last_ts = float(stats.get('last_updated', 0))
     nice_time, time_ago = format_time_data(last_ts)
 
     # Читаем настройку тайм-аута от воркера
-    w_heartbeat = int(stats.get("heartbeat_threshold", DEFAULT_OFFLINE_TIMEOUT))
+    w_heartbeat = int(stats.get("heartbeat", DEFAULT_OFFLINE_TIMEOUT))
     dynamic_limit = w_heartbeat + SAFETY_BUFFER
 
     # 🔥 ПРОВЕРКА НА OFFLINE
@@ -530,23 +1296,24 @@ async def render_device_page(callback: CallbackQuery, project_name: str, device_
     elif acc != "N/A":
         msg += f"👤 <b>Active:</b> <code>{acc}</code>\n\n"
 
-    parsed = parse_progress(stats)
-    if parsed and parsed['type'] == 'detailed':
-        bar = make_progress_bar(parsed['done'], parsed['total'])
-        percent = int((parsed['done'] / parsed['total']) * 100) if parsed['total'] else 0
+    total = stats.get('total', 0)
+    if "done" in stats and total:
+        bar = make_progress_bar(stats['done'], total)
+        percent = int((stats['done'] / total) * 100)
         msg += f"📊 <b>PROGRESS:</b>\n<code>[{bar}] {percent}%</code>\n"
-        msg += f"📦 Total: {parsed['total']} | ✅ {parsed['success']} | ❌ {parsed['fails']}\n\n"
-    elif parsed:
-        bar = make_progress_bar(0, parsed['total'])
-        msg += f"📊 <b>PROGRESS:</b>\n<code>[{bar}] 0%</code>\n📦 Total: {parsed['total']}\n\n"
+        msg += f"📦 Total: {total} | ✅ {stats.get('success', 0)} | ❌ {stats.get('fail', 0)}\n\n"
+    elif total:
+        bar = make_progress_bar(0, total)
+        msg += f"📊 <b>PROGRESS:</b>\n<code>[{bar}] 0%</code>\n📦 Total: {total}\n\n"
+
+    speed_text = format_throughput(speed, stats.get('done', 0), total, now)
+    if speed_text: msg += speed_text + "\n"
 
-    exclude = ["status", "current_account", "last_updated", "progress", "error", "pos_current", "pos_total",
-               "heartbeat_threshold"]
+    inventory = stats.get("inv") or {}
     extras = []
-    for k in sorted(stats.keys()):
-        if k not in exclude:
-            nice = k.replace("_", " ").title() if "_" in k else k
-            extras.append(f"• {nice}: <b>{stats[k]}</b>")
+    for k in sorted(inventory.keys()):
+        nice = k.replace("_", " ").title() if "_" in k else k
+        extras.append(f"• {nice}: <b>{inventory[k]}</b>")
     if extras: msg += f"🎒 <b>Inventory:</b>\n" + "\n".join(extras) + "\n"
 
     if stats.get("error") and "Error" in st:
@@ -571,13 +1338,9 @@ async def render_settings_root(callback: CallbackQuery):
 async def settings_notify_list(callback: CallbackQuery):
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="🌐 Глобальные (шаблон)", callback_data="notify_edit_GLOBAL"))
-    keys = r.keys("status:*")
-    projects = set()
-    for k in keys:
-        parts = k.split(":")
-        if len(parts) > 1: projects.add(parts[1])
+    projects = await get_project_names()
     if projects:
-        for proj in sorted(projects):
+        for proj in projects:
             builder.row(InlineKeyboardButton(text=f"🔹 {proj}", callback_data=f"notify_edit_{proj}"))
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="menu_settings"))
     text = "🔔 <b>Настройка уведомлений</b>\nГлобальный шаблон (сверху) при изменении обновляет настройки всех проектов."
@@ -593,7 +1356,7 @@ async def notify_edit_handler(callback: CallbackQuery, target_override=None):
     builder = InlineKeyboardBuilder()
 
     def get_state(t):
-        val = r.get(f"settings:notify:{target}:{t}")
+        val = settings.get(f"settings:notify:{target}:{t}")
         if val is None: return True if target == "GLOBAL" else None
         return val == "1"
 
@@ -628,18 +1391,18 @@ async def notify_edit_handler(callback: CallbackQuery, target_override=None):
 async def notify_set_action(callback: CallbackQuery):
     _, _, payload = callback.data.split("_", 2)
     target, t_code, val = payload.split("|")
-    r.set(f"settings:notify:{target}:{t_code}", val)
+    changes = {f"settings:notify:{target}:{t_code}": val}
     if target == "GLOBAL":
-        keys = r.keys("status:*")
-        projs = set(k.split(":")[1] for k in keys if len(k.split(":")) > 1)
-        for proj in projs: r.set(f"settings:notify:{proj}:{t_code}", val)
+        for proj in await get_project_names():
+            changes[f"settings:notify:{proj}:{t_code}"] = val
+    await save_settings(changes)
     await notify_edit_handler(callback, target_override=target)
 
 
 @dp.callback_query(F.data.startswith("notify_reset_"))
 async def notify_reset_action(callback: CallbackQuery):
     target = callback.data.replace("notify_reset_", "")
-    for t in ["success", "error", "log"]: r.delete(f"settings:notify:{target}:{t}")
+    await save_settings({f"settings:notify:{target}:{t}": None for t in ["success", "error", "log"]})
     await notify_edit_handler(callback, target_override=target)
 
 
@@ -659,7 +1422,7 @@ async def render_sort_options(callback: CallbackQuery, target_override=None):
     else:
         target = callback.data.split("_")[2]
     builder = InlineKeyboardBuilder()
-    current = r.get(f"settings:sort_{target}")
+    current = settings.get(f"settings:sort_{target}")
     if not current: current = "scale" if target == "proj" else "priority"
     modes = [("scale", "📊 По масштабу"), ("latest", "🕒 По свежести"), ("az", "🔤 По имени")] if target == "proj" else [
         ("priority", "⚡️ Умный приоритет"), ("latest", "🕒 По свежести"), ("az", "🔤 По имени")]
@@ -674,7 +1437,7 @@ async def render_sort_options(callback: CallbackQuery, target_override=None):
 async def save_sort_mode(callback: CallbackQuery):
     _, _, payload = callback.data.split("_", 2)
     target, mode = payload.split("|")
-    r.set(f"settings:sort_{target}", mode)
+    await save_settings({f"settings:sort_{target}": mode})
     await callback.answer("Сохранено!")
     await render_sort_options(callback, target_override=target)
 
@@ -682,7 +1445,7 @@ async def save_sort_mode(callback: CallbackQuery):
 @dp.callback_query(F.data == "settings_data")
 async def render_data_page(callback: CallbackQuery):
     builder = InlineKeyboardBuilder()
-    builder.row(InlineKeyboardButton(text="💾 Бэкап базы (JSON)", callback_data="data_backup"))
+    builder.row(InlineKeyboardButton(text="💾 Бэкап базы (JSONL.GZ)", callback_data="data_backup"))
     builder.row(InlineKeyboardButton(text="🗑 Удалить воркеров (Вручную)", callback_data="data_prune_select_proj"))
     builder.row(InlineKeyboardButton(text="🧹 Сбросить ошибки", callback_data="data_clear_errors_menu"))
     builder.row(InlineKeyboardButton(text="💣 Полный сброс", callback_data="data_factory_reset_confirm"))
@@ -694,33 +1457,47 @@ async def render_data_page(callback: CallbackQuery):
 @dp.callback_query(F.data == "data_backup")
 async def data_backup_handler(callback: CallbackQuery):
     await callback.answer("⏳ Собираю данные...", show_alert=False)
-    all_data = {}
-    for pattern in ["status:*", "failures:*", "fail_logs:*", "settings:*"]:
-        keys = r.keys(pattern)
-        for k in keys:
-            if r.type(k) == 'string':
-                all_data[k] = r.get(k)
-            elif r.type(k) == 'hash':
-                all_data[k] = r.hgetall(k)
-            elif r.type(k) == 'set':
-                all_data[k] = list(r.smembers(k))
-    file_content = json.dumps(all_data, indent=4, ensure_ascii=False)
-    fobj = io.BytesIO(file_content.encode('utf-8'))
-    fobj.name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
-    await callback.message.answer_document(BufferedInputFile(fobj.getvalue(), filename=fobj.name),
-                                           caption="💾 <b>Полный бэкап</b>")
-    await callback.answer()
+    stats = {}
+    filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M')}.jsonl.gz"
+    document = StreamInputFile(lambda: iter_backup_gzip(r, stats=stats), filename=filename)
+    await callback.message.answer_document(document, caption="💾 <b>Полный бэкап</b>\n"
+                                                             "Восстановить: отправьте файл боту с подписью /restore",
+                                           parse_mode="HTML")
+    print(f"💾 Бэкап отправлен: {stats.get('keys', 0)} ключей")
+
+
+@dp.message(Command("restore"), F.document)
+async def restore_backup_handler(message: types.Message):
+    if str(message.from_user.id) != str(config.TG_USER_ID): return
+    await message.answer("⏳ Восстанавливаю бэкап...")
+    try:
+        # Файл качаем на диск (SpooledTemporaryFile держит в памяти только маленькие)
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as tmp:
+            await bot.download(message.document, destination=tmp)
+            tmp.seek(0)
+            count = await restore_records(r, iter_backup_file(tmp))
+    except Exception as e:
+        await message.answer(f"❌ Ошибка восстановления: {e}")
+        return
+
+    await migrate_legacy_settings(r, force=True)
+    await r.publish(SETTINGS_CHANNEL, make_reload_message())
+    await asyncio.gather(resync_snapshot(), settings.aload(r))
+    added = await backfill_watchdog()
+    rebuilt = await backfill_worker_indexes()
+    if rebuilt: print(f"🗂 Индексы воркеров перестроены: {rebuilt} проект(ов)")
+    if added: print(f"🐕 Сторож: под наблюдением {added} воркер(ов)")
+    await message.answer(f"♻️ Восстановлено ключей: <b>{count}</b>", parse_mode="HTML")
 
 
 @dp.callback_query(F.data == "data_prune_select_proj")
 async def data_prune_select_proj(callback: CallbackQuery):
     builder = InlineKeyboardBuilder()
-    keys = r.keys("status:*")
-    projs = set(k.split(":")[1] for k in keys if len(k.split(":")) > 1)
+    projs = await get_project_names()
     if not projs:
         await callback.answer("Нет данных", show_alert=True)
         return
-    for p in sorted(projs): builder.row(InlineKeyboardButton(text=f"📂 {p}", callback_data=f"data_prune_list_{p}"))
+    for p in projs: builder.row(InlineKeyboardButton(text=f"📂 {p}", callback_data=f"data_prune_list_{p}"))
     builder.row(InlineKeyboardButton(text="🔙 Отмена", callback_data="settings_data"))
     await safe_edit_text(callback, "🗑 <b>Удаление воркеров</b>\nВ каком проекте чистим?", builder.as_markup())
 
@@ -729,15 +1506,15 @@ async def data_prune_select_proj(callback: CallbackQuery):
 async def data_prune_list_worker(callback: CallbackQuery):
     proj = callback.data.replace("data_prune_list_", "")
     builder = InlineKeyboardBuilder()
-    workers = r.hgetall(f"status:{proj}")
+    await ensure_snapshot()
+    workers = fleet_snapshot.get(proj, {})
     if not workers:
         await callback.answer("В проекте нет воркеров", show_alert=True)
         return
     now = time.time()
     sorted_workers = []
-    for w_name, w_json in workers.items():
+    for w_name, stats in workers.items():
         try:
-            stats = json.loads(w_json)
             last_ts = float(stats.get("last_updated", 0))
             diff = now - last_ts
             hours = int(diff / 3600)
@@ -757,7 +1534,15 @@ async def data_do_del_worker(callback: CallbackQuery):
     payload = callback.data.replace("data_do_del_", "")
     if "|" in payload:
         proj, name = payload.split("|", 1)
-        r.hdel(f"status:{proj}", name)
+        await r.hdel(f"status:{proj}", name)
+        await r.delete(*ts_keys(proj, name))
+        await drop_worker_inventory(r, proj, name)
+        async with r.pipeline(transaction=False) as pipe:
+            queue_remove(pipe, proj, name)
+            await pipe.execute()
+        forget_worker(proj, name)
+        if not await r.exists(f"status:{proj}"):
+            await r.srem(PROJECTS_KEY, proj)
         await callback.answer(f"Воркер {name} удален!", show_alert=True)
 
         class FakeCallback:
@@ -778,11 +1563,10 @@ async def data_do_del_worker(callback: CallbackQuery):
 async def data_clear_errors_menu(callback: CallbackQuery):
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="🌐 Сбросить ВЕЗДЕ", callback_data="data_clear_errors_all"))
-    keys = r.keys("status:*")
-    projs = set(k.split(":")[1] for k in keys if len(k.split(":")) > 1)
+    projs = await get_project_names()
     if projs:
         builder.row(InlineKeyboardButton(text="👇 Выбрать проект 👇", callback_data="ignore"))
-        for p in sorted(projs): builder.row(InlineKeyboardButton(text=f"🔸 {p}", callback_data=f"data_clear_errors_{p}"))
+        for p in projs: builder.row(InlineKeyboardButton(text=f"🔸 {p}", callback_data=f"data_clear_errors_{p}"))
     builder.row(InlineKeyboardButton(text="🔙 Отмена", callback_data="settings_data"))
     await safe_edit_text(callback, "🧹 <b>Сброс ошибок</b>\nЭто удалит логи ошибок.\nГде чистим?", builder.as_markup())
 
@@ -791,22 +1575,22 @@ async def data_clear_errors_menu(callback: CallbackQuery):
 async def data_clear_errors_action(callback: CallbackQuery):
     target = callback.data.replace("data_clear_errors_", "")
     if target == "all":
-        keys_list = r.keys("failures:*")
-        keys_logs = r.keys("fail_logs:*")
-        keys_temp = r.keys("temp_errors:*")
+        keys_list = await r.keys("failures:*")
+        keys_logs = await r.keys("fail_logs:*") + await r.keys("fail_ids:*")
+        keys_temp = await r.keys("temp_errors:*")
         count = len(keys_list) + len(keys_logs) + len(keys_temp)
-        if keys_list: r.delete(*keys_list)
-        if keys_logs: r.delete(*keys_logs)
-        if keys_temp: r.delete(*keys_temp)
+        if keys_list: await r.delete(*keys_list)
+        if keys_logs: await r.delete(*keys_logs)
+        if keys_temp: await r.delete(*keys_temp)
         msg = f"Очищено ({count})."
     else:
-        keys_list = r.keys(f"failures:{target}:*")
-        keys_logs = r.keys(f"fail_logs:{target}:*")
-        keys_temp = r.keys(f"temp_errors:{target}:*")
+        keys_list = await r.keys(f"failures:{target}:*")
+        keys_logs = await r.keys(f"fail_logs:{target}:*") + await r.keys(f"fail_ids:{target}:*")
+        keys_temp = await r.keys(f"temp_errors:{target}:*")
         count = len(keys_list) + len(keys_logs) + len(keys_temp)
-        if keys_list: r.delete(*keys_list)
-        if keys_logs: r.delete(*keys_logs)
-        if keys_temp: r.delete(*keys_temp)
+        if keys_list: await r.delete(*keys_list)
+        if keys_logs: await r.delete(*keys_logs)
+        if keys_temp: await r.delete(*keys_temp)
         msg = f"Очищен {target}."
     await callback.answer(msg, show_alert=True)
     await render_data_page(callback)
@@ -823,9 +1607,14 @@ async def data_factory_reset_confirm(callback: CallbackQuery):
 
 @dp.callback_query(F.data == "data_factory_reset_do")
 async def data_factory_reset_do(callback: CallbackQuery):
-    for pattern in ["status:*", "failures:*", "fail_logs:*", "settings:*", "temp_errors:*"]:
-        keys = r.keys(pattern)
-        if keys: r.delete(*keys)
+    for pattern in ["status:*", "failures:*", "fail_logs:*", "fail_ids:*", "settings:*", "temp_errors:*", "ts:*", "inv:*", "workers:*"]:
+        keys = await r.keys(pattern)
+        if keys: await r.delete(*keys)
+    await r.delete(PROJECTS_KEY, DEADLINES_KEY, SETTINGS_KEY)
+    silent_workers.clear()
+    await r.publish(SETTINGS_CHANNEL, make_reload_message())
+    fleet_snapshot.clear()
+    await settings.aload(r)
     await callback.answer("♻️ Бот полностью сброшен.", show_alert=True)
     await show_start_menu(callback)
 
@@ -833,6 +1622,9 @@ async def data_factory_reset_do(callback: CallbackQuery):
 @dp.callback_query(F.data == "menu_about")
 async def show_about(callback: CallbackQuery):
     text = "ℹ️ <b>О боте</b>\n\n<b>Universal Status Bot</b>\nЦентрализованная система мониторинга.\n"
+    text += (f"\n📡 <b>Alerts:</b> получено {alert_stats['received']} | отправлено {alert_stats['delivered']}"
+             f" | в очереди {outbox.pending()} | склеено {outbox.stats['merged']}"
+             f"\n⏱ <b>Lag:</b> {alert_stats['last_lag'] * 1000:.0f} ms (max {alert_stats['max_lag'] * 1000:.0f} ms)\n")
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="🐙 GitHub Repository",
                                      url="https://github.com/there-is-no-point/Universal-Status-Bot"))
@@ -840,42 +1632,134 @@ async def show_about(callback: CallbackQuery):
     await safe_edit_text(callback, text, builder.as_markup())
 
 
+# === ⏱ /perf ===
+PERF_TOP = 15
+
+
+@dp.message(Command("perf"))
+async def perf_handler(message: types.Message):
+    """Самые медленные хендлеры по p95 (последние PERF_RING_SIZE замеров на каждый). /perf reset - сбросить."""
+    if str(message.from_user.id) != str(config.TG_USER_ID): return
+    if message.text and "reset" in message.text:
+        perf_ring.clear()
+        await message.answer("⏱ Замеры сброшены.")
+        return
+
+    rows = perf_ring.summary()
+    if not rows:
+        await message.answer("⏱ Замеров пока нет - понажимайте кнопки.")
+        return
+
+    lines = [f"{'handler':<24}{'n':>5}{'p50':>7}{'p95':>7}{'p99':>7}{'redis':>7}{'KB':>7}{'r ms':>7}{'tg ms':>7}"]
+    for row in rows[:PERF_TOP]:
+        lines.append(
+            f"{row['name'][:23]:<24}{row['count']:>5}"
+            f"{row['p50'] * 1000:>7.0f}{row['p95'] * 1000:>7.0f}{row['p99'] * 1000:>7.0f}"
+            f"{row['redis_calls']:>7.1f}{row['redis_kb']:>7.1f}{row['redis_ms']:>7.0f}{row['tg_ms']:>7.0f}"
+        )
+    text = ("⏱ <b>Медленные хендлеры</b> (мс; redis/KB/r ms/tg ms - в среднем за вызов)\n"
+            f"<pre>{chr(10).join(lines)}</pre>")
+    await message.answer(text, parse_mode="HTML")
+
+
+# === 🚫 УПАВШИЕ КОШЕЛЬКИ ===
+# failures:{project}:{worker} - sorted set {wallet: время падения}.
+# Старые воркеры писали обычный set - для них читаем по-старому.
+FAILS_PAGE_SIZE = 20
+
+
+async def count_failures(project_name: str, device_name: str) -> int:
+    key = f"failures:{project_name}:{device_name}"
+    try:
+        return await r.zcard(key)
+    except ResponseError:
+        return await r.scard(key)
+
+
+async def get_failures_page(project_name: str, device_name: str, page: int):
+    """Одна страница (свежие сверху) + общее количество: [(wallet, failed_at), ...], total"""
+    key = f"failures:{project_name}:{device_name}"
+    start = page * FAILS_PAGE_SIZE
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.zcard(key)
+            pipe.zrevrange(key, start, start + FAILS_PAGE_SIZE - 1, withscores=True)
+            total, rows = await pipe.execute()
+        return rows, total
+    except ResponseError:
+        wallets = sorted(await r.smembers(key), reverse=True)
+        return [(w, 0) for w in wallets[start:start + FAILS_PAGE_SIZE]], len(wallets)
+
+
 @dp.callback_query(F.data.startswith("fails_"))
 async def show_fails_menu(callback: CallbackQuery):
     _, payload = callback.data.split("_", 1)
-    project_name, device_name = payload.split("|")
-    wallets = sorted(list(r.smembers(f"failures:{project_name}:{device_name}")))
+    parts = payload.split("|")
+    project_name, device_name = parts[0], parts[1]
+    page = int(parts[2]) if len(parts) > 2 else 0
+
+    rows, total = await get_failures_page(project_name, device_name, page)
     builder = InlineKeyboardBuilder()
-    if not wallets:
+    if not total:
         await callback.answer("✅ Ошибок нет!", show_alert=True)
         return
-    visible_wallets = wallets[-30:]
-    for wallet in visible_wallets:
-        builder.row(InlineKeyboardButton(text=f"❌ {wallet[:6]}...{wallet[-4:]}",
-                                         callback_data=f"err_{project_name}|{device_name}|{wallet[-10:]}"))
-    builder.row(InlineKeyboardButton(text="📥 Скачать полный отчёт (.txt)",
+    for wallet, failed_at in rows:
+        when = f" · {datetime.fromtimestamp(failed_at).strftime('%d.%m %H:%M')}" if failed_at else ""
+        builder.row(InlineKeyboardButton(text=f"❌ {wallet[:6]}...{wallet[-4:]}{when}",
+                                         callback_data=f"err_{project_name}|{device_name}|{short_wallet_id(wallet)}"))
+
+    pages = (total + FAILS_PAGE_SIZE - 1) // FAILS_PAGE_SIZE
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"fails_{project_name}|{device_name}|{page - 1}"))
+    if page + 1 < pages:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"fails_{project_name}|{device_name}|{page + 1}"))
+    if nav: builder.row(*nav)
+
+    builder.row(InlineKeyboardButton(text="📥 Скачать полный отчёт (.txt.gz)",
                                      callback_data=f"dl_all_{project_name}|{device_name}"))
+    builder.row(InlineKeyboardButton(text="📊 CSV", callback_data=f"dl_all_{project_name}|{device_name}|csv"),
+                InlineKeyboardButton(text="🧾 JSONL", callback_data=f"dl_all_{project_name}|{device_name}|jsonl"))
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data=f"dev_{project_name}|{device_name}"))
-    await safe_edit_text(callback, f"🚫 <b>Failed Wallets:</b> {len(wallets)}", builder.as_markup())
+    text = f"🚫 <b>Failed Wallets:</b> {total}"
+    if pages > 1: text += f"\n📄 Страница {page + 1}/{pages} (свежие сверху)"
+    await safe_edit_text(callback, text, builder.as_markup())
+
+
+# Кошелек по short_id и его лог - за один запрос
+GET_WALLET_LOG_LUA = """
+local wallet = redis.call('HGET', KEYS[1], ARGV[1])
+if not wallet then return nil end
+return {wallet, redis.call('HGET', KEYS[2], wallet)}
+"""
+get_wallet_log_script = r.register_script(GET_WALLET_LOG_LUA)
+
+
+async def find_wallet_log(project_name: str, device_name: str, wallet_id: str):
+    found = await get_wallet_log_script(keys=[f"fail_ids:{project_name}:{device_name}",
+                                              f"fail_logs:{project_name}:{device_name}"], args=[wallet_id])
+    if found:
+        return found[0], found[1]
+
+    # Старые кнопки (хвост адреса) и воркеры без индекса: ищем по хвосту через HSCAN
+    async for w, raw_data in r.hscan_iter(f"fail_logs:{project_name}:{device_name}", match=f"*{wallet_id}"):
+        return w, raw_data
+    return wallet_id, None
 
 
 @dp.callback_query(F.data.startswith("err_"))
 async def show_specific_error(callback: CallbackQuery):
     try:
         _, payload = callback.data.split("_", 1)
-        project_name, device_name, wallet_part = payload.split("|")
-        all_logs = r.hgetall(f"fail_logs:{project_name}:{device_name}")
+        project_name, device_name, wallet_id = payload.split("|")
+        full_w, raw_data = await find_wallet_log(project_name, device_name, wallet_id)
         target_logs = "Лог не найден"
-        full_w = wallet_part
-        for w, raw_data in all_logs.items():
-            if wallet_part in w:
-                full_w = w
-                try:
-                    parsed_logs = json.loads(raw_data)
-                    target_logs = "\n".join(parsed_logs) if isinstance(parsed_logs, list) else str(parsed_logs)
-                except:
-                    target_logs = str(raw_data)
-                break
+        if raw_data is not None:
+            try:
+                parsed_logs = json.loads(raw_data)
+                target_logs = "\n".join(parsed_logs) if isinstance(parsed_logs, list) else str(parsed_logs)
+            except:
+                target_logs = str(raw_data)
         builder = InlineKeyboardBuilder()
         builder.row(InlineKeyboardButton(text="🔙 К списку", callback_data=f"fails_{project_name}|{device_name}"))
         text = f"👤 <b>Wallet:</b> <code>{full_w}</code>\n\n❌ <b>Log History:</b>\n<pre>{target_logs}</pre>"
@@ -890,50 +1774,101 @@ async def show_specific_error(callback: CallbackQuery):
         await callback.answer(f"Ошибка: {e}", show_alert=True)
 
 
+def _decode_wallet_logs(raw_val) -> list:
+    try:
+        parsed = json.loads(raw_val)
+        return [str(l) for l in parsed] if isinstance(parsed, list) else [str(parsed)]
+    except:
+        return [str(raw_val)]
+
+
+async def iter_error_report(project_name: str, device_name: str, fmt: str = "txt"):
+    """
+    Полный отчет по ошибкам строками. Хэш читается через HSCAN пачками,
+    так что в памяти одновременно только текущая пачка кошельков.
+    """
+    key = f"fail_logs:{project_name}:{device_name}"
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["wallet", "line", "log"])
+        yield buf.getvalue()
+        async for wallet, raw_val in r.hscan_iter(key, count=200):
+            buf.seek(0)
+            buf.truncate()
+            for i, line in enumerate(_decode_wallet_logs(raw_val), 1):
+                writer.writerow([wallet, i, line])
+            yield buf.getvalue()
+        return
+
+    if fmt == "jsonl":
+        async for wallet, raw_val in r.hscan_iter(key, count=200):
+            yield json.dumps({"wallet": wallet, "logs": _decode_wallet_logs(raw_val)}, ensure_ascii=False) + "\n"
+        return
+
+    yield f"FULL ERROR REPORT | {project_name} | {device_name}\n" + "=" * 60 + "\n"
+    async for wallet, raw_val in r.hscan_iter(key, count=200):
+        lines = [f"WALLET: {wallet}", "-" * 30]
+        lines.extend(_decode_wallet_logs(raw_val))
+        lines.append("=" * 60)
+        yield "\n".join(lines) + "\n\n"
+
+
 @dp.callback_query(F.data.startswith("dl_all_"))
 async def dl_all_handler(callback: CallbackQuery):
     payload = callback.data.replace("dl_all_", "")
     try:
-        project_name, device_name = payload.split("|")
-    except ValueError:
+        parts = payload.split("|")
+        project_name, device_name = parts[0], parts[1]
+        fmt = parts[2] if len(parts) > 2 else "txt"
+    except IndexError:
         await callback.answer("Ошибка формата данных", show_alert=True)
         return
-    logs = r.hgetall(f"fail_logs:{project_name}:{device_name}")
-    if not logs:
+    if fmt not in ("txt", "csv", "jsonl"):
+        fmt = "txt"
+    if not await r.exists(f"fail_logs:{project_name}:{device_name}"):
         await callback.answer("Пусто (Logs not found in Redis)", show_alert=True)
         return
-    lines = [f"FULL ERROR REPORT | {project_name} | {device_name}", "=" * 60]
-    for wallet, raw_val in sorted(logs.items()):
-        lines.append(f"WALLET: {wallet}")
-        lines.append("-" * 30)
-        try:
-            parsed = json.loads(raw_val)
-            if isinstance(parsed, list):
-                for l in parsed: lines.append(str(l))
-            else:
-                lines.append(str(parsed))
-        except:
-            lines.append(str(raw_val))
-        lines.append("=" * 60);
-        lines.append("")
-    txt = "\n".join(lines)
-    fobj = io.BytesIO(txt.encode('utf-8'))
-    fobj.name = f"ERRORS_{project_name}_{datetime.now().strftime('%H%M')}.txt"
+    filename = f"ERRORS_{project_name}_{datetime.now().strftime('%H%M')}.{fmt}.gz"
+    document = StreamInputFile(lambda: gzip_stream(iter_error_report(project_name, device_name, fmt)), filename)
     try:
-        await callback.message.answer_document(BufferedInputFile(fobj.getvalue(), filename=fobj.name),
-                                               caption="📜 Full History Report")
+        await callback.message.answer_document(document, caption="📜 Full History Report")
         await callback.answer()
     except Exception as e:
         await callback.answer(f"Ошибка отправки: {e}", show_alert=True)
 
 
+# === 📨 КОМАНДЫ ВОРКЕРАМ (запрос/ответ) ===
+FORCE_UPDATE_TIMEOUT = getattr(config, 'FORCE_UPDATE_TIMEOUT', 5)  # сек, должно быть меньше REDIS_SOCKET_TIMEOUT
+
+
+async def send_command(project_name: str, device_name: str, cmd: str, timeout: float, **params):
+    """
+    Шлет команду воркеру и ждет ответ с тем же id.
+    None - воркер не слушает канал или не ответил за timeout.
+    """
+    cmd_id, payload = make_command(cmd, **params)
+    listeners = await r.publish(command_channel(project_name, device_name), payload)
+    if not listeners:
+        return None
+    reply = await r.blpop([reply_key(cmd_id)], timeout=timeout)
+    if not reply:
+        return None
+    try:
+        return json.loads(reply[1])
+    except ValueError:
+        return None
+
+
 @dp.callback_query(F.data.startswith("force_update_"))
 async def force_update_handler(callback: CallbackQuery):
     _, _, payload = callback.data.split("_", 2)
     p, d = payload.split("|")
-    r.publish(f"cmd:{p}:{d}", "update_status")
     await callback.answer("⏳ Обновляю...")
-    await asyncio.sleep(1)
+    reply = await send_command(p, d, "update_status", timeout=FORCE_UPDATE_TIMEOUT)
+    if reply and reply.get("status"):
+        apply_status_delta({"project": p, "worker": d, "status": reply["status"]})
     await render_device_page(callback, p, d)
 
 
@@ -941,20 +1876,249 @@ async def force_update_handler(callback: CallbackQuery):
 async def request_logs(callback: CallbackQuery):
     _, _, payload = callback.data.split("_", 2)
     p, d = payload.split("|")
-    r.publish(f"cmd:{p}:{d}", "get_log")
+    await r.publish(command_channel(p, d), "get_log")
     await callback.answer("📨 Запрос логов...")
 
 
+# --- 🔎 ПОИСК ПО ЛОГУ ВОРКЕРА ---
+# Ищет сам воркер (modules/log_search.py), бот получает только совпавшие строки
+SEARCH_LOG_BUDGET = max(1, min(5, REDIS_SOCKET_TIMEOUT - 4))  # сек поиска на воркере
+SEARCH_LOG_TIMEOUT = SEARCH_LOG_BUDGET + 2  # ждем ответ (меньше REDIS_SOCKET_TIMEOUT)
+SEARCH_FIELDS = {"wallet": "wallet", "level": "level", "module": "module", "re": "regex", "limit": "limit"}
+SEARCH_USAGE = ("🔎 <b>Поиск по логу воркера</b>\n"
+                "<code>/logsearch {target} 0xWALLET level:ERROR module:Swap re:\"timeout|429\"</code>\n\n"
+                "Все условия необязательны. Слово без префикса - кошелек, re: - регулярное выражение.")
+
+
+def parse_search_query(args: list) -> dict:
+    params, bare = {}, []
+    for token in args:
+        field, sep, value = token.partition(":")
+        if sep and field.lower() in SEARCH_FIELDS and value:
+            params[SEARCH_FIELDS[field.lower()]] = value
+        else:
+            bare.append(token)
+    if bare and "wallet" not in params: params["wallet"] = " ".join(bare)
+    return params
+
+
+@dp.callback_query(F.data.startswith("logsearch_"))
+async def log_search_help(callback: CallbackQuery):
+    target = callback.data.replace("logsearch_", "", 1)
+    await callback.message.answer(SEARCH_USAGE.format(target=html.escape(target)), parse_mode="HTML")
+    await callback.answer()
+
+
+@dp.message(Command("logsearch"))
+async def log_search_handler(message: types.Message):
+    if str(message.from_user.id) != str(config.TG_USER_ID): return
+    try:
+        args = shlex.split(message.text or "")[1:]
+    except ValueError:
+        args = []
+    if not args or "|" not in args[0]:
+        await message.answer(SEARCH_USAGE.format(target="Project|Worker"), parse_mode="HTML")
+        return
+    p, d = args[0].split("|", 1)
+    params = parse_search_query(args[1:])
+    if not params:
+        await message.answer("⚠️ Нужно хотя бы одно условие: кошелек, level:, module: или re:")
+        return
+
+    reply = await send_command(p, d, "search_log", timeout=SEARCH_LOG_TIMEOUT, budget=SEARCH_LOG_BUDGET, **params)
+    if reply is None:
+        await message.answer(f"📴 {html.escape(d)} не ответил (воркер выключен или старой версии)")
+        return
+    if not reply.get("ok"):
+        await message.answer(f"❌ Ошибка поиска: {html.escape(str(reply.get('error')))}")
+        return
+
+    matches = reply.get("matches", [])
+    header = (f"🔎 <b>{html.escape(p)}</b> | {html.escape(d)}\n"
+              f"Найдено: {reply.get('total', 0)}" + (f" (последние {len(matches)})" if matches else "") +
+              f" | {reply.get('scanned_kb', 0)} KB за {reply.get('elapsed', 0)} с")
+    if reply.get("truncated"): header += "\n⚠️ Поиск остановлен по времени - просмотрена не вся история"
+    if not matches:
+        await message.answer(header, parse_mode="HTML")
+        return
+    body = "\n".join(matches)
+    text = f"{header}\n<pre>{html.escape(body)}</pre>"
+    if len(text) <= TG_TEXT_LIMIT:
+        await message.answer(text, parse_mode="HTML")
+    else:
+        filename = f"search_{d}_{datetime.now().strftime('%H-%M')}.txt"
+        await message.answer_document(BufferedInputFile(body.encode("utf-8"), filename=filename),
+                                      caption=header, parse_mode="HTML")
+
+
 @dp.callback_query(F.data == "refresh_main")
 async def refresh_main_handler(callback: CallbackQuery):
     await show_start_menu(callback)
 
 
+# === 🌐 РЕЖИМ ЗАПУСКА: POLLING / WEBHOOK ===
+BOT_MODE = getattr(config, 'BOT_MODE', "polling")
+WEBHOOK_URL = getattr(config, 'WEBHOOK_URL', None)  # публичный адрес за reverse proxy (без пути)
+WEBHOOK_PATH = getattr(config, 'WEBHOOK_PATH', "/webhook")
+WEBHOOK_SECRET = getattr(config, 'WEBHOOK_SECRET', None)
+WEBHOOK_HOST = getattr(config, 'WEBHOOK_HOST', "127.0.0.1")
+WEBHOOK_PORT = getattr(config, 'WEBHOOK_PORT', 8080)
+WEBHOOK_MAX_CONCURRENCY = getattr(config, 'WEBHOOK_MAX_CONCURRENCY', 16)  # апдейтов в обработке одновременно
+WEBHOOK_DRAIN_TIMEOUT = getattr(config, 'WEBHOOK_DRAIN_TIMEOUT', 10)  # сколько ждать недообработанные при остановке
+
+WEBHOOK_UPDATES = Counter("usbot_webhook_updates_total",
+                          "Апдейты вебхука (result: ok / error / rejected / bad_json / foreign)",
+                          ["result"], registry=metrics_registry)
+Gauge("usbot_webhook_inflight", "Апдейты вебхука в обработке",
+      registry=metrics_registry).set_function(lambda: len(webhook_tasks))
+
+webhook_slots = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+webhook_tasks = set()
+
+
+async def process_webhook_update(update: types.Update):
+    try:
+        await dp.feed_update(bot, update)
+        WEBHOOK_UPDATES.inc(result="ok")
+    except Exception as e:
+        WEBHOOK_UPDATES.inc(result="error")
+        print(f"Webhook Error: {e}")
+    finally:
+        webhook_slots.release()
+
+
+def is_owner_update(update: types.Update) -> bool:
+    """Апдейт от владельца (TG_USER_ID). Без from_user (посты каналов, неизвестные типы) - не наш."""
+    try:
+        user = getattr(update.event, "from_user", None)
+    except Exception:  # UpdateTypeLookupError
+        return False
+    return user is not None and str(user.id) == str(config.TG_USER_ID)
+
+
+async def webhook_handler(request: web.Request):
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    # bytes: compare_digest на str с не-ASCII символами бросает TypeError (был бы 500 на любой мусор)
+    if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+        WEBHOOK_UPDATES.inc(result="rejected")
+        return web.Response(status=401)
+    try:
+        update = types.Update.model_validate(await request.json(), context={"bot": bot})
+    except Exception:
+        WEBHOOK_UPDATES.inc(result="bad_json")
+        return web.Response(status=400)
+    # Хендлеры кнопок (в т.ч. полный сброс) сами владельца не проверяют - чужие апдейты отсекаем здесь.
+    # Отвечаем 200, иначе Telegram будет присылать их повторно.
+    if not is_owner_update(update):
+        WEBHOOK_UPDATES.inc(result="foreign")
+        return web.Response(text="ok")
+
+    # Свободный слот ждем здесь: при перегрузке Telegram просто придержит следующие апдейты
+    await webhook_slots.acquire()
+    task = asyncio.create_task(process_webhook_update(update))
+    webhook_tasks.add(task)
+    task.add_done_callback(webhook_tasks.discard)
+    return web.Response(text="ok")
+
+
+async def health_handler(request: web.Request):
+    return web.json_response({"ok": True, "inflight": len(webhook_tasks),
+                              "snapshot_age": round(time.time() - snapshot_stats["synced_at"], 1)})
+
+
+async def run_webhook():
+    """aiohttp-сервер для апдейтов. Останавливается по SIGINT/SIGTERM: перестает принимать, дожидается текущих."""
+    global WEBHOOK_SECRET
+    if not WEBHOOK_SECRET:
+        if not WEBHOOK_URL:
+            print("❌ BOT_MODE = \"webhook\" без WEBHOOK_URL: задайте WEBHOOK_SECRET, иначе апдейт пришлет кто угодно")
+            exit(1)
+        # Вебхук регистрируем сами - секрет генерируем и передаем в set_webhook
+        WEBHOOK_SECRET = secrets.token_urlsafe(32)
+        print("🔑 WEBHOOK_SECRET не задан - сгенерирован на этот запуск")
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, webhook_handler)
+    app.router.add_get("/healthz", health_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    print(f"🌐 Webhook: http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                              allowed_updates=dp.resolve_used_update_types(), drop_pending_updates=True)
+    else:
+        print("⚠️ WEBHOOK_URL не задан - вебхук в Telegram не регистрируется (локальный режим)")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остается Ctrl+C -> KeyboardInterrupt
+    try:
+        await stop.wait()
+    finally:
+        print("🛑 Webhook: останавливаюсь...")
+        await runner.cleanup()  # новые запросы больше не принимаем
+        if webhook_tasks:
+            _, pending = await asyncio.wait(set(webhook_tasks), timeout=WEBHOOK_DRAIN_TIMEOUT)
+            for task in pending: task.cancel()
+
+
 async def main():
-    print("🚀 StatusBot запущен!")
-    await bot.delete_webhook(drop_pending_updates=True)
-    asyncio.create_task(alert_listener())
-    await dp.start_polling(bot)
+    try:
+        await r.ping()
+        print("✅ Бот успешно подключен к Redis")
+    except Exception as e:
+        print(f"❌ Ошибка Redis: {e}")
+        exit(1)
+
+    registered = await backfill_project_registry()
+    print(f"📇 Реестр проектов: {registered}")
+    migrated = await migrate_legacy_settings(r)
+    if migrated: print(f"⚙️ Настройки перенесены в hash {SETTINGS_KEY}: {migrated}")
+
+    metrics_server = None
+    if BOT_METRICS_PORT:
+        metrics_server = serve_metrics(metrics_registry, BOT_METRICS_PORT, BOT_METRICS_HOST)
+        print(f"📈 Метрики: http://{BOT_METRICS_HOST}:{BOT_METRICS_PORT}/metrics")
+
+    print(f"🚀 StatusBot запущен! (режим: {BOT_MODE})")
+    await asyncio.gather(resync_snapshot(), settings.aload(r))
+    added = await backfill_watchdog()
+    rebuilt = await backfill_worker_indexes()
+    if rebuilt: print(f"🗂 Индексы воркеров перестроены: {rebuilt} проект(ов)")
+    if added: print(f"🐕 Сторож: под наблюдением {added} воркер(ов)")
+    sender_task = asyncio.create_task(outbox.run())
+    background_tasks = [asyncio.create_task(alert_stream_listener()), asyncio.create_task(alert_listener()),
+                        asyncio.create_task(snapshot_listener()), asyncio.create_task(settings_listener()),
+                        asyncio.create_task(watchdog_loop())]
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
+    finally:
+        for task in background_tasks: task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await outbox.drain(SEND_DRAIN_TIMEOUT)
+        sender_task.cancel()
+        await asyncio.gather(sender_task, return_exceptions=True)
+        try:
+            await flush_acks()
+        except Exception as e:
+            print(f"⚠️ XACK при остановке: {e}")  # записи переотправятся после рестарта
+        if metrics_server: metrics_server.shutdown()
+        await bot.session.close()
+        await r.aclose()
+        await r_raw.aclose()
+        await redis_pool.disconnect()
+        await redis_raw_pool.disconnect()
 
 
 if __name__ == "__main__":
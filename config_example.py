@@ -3,4 +3,45 @@ TG_BOT_TOKEN = "77......."
 # Твой ID от @userinfobot
 TG_USER_ID = "12345678"
 # Ссылка на базу Upstash
-REDIS_URL="rediss://default:......"
\ No newline at end of file
+REDIS_URL="rediss://default:......"
+# --- Пул соединений Redis (необязательно) ---
+REDIS_MAX_CONNECTIONS = 20       # Максимум одновременных соединений бота
+REDIS_POOL_TIMEOUT = 10          # Сколько ждать свободное соединение (сек)
+REDIS_SOCKET_TIMEOUT = 10        # Таймаут одной команды (сек)
+REDIS_CONNECT_TIMEOUT = 5        # Таймаут подключения (сек)
+REDIS_HEALTH_CHECK_INTERVAL = 30 # Проверка "живости" простаивающих соединений (сек)
+
+# --- Снимок флота в памяти бота (необязательно) ---
+SNAPSHOT_RESYNC_INTERVAL = 60    # Полная сверка снимка с Redis (сек)
+
+# --- Сторож офлайна (необязательно) ---
+WATCHDOG_INTERVAL = 30           # Как часто искать замолчавших воркеров (сек)
+
+# --- Очередь отправки алертов в Telegram (необязательно) ---
+# Лимиты считает каждая копия бота сама: при N копиях в один чат уходит до N * SEND_CHAT_RATE
+SEND_GLOBAL_RATE = 25            # Сообщений/сек на весь бот (лимит Telegram ~30)
+SEND_CHAT_RATE = 1               # Сообщений/сек в один чат
+SEND_CHAT_BURST = 3              # Сколько сообщений подряд можно без паузы
+DIGEST_WINDOW = 30               # Окно склейки однотипных алертов одного воркера в дайджест (сек)
+SEND_QUEUE_MAX = 500             # Максимум сообщений в очереди (лишние успехи отбрасываются первыми)
+
+# --- Поток алертов (необязательно) ---
+ALERT_CONSUMER = None            # Имя копии бота в группе потока (None - имя хоста). У каждой копии свое
+ALERT_CLAIM_IDLE = 300           # Через сколько сек неподтвержденный алерт упавшей копии забирает живая
+
+# --- Команды воркерам (необязательно) ---
+FORCE_UPDATE_TIMEOUT = 5         # Сколько ждать ответ воркера на "🔄 Обновить" (сек)
+
+# --- Метрики Prometheus (необязательно) ---
+BOT_METRICS_PORT = None          # Порт /metrics дашборда, например 9100 (None - выключено)
+BOT_METRICS_HOST = "127.0.0.1"   # Адрес, на котором слушает /metrics
+
+# --- Режим получения апдейтов (необязательно) ---
+BOT_MODE = "polling"             # "polling" или "webhook" (бот за reverse proxy)
+WEBHOOK_URL = None               # Публичный адрес без пути, например "https://bot.example.com"
+WEBHOOK_PATH = "/webhook"        # Путь, который проксирует nginx/caddy
+WEBHOOK_SECRET = None            # Секрет в заголовке X-Telegram-Bot-Api-Secret-Token (None - сгенерируется при старте;
+                                 # без WEBHOOK_URL обязателен)
+WEBHOOK_HOST = "127.0.0.1"       # Где слушает aiohttp-сервер бота
+WEBHOOK_PORT = 8080
+WEBHOOK_MAX_CONCURRENCY = 16     # Сколько апдейтов обрабатывается одновременно
@@ -0,0 +1,39 @@
+# modules/alert_stream.py
+"""
+Надежная доставка алертов воркер -> бот через Redis Stream.
+
+    alerts:stream   - поток {data: JSON алерта}, обрезается до ~STREAM_MAXLEN записей
+    группа dashboard - бот читает XREADGROUP, подтверждает XACK после отправки в Telegram,
+                       зависшие у упавшей реплики записи забирает XAUTOCLAIM
+    dashboard:alive - ключ с TTL, который бот продлевает, пока работает
+
+Воркер пишет в поток одним EVALSHA и только если дашборд жив: алерт, отправленный во время
+рестарта бота, дождется его в потоке. Если бота нет дольше ALIVE_TTL - воркер шлет напрямую
+в Telegram, как раньше (и не оставляет в потоке дубль на будущее).
+Старый канал telegram_alerts (PUBLISH) бот слушает дальше - для воркеров старых версий.
+"""
+import json
+
+ALERT_CHANNEL = "telegram_alerts"  # старый pub/sub транспорт
+ALERT_STREAM = "alerts:stream"
+ALERT_GROUP = "dashboard"
+DASHBOARD_ALIVE_KEY = "dashboard:alive"
+ALIVE_TTL = 30  # сек без продления - бот считается выключенным
+STREAM_MAXLEN = 5000  # примерная длина потока (MAXLEN ~), логи внутри тоже занимают место
+
+# KEYS: alive, stream; ARGV: maxlen, json
+XADD_IF_ALIVE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+return redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], '*', 'data', ARGV[2])
+"""
+
+
+_xadd_script = None  # Script (EVALSHA), создается при первом алерте
+
+
+def push_alert(client, payload: dict):
+    """XADD алерта (sync-клиент или пайплайн). None - дашборд не запущен, алерт не записан."""
+    global _xadd_script
+    if _xadd_script is None: _xadd_script = client.register_script(XADD_IF_ALIVE_LUA)
+    return _xadd_script(keys=[DASHBOARD_ALIVE_KEY, ALERT_STREAM], args=[STREAM_MAXLEN, json.dumps(payload)],
+                        client=client)
@@ -0,0 +1,205 @@
+# modules/backup.py
+"""
+Бэкап и восстановление базы бота.
+
+Формат файла: gzip + JSON Lines, одна строка = один ключ:
+{"k": "status:Proj", "t": "hash", "v": {...}, "ttl": 86400000}   (ttl в мс, -1 = без срока)
+
+Ключи обходятся через SCAN, типы/TTL и значения забираются пайплайнами пачками,
+архив отдается потоком - вся база никогда не лежит в памяти целиком.
+
+Запуск из консоли (миграция между инстансами Redis):
+    python -m modules.backup dump backup.jsonl.gz [--url rediss://...]
+    python -m modules.backup restore backup.jsonl.gz [--url rediss://...]
+"""
+import asyncio
+import gzip
+import io
+import itertools
+import json
+import zlib
+
+BACKUP_PATTERNS = ["status:*", "failures:*", "fail_logs:*", "fail_ids:*", "settings:*", "settings", "inv:*", "projects"]
+BATCH_SIZE = 200  # ключей на один пайплайн
+CHUNK_SIZE = 64 * 1024  # размер куска сжатого потока, который отдаем наружу
+
+
+# === 💾 БЭКАП ===
+async def iter_backup_keys(client, patterns=BACKUP_PATTERNS):
+    seen = set()
+    for pattern in patterns:
+        async for key in client.scan_iter(match=pattern, count=500):
+            if key in seen: continue
+            seen.add(key)
+            yield key
+
+
+async def _fetch_batch(client, keys: list) -> list:
+    async with client.pipeline(transaction=False) as pipe:
+        for k in keys:
+            pipe.type(k)
+            pipe.pttl(k)
+        meta = await pipe.execute()
+
+    records = []
+    async with client.pipeline(transaction=False) as pipe:
+        for i, k in enumerate(keys):
+            k_type = meta[i * 2]
+            if k_type == "string":
+                pipe.get(k)
+            elif k_type == "hash":
+                pipe.hgetall(k)
+            elif k_type == "set":
+                pipe.smembers(k)
+            elif k_type == "zset":
+                pipe.zrange(k, 0, -1, withscores=True)
+            elif k_type == "list":
+                pipe.lrange(k, 0, -1)
+            else:
+                continue  # ключ уже исчез или тип нам не нужен
+            records.append({"k": k, "t": k_type, "ttl": meta[i * 2 + 1]})
+        values = await pipe.execute()
+
+    for rec, value in zip(records, values):
+        if rec["t"] == "set":
+            value = sorted(value)
+        elif rec["t"] == "zset":
+            value = [[member, score] for member, score in value]
+        rec["v"] = value
+    return [rec for rec in records if rec["v"] is not None]
+
+
+async def iter_backup_records(client, patterns=BACKUP_PATTERNS, batch_size=BATCH_SIZE):
+    batch = []
+    async for key in iter_backup_keys(client, patterns):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            for rec in await _fetch_batch(client, batch): yield rec
+            batch = []
+    if batch:
+        for rec in await _fetch_batch(client, batch): yield rec
+
+
+async def gzip_stream(lines, chunk_size=CHUNK_SIZE):
+    """Сжимает поток строк в gzip, отдавая куски ~chunk_size (буфер ограничен)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> формат gzip
+    buffer = bytearray()
+    async for line in lines:
+        buffer += compressor.compress(line.encode("utf-8"))
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += compressor.flush()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def iter_backup_gzip(client, patterns=BACKUP_PATTERNS, stats: dict = None):
+    async def lines():
+        async for rec in iter_backup_records(client, patterns):
+            if stats is not None: stats["keys"] = stats.get("keys", 0) + 1
+            yield json.dumps(rec, ensure_ascii=False) + "\n"
+
+    async for chunk in gzip_stream(lines()):
+        yield chunk
+
+
+# === ♻️ ВОССТАНОВЛЕНИЕ ===
+def iter_backup_file(fileobj):
+    """
+    Читает бэкап из бинарного файла: новый формат (gzip JSONL) или старый (один JSON-словарь).
+    """
+    head = fileobj.read(2)
+    fileobj.seek(0)
+    if head == b"\x1f\x8b":
+        with gzip.open(fileobj, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip(): yield json.loads(line)
+        return
+
+    # Старый бэкап: {key: value}, тип определяем по значению
+    legacy = json.load(io.TextIOWrapper(fileobj, encoding="utf-8"))
+    for k, v in legacy.items():
+        if isinstance(v, dict):
+            yield {"k": k, "t": "hash", "v": v, "ttl": -1}
+        elif isinstance(v, list):
+            yield {"k": k, "t": "set", "v": v, "ttl": -1}
+        elif v is not None:
+            yield {"k": k, "t": "string", "v": v, "ttl": -1}
+
+
+def _queue_restore(pipe, rec: dict):
+    k, k_type, value = rec["k"], rec["t"], rec["v"]
+    pipe.delete(k)
+    if k_type == "string":
+        pipe.set(k, value)
+    elif k_type == "hash" and value:
+        pipe.hset(k, mapping=value)
+    elif k_type == "set" and value:
+        pipe.sadd(k, *value)
+    elif k_type == "zset" and value:
+        pipe.zadd(k, {member: score for member, score in value})
+    elif k_type == "list" and value:
+        pipe.rpush(k, *value)
+    ttl = rec.get("ttl", -1)
+    if ttl and ttl > 0:
+        pipe.pexpire(k, ttl)
+
+
+async def restore_records(client, records, batch_size=BATCH_SIZE) -> int:
+    """
+    Проигрывает записи бэкапа пачками по batch_size ключей на пайплайн.
+    Распаковка и разбор JSON (records - синхронный итератор) идут в потоке, чтобы не стопорить event loop.
+    """
+    records = iter(records)
+    count = 0
+    async with client.pipeline(transaction=False) as pipe:
+        while True:
+            batch = await asyncio.to_thread(lambda: list(itertools.islice(records, batch_size)))
+            if not batch: break
+            for rec in batch:
+                _queue_restore(pipe, rec)
+            await pipe.execute()
+            count += len(batch)
+    return count
+
+
+# === 🖥 CLI ===
+async def _cli(args):
+    import redis.asyncio as aioredis
+
+    url = args.url
+    if not url:
+        import config
+        url = config.REDIS_URL
+    kwargs = {"decode_responses": True}
+    if url.startswith("rediss://"): kwargs["ssl_cert_reqs"] = None
+    client = aioredis.Redis.from_url(url, **kwargs)
+
+    try:
+        if args.action == "dump":
+            stats = {}
+            with open(args.file, "wb") as f:
+                async for chunk in iter_backup_gzip(client, stats=stats):
+                    f.write(chunk)
+            print(f"💾 Сохранено ключей: {stats.get('keys', 0)} -> {args.file}")
+        else:
+            with open(args.file, "rb") as f:
+                count = await restore_records(client, iter_backup_file(f))
+            print(f"♻️ Восстановлено ключей: {count}")
+    finally:
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    parser = argparse.ArgumentParser(description="Бэкап / восстановление базы Universal Status Bot")
+    parser.add_argument("action", choices=["dump", "restore"])
+    parser.add_argument("file")
+    parser.add_argument("--url", help="REDIS_URL (по умолчанию из config.py)")
+    asyncio.run(_cli(parser.parse_args()))
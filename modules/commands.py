@@ -0,0 +1,45 @@
+# modules/commands.py
+import json
+import uuid
+
+# Команды бот -> воркер идут в канал cmd:{project}:{worker}.
+# Старый формат - голая строка ("get_log", "update_status").
+# Новый - JSON с id запроса: воркер отвечает в список reply:{id}, бот ждет ответ через BLPOP.
+REPLY_TTL = 60  # сколько живет неполученный ответ (сек)
+
+
+def command_channel(project_name: str, worker_name: str) -> str:
+    return f"cmd:{project_name}:{worker_name}"
+
+
+def reply_key(cmd_id: str) -> str:
+    return f"reply:{cmd_id}"
+
+
+def make_command(cmd: str, **params):
+    """Возвращает (id, сообщение для publish)"""
+    cmd_id = uuid.uuid4().hex[:16]
+    return cmd_id, json.dumps({"cmd": cmd, "id": cmd_id, **params}, ensure_ascii=False)
+
+
+def parse_command(raw) -> dict:
+    """Сообщение из канала -> {"cmd": ..., "id": ..., ...}. Понимает и старые строковые команды."""
+    if isinstance(raw, str) and raw.startswith("{"):
+        try:
+            data = json.loads(raw)
+            if isinstance(data, dict) and data.get("cmd"):
+                return data
+        except ValueError:
+            pass
+    return {"cmd": str(raw)}
+
+
+def send_reply(client, cmd: dict, payload: dict):
+    """Ответ воркера на команду с id (sync-клиент). Команды без id ответа не ждут."""
+    cmd_id = cmd.get("id")
+    if not cmd_id: return
+    key = reply_key(cmd_id)
+    pipe = client.pipeline(transaction=False)
+    pipe.rpush(key, json.dumps(payload, ensure_ascii=False))
+    pipe.expire(key, REPLY_TTL)
+    pipe.execute()
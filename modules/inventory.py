@@ -0,0 +1,89 @@
+# modules/inventory.py
+"""
+Общие итоги лута по флоту.
+
+    inv:{project}          - hash {метрика: сумма по всем воркерам проекта}
+    inv:{project}:{worker} - hash {метрика: вклад этого воркера за текущий цикл}
+
+Воркер на каждый успешный аккаунт атомарно (MULTI) прибавляет лут в оба хэша.
+При сбросе цикла (reset_global_stats) или удалении воркера его вклад вычитается из итога
+проекта одним EVAL, так что итоги живут столько же, сколько счетчики в процессах воркеров.
+TTL есть только у итога проекта: вклад без срока (удаляется вместе с вычитанием), иначе вклад
+молчащего воркера истекал бы раньше итога, который продлевают остальные, и уже не вычитался.
+Если итог проекта сам истек (проект простаивал INV_TTL), вычитать не из чего - вклад просто удаляется.
+Бот читает итоги одним пайплайном HGETALL inv:{p} - без разбора JSON статусов.
+"""
+
+INV_TTL = 7 * 86400  # итоги проекта без обновлений сами уходят из базы
+
+# Вычитает вклад воркера из итога проекта и удаляет его хэш.
+# Обнулившиеся метрики удаляем, чтобы в итогах не копился мусор (отрицательные - траты, комиссии - остаются).
+INV_DROP_LUA = """
+local contrib = redis.call('HGETALL', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('DEL', KEYS[2])
+    return 0
+end
+for i = 1, #contrib, 2 do
+    local left = tonumber(redis.call('HINCRBYFLOAT', KEYS[1], contrib[i], -tonumber(contrib[i + 1])))
+    if math.abs(left) < 1e-9 then redis.call('HDEL', KEYS[1], contrib[i]) end
+end
+redis.call('DEL', KEYS[2])
+return #contrib / 2
+"""
+
+
+def inventory_key(project_name: str) -> str:
+    return f"inv:{project_name}"
+
+
+def worker_inventory_key(project_name: str, worker_name: str) -> str:
+    return f"inv:{project_name}:{worker_name}"
+
+
+def numeric_loot(stats: dict) -> dict:
+    """Только числовые метрики (bool - не лут)"""
+    return {k: v for k, v in stats.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and v}
+
+
+def queue_inventory(pipe, project_name: str, worker_name: str, loot: dict) -> bool:
+    """Ставит в пайплайн прибавку лута к итогам проекта и к вкладу воркера. False - прибавлять нечего."""
+    loot = numeric_loot(loot)
+    if not loot: return False
+    total_key = inventory_key(project_name)
+    own_key = worker_inventory_key(project_name, worker_name)
+    for metric, value in loot.items():
+        pipe.hincrbyfloat(total_key, metric, value)
+        pipe.hincrbyfloat(own_key, metric, value)
+    pipe.expire(total_key, INV_TTL)  # вклад воркера без TTL - см. описание модуля
+    pipe.persist(own_key)  # снимает TTL, оставшийся от старых версий
+    return True
+
+
+def add_inventory(client, project_name: str, worker_name: str, loot: dict):
+    """Прибавляет лут аккаунта к итогам проекта и к вкладу воркера атомарно (MULTI, sync-клиент)"""
+    pipe = client.pipeline(transaction=True)
+    if queue_inventory(pipe, project_name, worker_name, loot):
+        pipe.execute()
+
+
+def drop_worker_inventory(client, project_name: str, worker_name: str):
+    """
+    Убирает вклад воркера из итогов проекта.
+    Работает с обоими клиентами (и с пайплайном): у async-клиента результат надо await-ить.
+    """
+    return client.eval(INV_DROP_LUA, 2, inventory_key(project_name),
+                       worker_inventory_key(project_name, worker_name))
+
+
+def parse_inventory(raw: dict) -> dict:
+    """HGETALL inv:{p} -> {метрика: число}; целые значения остаются int"""
+    result = {}
+    for metric, value in (raw or {}).items():
+        try:
+            num = float(value)
+        except (TypeError, ValueError):
+            continue
+        result[metric] = int(round(num)) if abs(num - round(num)) < 1e-9 else round(num, 4)
+    return result
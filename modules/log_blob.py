@@ -0,0 +1,75 @@
+# modules/log_blob.py
+"""
+Передача больших логов воркер -> бот по ссылке, а не в самом алерте.
+
+    logblob:{id} - list кусков одного gzip-потока (по BLOB_CHUNK_SIZE байт), живет LOG_BLOB_TTL
+
+Воркер сжимает хвост app.log на лету и кладет куски RPUSH-ем, в поток алертов уходит
+только ссылка {"blob": id, "chunks": N, "size": ...}. Бот читает куски по одному (LINDEX)
+бинарным клиентом, распаковывает и сразу отдает в загрузку документа - ни воркер,
+ни бот не держат весь лог в памяти.
+"""
+import os
+import uuid
+import zlib
+
+LOG_BLOB_TTL = 600  # сек: бот забирает лог сразу, это запас на его рестарт
+BLOB_CHUNK_SIZE = 256 * 1024  # сжатых байт в одном элементе списка
+READ_SIZE = 256 * 1024  # сколько читаем из файла за раз
+DEFAULT_LOG_TAIL = 5 * 1024 * 1024  # сколько последних байт лога отправляем по умолчанию
+
+
+def blob_key(blob_id: str) -> str:
+    return f"logblob:{blob_id}"
+
+
+def upload_log_tail(client, path: str, max_bytes: int = DEFAULT_LOG_TAIL) -> dict:
+    """
+    Сжимает последние max_bytes файла в logblob:{id} (sync-клиент).
+    Возвращает ссылку для алерта: {"blob", "chunks", "size", "compressed"}.
+    """
+    blob_id = uuid.uuid4().hex
+    key = blob_key(blob_id)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 - формат gzip
+    pending = b""
+    chunks = compressed = 0
+
+    def push(data: bytes):
+        nonlocal chunks, compressed
+        pipe = client.pipeline(transaction=False)
+        pipe.rpush(key, data)
+        pipe.expire(key, LOG_BLOB_TTL)
+        pipe.execute()
+        chunks += 1
+        compressed += len(data)
+
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = min(max_bytes, f.tell())
+        f.seek(-size, os.SEEK_END)
+        while True:
+            data = f.read(READ_SIZE)
+            if not data: break
+            pending += compressor.compress(data)
+            while len(pending) >= BLOB_CHUNK_SIZE:
+                push(pending[:BLOB_CHUNK_SIZE])
+                pending = pending[BLOB_CHUNK_SIZE:]
+    pending += compressor.flush()
+    if pending or not chunks: push(pending)
+    return {"blob": blob_id, "chunks": chunks, "size": size, "compressed": compressed}
+
+
+async def iter_log_blob(raw_client, blob_id: str, chunks: int):
+    """Распакованный лог кусками (async-клиент с decode_responses=False)"""
+    key = blob_key(blob_id)
+    decompressor = zlib.decompressobj(31)
+    for i in range(int(chunks)):
+        data = await raw_client.lindex(key, i)
+        if data is None:
+            raise FileNotFoundError(f"{key}: кусок {i} не найден (истек TTL?)")
+        while data:  # не больше READ_SIZE распакованных байт за раз
+            out = decompressor.decompress(data, READ_SIZE)
+            if out: yield out
+            data = decompressor.unconsumed_tail
+    tail = decompressor.flush()
+    if tail: yield tail
@@ -0,0 +1,115 @@
+# modules/log_search.py
+"""
+Поиск по логу на стороне воркера (команда search_log от бота).
+
+Файлы читаются построчно - от старого бэкапа ротации (app.log.1) к текущему app.log,
+так что в памяти только последние limit совпадений. Запись лога - строка формата
+    TIME | LEVEL | MODULE | [WALLET |] MESSAGE
+плюс строки-продолжения (traceback), они идут вместе со своей записью.
+Уровень, модуль и кошелек проверяются по заголовку, regex - по всей записи целиком
+(так находится и текст исключения из traceback), поэтому запись считается совпавшей только когда дочитана.
+Поиск останавливается по бюджету времени - бот получает то, что успели найти, с пометкой truncated.
+"""
+import glob
+import os
+import re
+import time
+from collections import deque
+
+SEARCH_LIMIT = 200  # совпадений в ответе (последние)
+SEARCH_BUDGET = 5.0  # сек на поиск
+MAX_RECORD_LINES = 50  # строк traceback на одну запись
+MAX_REPLY_CHARS = 200_000  # общий объем совпадений в ответе
+_CHECK_EVERY = 2000  # строк между проверками бюджета
+
+
+def log_files(log_path: str) -> list:
+    """Бэкапы ротации (app.log.N ... app.log.1), затем сам app.log - от старых записей к новым"""
+    rotated = [p for p in glob.glob(glob.escape(log_path) + ".*") if p.rsplit(".", 1)[-1].isdigit()]
+    rotated.sort(key=lambda p: int(p.rsplit(".", 1)[-1]), reverse=True)
+    return rotated + ([log_path] if os.path.exists(log_path) else [])
+
+
+def parse_header(line: str):
+    """'12:00:01 | ERROR | Mod | 0xabc | msg' -> (level, module, wallet или None); None - строка-продолжение"""
+    parts = line.split(" | ", 4)
+    if len(parts) < 4 or not parts[1].isupper(): return None
+    wallet = parts[3].strip() if len(parts) == 5 else None
+    return parts[1].strip(), parts[2].strip(), wallet
+
+
+class LogQuery:
+    def __init__(self, wallet=None, level=None, module=None, regex=None):
+        self.wallet = wallet or None
+        self.level = level.upper() if level else None
+        self.module = module.lower() if module else None
+        self.regex = re.compile(regex, re.IGNORECASE) if regex else None  # re.error уходит наверх
+
+    def quick_reject(self, line: str) -> bool:
+        """Дешевая проверка до разбора строки"""
+        return self.wallet is not None and self.wallet not in line
+
+    def match(self, header: tuple, text: str) -> bool:
+        """Фильтры по заголовку записи (regex - отдельно, в match_record)"""
+        level, module, wallet = header
+        if self.level and level != self.level: return False
+        if self.module and self.module not in module.lower(): return False
+        if self.wallet and self.wallet not in (wallet or "") and self.wallet not in text: return False
+        return True
+
+    def match_record(self, lines: list) -> bool:
+        return self.regex is None or self.regex.search("\n".join(lines)) is not None
+
+
+def search_log(log_path: str, query: LogQuery, limit: int = SEARCH_LIMIT, budget: float = SEARCH_BUDGET) -> dict:
+    """-> {"matches": [последние limit записей], "total", "files", "scanned_kb", "truncated", "elapsed"}"""
+    started = time.monotonic()
+    matches = deque(maxlen=limit)
+    total = scanned = lines_read = 0
+    truncated = False
+    files = log_files(log_path)
+
+    def finish(record) -> int:
+        """Запись дочитана: проверяем regex по ней целиком"""
+        if record is None or not query.match_record(record): return 0
+        matches.append(record)
+        return 1
+
+    for path in files:
+        if truncated: break
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            record = None  # [строки] текущей записи, прошедшей фильтры заголовка (продолжения дописываем к ней)
+            for line in f:
+                scanned += len(line)
+                lines_read += 1
+                if lines_read % _CHECK_EVERY == 0 and time.monotonic() - started > budget:
+                    truncated = True
+                    break
+                line = line.rstrip("\n")
+                if query.quick_reject(line):
+                    # Продолжение записи (traceback) кошелек обычно не содержит
+                    if record is not None and parse_header(line) is None:
+                        if len(record) < MAX_RECORD_LINES: record.append(line)
+                    else:
+                        total += finish(record)
+                        record = None
+                    continue
+                header = parse_header(line)
+                if header is None:
+                    if record is not None and len(record) < MAX_RECORD_LINES: record.append(line)
+                    continue
+                total += finish(record)
+                record = [line] if query.match(header, line) else None
+            total += finish(record)  # последняя запись файла (или недочитанная по бюджету)
+
+    result = []
+    size = 0
+    for rec in reversed(matches):  # при обрезке по объему оставляем самые свежие
+        text = "\n".join(rec)
+        size += len(text) + 1
+        if size > MAX_REPLY_CHARS: break
+        result.append(text)
+    result.reverse()
+    return {"matches": result, "total": total, "files": [os.path.basename(p) for p in files],
+            "scanned_kb": scanned // 1024, "truncated": truncated,
+            "elapsed": round(time.monotonic() - started, 3)}
@@ -0,0 +1,190 @@
+# modules/metrics.py
+"""
+Минимальный экспортер метрик в текстовом формате Prometheus/OpenMetrics (только stdlib).
+
+    registry = Registry()
+    sent = Counter("usbot_sent_total", "Отправлено сообщений", ["type"], registry=registry)
+    sent.inc(type="error")
+    serve(registry, 9101)   # GET http://127.0.0.1:9101/metrics
+
+Значения можно не только выставлять, но и вычислять в момент опроса: set_function(fn),
+fn возвращает число или {(значения меток...): число}.
+Сервер - ThreadingHTTPServer в daemon-потоке, наружу по умолчанию не смотрит (127.0.0.1).
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Бакеты по умолчанию - секунды (от запроса в Redis до долгого аккаунта)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"): return "+Inf"
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        out = []
+        for metric in metrics:
+            try:
+                out.extend(metric.render())
+            except Exception as e:
+                # Одна сломанная метрика не должна ронять весь ответ
+                out.append(f"# ERROR {metric.name}: {_escape(e)}")
+        return "\n".join(out) + "\n"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry: Registry = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+        if registry is not None: registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def set_function(self, fn):
+        """Значение считается при каждом опросе: fn() -> число или {(метки...): число}"""
+        self._function = fn
+        return self
+
+    def _samples(self) -> dict:
+        if self._function is not None:
+            value = self._function()
+            if isinstance(value, dict):
+                return {tuple(str(x) for x in (k if isinstance(k, tuple) else (k,))): v for k, v in value.items()}
+            return {(): value}
+        with self._lock:
+            return dict(self._values)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list:
+        lines = self._header()
+        for key, value in sorted(self._samples().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+_INF_LABEL = 'le="+Inf"'
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry: Registry = None,
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]  # счетчики бакетов, count, sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    def render(self) -> list:
+        lines = self._header()
+        with self._lock:
+            snapshot = {k: (list(v[0]), v[1], v[2]) for k, v in self._values.items()}
+        for key, (counts, count, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [_INF_LABEL])} {count}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+        return lines
+
+
+# === 🌐 HTTP ===
+def serve(registry: Registry, port: int, host: str = "127.0.0.1"):
+    """Поднимает /metrics в фоновом потоке. Возвращает сервер (server.shutdown() для остановки)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # без спама в консоль на каждый опрос
+
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="MetricsServer").start()
+    return server
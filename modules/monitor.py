@@ -40,6 +40,16 @@ except Exception:
 
 counter_lock = threading.Lock()
 
+# Проекты, в общие итоги которых (inv:{project}) этот процесс уже что-то вносил
+_fleet_inventory_projects = set()
+
+
+def _sync_fleet_inventory(project_name: str):
+    """При первом аккаунте проекта в процессе убираем вклад прошлого запуска (он мог упасть, не сбросив его)"""
+    if not status_manager or project_name in _fleet_inventory_projects: return
+    _fleet_inventory_projects.add(project_name)
+    status_manager.reset_inventory(project_name)
+
 
 # === 🔥 НОВАЯ ФУНКЦИЯ: СБРОС СТАТИСТИКИ ===
 def reset_global_stats():
@@ -60,6 +70,11 @@ def reset_global_stats():
         except:
             shared_inventory = {}
 
+    # Общие итоги флота живут столько же, сколько локальные счетчики
+    if status_manager:
+        for project_name in list(_fleet_inventory_projects):
+            status_manager.reset_inventory(project_name)
+
 
 # ==========================================
 
@@ -77,6 +92,12 @@ def get_progress_string(total_accounts):
     return f"{total_done}/{total_accounts} (✅{succ} ❌{err})"
 
 
+def get_progress_fields(total_accounts):
+    """Прогресс числами для статуса v2 (бот больше не парсит строку)"""
+    succ, err, total_done = get_progress_data()
+    return {"done": total_done, "total": total_accounts, "success": succ, "fail": err}
+
+
 def get_global_inventory():
     with counter_lock:
         return shared_inventory.copy()
@@ -107,31 +128,32 @@ def monitor_account(project_name: str):
                 # Сбрасываем только если есть старые данные
                 if current_total_done > 0:
                     reset_global_stats()
+            _sync_fleet_inventory(project_name)
             # ===============================================
 
             bot_link.register_client(
                 self,
                 project_name=project_name,  # 🔥 Раскомментировал! Это нужно для работы Heartbeat
-                progress_callback=lambda: get_progress_string(self.total_accounts),
+                progress_callback=lambda: get_progress_fields(self.total_accounts),
                 inventory_callback=get_global_inventory
             )
 
-            progress_str = get_progress_string(self.total_accounts)
-
             # Безопасная отправка в Redis
             if status_manager:
                 try:
                     start_stats = {
                         "status": "Working 🟢",
-                        "progress": progress_str,
                         "current_account": self.address,
-                        "last_updated": time.time()
+                        "position": current_pos,
+                        "last_updated": time.time(),
+                        "inv": get_global_inventory()
                     }
-                    start_stats.update(get_global_inventory())
+                    start_stats.update(get_progress_fields(self.total_accounts))
                     status_manager.update_status(project_name, start_stats)
                 except Exception:
                     pass
 
+            started_at = time.time()
             try:
                 result = func(self, *args, **kwargs)
 
@@ -139,6 +161,7 @@ def monitor_account(project_name: str):
                     raise Exception("Process returned False")
 
                 # === УСПЕХ ===
+                bot_link.record_account(project_name, True, time.time() - started_at)
 
                 try:
                     bot_link.clear_temp_errors(project_name, self.address)
@@ -154,6 +177,9 @@ def monitor_account(project_name: str):
                         if isinstance(value, (int, float)):
                             shared_inventory[key] = shared_inventory.get(key, 0) + value
 
+                if status_manager:
+                    status_manager.add_inventory(project_name, current_stats)
+
                 succ, err, total_done = get_progress_data()
                 final_progress = f"{total_done}/{self.total_accounts} (✅{succ} ❌{err})"
 
@@ -164,12 +190,13 @@ def monitor_account(project_name: str):
                     try:
                         end_stats = {
                             "status": final_status,
-                            "progress": final_progress,
                             "current_account": self.address,
-                            "last_updated": time.time()
+                            "position": current_pos,
+                            "last_updated": time.time(),
+                            "inv": get_global_inventory()
                         }
-                        end_stats.update(get_global_inventory())
-                        status_manager.update_status(project_name, end_stats)
+                        end_stats.update(get_progress_fields(self.total_accounts))
+                        status_manager.update_status(project_name, end_stats, sample=(1, 1, 0))
                     except:
                         pass
 
@@ -185,9 +212,9 @@ def monitor_account(project_name: str):
 
                 is_detailed = True
                 try:
-                    if hasattr(bot_link, 'writer') and bot_link.writer:
-                        val = bot_link.writer.get(f"settings:notify:{project_name}:success")
-                        if val == "0": is_detailed = False
+                    # Читаем из локального кэша настроек (без запроса в Redis)
+                    val = bot_link.get_setting(f"settings:notify:{project_name}:success")
+                    if val == "0": is_detailed = False
                 except:
                     pass
 
@@ -206,7 +233,6 @@ def monitor_account(project_name: str):
                             f"📊 <b>Final Result:</b> {final_progress}\n"
                             f"🎒 <b>Total Loot:</b>\n" + "\n".join(total_inv_lines)
                     )
-                    time.sleep(0.5)
                     bot_link.send_notification("worker_finished", finish_msg, project_override=project_name)
 
                     # 🔥 ЧИСТИМ ЗА СОБОЙ ПОСЛЕ ФИНИША
@@ -217,6 +243,7 @@ def monitor_account(project_name: str):
 
             except Exception as e:
                 # === ОШИБКА ===
+                bot_link.record_account(project_name, False, time.time() - started_at)
                 with counter_lock:
                     global shared_error_count
                     shared_error_count += 1
@@ -235,13 +262,14 @@ def monitor_account(project_name: str):
                     try:
                         error_stats = {
                             "status": final_status,
-                            "progress": error_progress,
                             "current_account": self.address,
+                            "position": current_pos,
                             "last_updated": time.time(),
-                            "error": error_summary
+                            "error": error_summary,
+                            "inv": get_global_inventory()
                         }
-                        error_stats.update(get_global_inventory())
-                        status_manager.update_status(project_name, error_stats)
+                        error_stats.update(get_progress_fields(self.total_accounts))
+                        status_manager.update_status(project_name, error_stats, sample=(1, 0, 1))
                     except:
                         pass
 
@@ -260,7 +288,6 @@ def monitor_account(project_name: str):
                             f"📊 <b>Final Result:</b> {error_progress}\n"
                             f"🎒 <b>Total Loot:</b>\n" + "\n".join(total_inv_lines)
                     )
-                    time.sleep(0.5)
                     bot_link.send_notification("worker_finished", finish_msg, project_override=project_name)
 
                     # 🔥 ЧИСТИМ ЗА СОБОЙ ПРИ ОШИБКЕ В КОНЦЕ
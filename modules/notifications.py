@@ -9,6 +9,8 @@ import json
 import threading
 import time
 import requests
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # ==========================================
@@ -23,6 +25,14 @@ ENABLE_HEARTBEAT = True
 # Настройка времени для ЭТОГО КОНКРЕТНОГО проекта
 HEARTBEAT_THRESHOLD = 3600
 
+# Буфер ошибок аккаунта (до его падения живет только в памяти процесса)
+TEMP_ERRORS_PER_WALLET = 50  # последних строк на кошелек
+TEMP_ERRORS_WALLETS = 1000  # кошельков одновременно (самые старые вытесняются)
+
+# Прямая отправка в Telegram (бот не запущен) - в своем потоке, чтобы не держать отправку в Redis
+DIRECT_SEND_PENDING = 20  # уведомлений в очереди прямой отправки, лишние отбрасываются (выход процесса их ждет)
+DIRECT_EXIT_TIMEOUT = 2  # сек на прямую отправку при выходе, когда пул уже остановлен (выход ограничен flush_timeout)
+
 # ==========================================
 
 
@@ -33,6 +43,30 @@ try:
 except ImportError:
     config = None
 
+from .status_store import write_status, short_wallet_id
+from .settings_cache import SettingsCache, SETTINGS_CHANNEL
+from .commands import command_channel, parse_command, send_reply
+from .alert_stream import push_alert
+from .log_blob import upload_log_tail, DEFAULT_LOG_TAIL
+from .log_search import LogQuery, search_log, SEARCH_LIMIT, SEARCH_BUDGET
+from .metrics import Registry, Counter, Gauge, Histogram, serve
+from .sender import BackgroundSender, PRIORITY_NORMAL, PRIORITY_KEEP
+
+# === 📈 МЕТРИКИ ВОРКЕРА ===
+# Считаются всегда (это дешево), HTTP /metrics поднимается только если в конфиге задан WORKER_METRICS_PORT
+WORKER_METRICS = Registry()
+ACCOUNTS_TOTAL = Counter("usbot_worker_accounts_total", "Обработано аккаунтов",
+                         ["project", "result"], registry=WORKER_METRICS)
+ACCOUNT_SECONDS = Histogram("usbot_worker_account_seconds", "Длительность обработки одного аккаунта (сек)",
+                            ["project"], registry=WORKER_METRICS)
+NOTIFICATIONS_TOTAL = Counter("usbot_worker_notifications_total", "Уведомления боту (route: stream / direct / muted / dropped)",
+                              ["type", "route"], registry=WORKER_METRICS)
+NOTIFY_QUEUE_DEPTH = Gauge("usbot_worker_notification_queue_depth",
+                           "Операции (статусы, уведомления, лут) в очереди фоновой отправки в Redis",
+                           registry=WORKER_METRICS)
+SENDER_EVENTS = Counter("usbot_worker_sender_total", "Фоновая отправка в Redis (event: queued / sent / dropped / failed)",
+                        ["event"], registry=WORKER_METRICS)
+
 
 class BotLink:
     _instance = None
@@ -92,6 +126,13 @@ class BotLink:
 
         self.last_action_time = time.time()
 
+        # (проект, кошелек) -> deque последних ERROR-строк; в Redis уходит только при падении аккаунта
+        self._temp_errors = OrderedDict()
+        self._temp_lock = threading.Lock()
+
+        # Локальный кэш settings:* (обновляется по каналу settings_changed в _listener_loop)
+        self.settings = SettingsCache()
+
         if self.redis_url:
             try:
                 self.writer = redis.Redis.from_url(self.redis_url, decode_responses=True, ssl_cert_reqs=None)
@@ -101,6 +142,28 @@ class BotLink:
             except Exception:
                 pass
 
+        # Статусы, уведомления и лут уходят в Redis из фонового потока пачками - аккаунт ждет только очередь
+        self.sender = None
+        if self.running:
+            self.sender = BackgroundSender(
+                self.writer,
+                maxsize=getattr(config, 'WORKER_SEND_QUEUE', 1000),
+                overflow=getattr(config, 'WORKER_SEND_OVERFLOW', "drop_oldest"),
+                keep_reserve=getattr(config, 'WORKER_SEND_KEEP_RESERVE', None),
+                on_event=lambda event, count: SENDER_EVENTS.inc(count, event=event))
+            NOTIFY_QUEUE_DEPTH.set_function(self.sender.qsize)
+            self.sender.start()
+        self.direct_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="BotDirect")
+        self._direct_slots = threading.BoundedSemaphore(DIRECT_SEND_PENDING)
+
+        self.metrics_server = None
+        metrics_port = getattr(config, 'WORKER_METRICS_PORT', None)
+        if metrics_port:
+            try:
+                self.metrics_server = serve(WORKER_METRICS, metrics_port)
+            except OSError as e:
+                print(f"⚠️ [BotLink] Metrics port {metrics_port} busy: {e}")
+
         self._initialized = True
 
     def register_client(self, client_instance, project_name=None, stats_callback=None, progress_callback=None,
@@ -117,41 +180,73 @@ class BotLink:
         if self.running and self.project_name != "UnknownProject":
             self.start_background_tasks()
 
+    def record_account(self, project_name, ok: bool, duration: float):
+        """Счетчики успех/ошибка и гистограмма длительности аккаунта для /metrics"""
+        ACCOUNTS_TOTAL.inc(project=project_name, result="success" if ok else "error")
+        ACCOUNT_SECONDS.observe(duration, project=project_name)
+
     def _mark_activity(self):
         self.last_action_time = time.time()
 
+    def get_setting(self, key, default=None):
+        """Чтение настройки из локального кэша (Redis трогаем только при первой/плановой загрузке)"""
+        if self.running and self.settings.is_stale():
+            try:
+                self.settings.load(self.reader)
+            except Exception as e:
+                if DEBUG_MODE: print(f"Settings load error: {e}")
+        return self.settings.get(key, default)
+
     def add_temp_error(self, project_name, wallet_address, log_string):
+        """Вызывается из логгера на каждую ошибку - только память, без Redis"""
         if not self.running: return
         self._mark_activity()
-        key = f"temp_errors:{project_name}:{wallet_address}"
-        self.writer.rpush(key, log_string)
-        self.writer.expire(key, 86400)
+        key = (project_name, wallet_address)
+        with self._temp_lock:
+            ring = self._temp_errors.get(key)
+            if ring is None:
+                ring = self._temp_errors[key] = deque(maxlen=TEMP_ERRORS_PER_WALLET)
+                if len(self._temp_errors) > TEMP_ERRORS_WALLETS:
+                    self._temp_errors.popitem(last=False)
+            else:
+                self._temp_errors.move_to_end(key)
+            ring.append(log_string)
 
     def clear_temp_errors(self, project_name, wallet_address):
         if not self.running: return
         self._mark_activity()
-        key = f"temp_errors:{project_name}:{wallet_address}"
-        self.writer.delete(key)
+        with self._temp_lock:
+            self._temp_errors.pop((project_name, wallet_address), None)
 
     def flush_temp_errors(self, project_name, wallet_address, fallback_error=None):
         if not self.running: return "No Redis", []
         self._mark_activity()
 
-        temp_key = f"temp_errors:{project_name}:{wallet_address}"
-        logs = self.writer.lrange(temp_key, 0, -1)
-        self.writer.delete(temp_key)
+        with self._temp_lock:
+            ring = self._temp_errors.pop((project_name, wallet_address), None)
+        logs = list(ring) if ring else []
 
         if not logs and fallback_error:
             timestamp = datetime.now().strftime("%H:%M:%S")
             logs.append(f"{timestamp} | ERROR | System | {fallback_error}")
 
-        self.writer.sadd(f"failures:{project_name}:{self.worker_name}", wallet_address)
+        failures_key = f"failures:{project_name}:{self.worker_name}"
+        failed_at = time.time()
+        logs_json = json.dumps(logs, ensure_ascii=False)
+
+        def queue_failure(pipe):
+            # Упавшие кошельки - sorted set со временем падения (бот листает страницами, свежие сверху)
+            pipe.zadd(failures_key, {wallet_address: failed_at})
+            pipe.hset(f"fail_logs:{project_name}:{self.worker_name}", wallet_address, logs_json)
+            # Индекс short_id -> кошелек (бот открывает лог одного кошелька без перебора всего хэша)
+            pipe.hset(f"fail_ids:{project_name}:{self.worker_name}", short_wallet_id(wallet_address), wallet_address)
+
+        def failure_done(results):
+            if results and isinstance(results[0], redis.ResponseError) and "WRONGTYPE" in str(results[0]):
+                self._migrate_failures_set(failures_key)
+                self.writer.zadd(failures_key, {wallet_address: failed_at})
 
-        self.writer.hset(
-            f"fail_logs:{project_name}:{self.worker_name}",
-            wallet_address,
-            json.dumps(logs, ensure_ascii=False)
-        )
+        self.sender.submit(queue_failure, done=failure_done, priority=PRIORITY_KEEP)
 
         if logs:
             last_log = logs[-1]
@@ -167,6 +262,16 @@ class BotLink:
 
         return short_msg
 
+    def _migrate_failures_set(self, failures_key):
+        """Старый формат failures:* (обычный set) -> sorted set. Время падения неизвестно - ставим 0."""
+        if self.writer.type(failures_key) != "set": return  # уже перевели (несколько падений в одной пачке)
+        old_members = self.writer.smembers(failures_key)
+        pipe = self.writer.pipeline(transaction=True)
+        pipe.delete(failures_key)
+        if old_members:
+            pipe.zadd(failures_key, {w: 0 for w in old_members})
+        pipe.execute()
+
     # === СБОР СТАТИСТИКИ ===
     def _extract_stats(self):
         if not self.active_client: return None
@@ -184,26 +289,30 @@ class BotLink:
             except:
                 pass
 
-        progress_str = ""
+        progress = ""
         if self.progress_callback:
             try:
-                progress_str = self.progress_callback()
+                progress = self.progress_callback()
             except:
                 pass
 
         status = "Working 🟢"
 
+        # Статус v2: числовые поля + инвентарь отдельно (см. status_store.py)
         data = {
             "status": status,
             "current_account": getattr(c, 'address', 'Unknown'),
             "last_updated": time.time(),
             # 🔥 ВАЖНО: Мы сообщаем боту, какой у нас порог пульса
-            "heartbeat_threshold": HEARTBEAT_THRESHOLD,
-            "pos_current": getattr(c, 'position', 0),
-            "pos_total": getattr(c, 'total_accounts', 0),
-            "progress": progress_str
+            "heartbeat": HEARTBEAT_THRESHOLD,
+            "position": getattr(c, 'position', 0),
+            "total": getattr(c, 'total_accounts', 0),
+            "inv": extra_stats or {}
         }
-        data.update(extra_stats)
+        if isinstance(progress, dict):
+            data.update(progress)
+        elif progress:
+            data["progress"] = progress  # старый колбэк со строкой - разберет normalize_status
         return data
 
     def _send_log(self):
@@ -213,46 +322,79 @@ class BotLink:
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             log_path = os.path.join(base_dir, "app.log")
 
-            text = ""
+            payload = {"type": "log_delivery", "project": self.project_name, "worker": self.worker_name,
+                       "ts": time.time()}
             if os.path.exists(log_path):
-                with open(log_path, "r", encoding="utf-8", errors='replace') as f:
-                    f.seek(0, os.SEEK_END)
-                    seek_pos = max(0, f.tell() - 30000)
-                    f.seek(seek_pos)
-                    text = f"📂 ...Last 30KB of app.log:\n\n" + f.read()
+                # Сам лог - сжатым блобом в Redis, в алерт только ссылка на него
+                max_bytes = getattr(config, 'LOG_TAIL_BYTES', DEFAULT_LOG_TAIL)
+                payload.update(upload_log_tail(self.writer, log_path, max_bytes))
+                payload["text"] = f"Last {payload['size'] / 1024:.0f} KB of app.log"
             else:
-                text = f"❌ Log file not found at: {log_path}"
-
-            self.writer.publish("telegram_alerts", json.dumps({
-                "type": "log_delivery",
-                "project": self.project_name,
-                "worker": self.worker_name,
-                "text": text
-            }))
+                payload["text"] = f"❌ Log file not found at: {log_path}"
+
+            push_alert(self.writer, payload)
         except Exception as e:
             self.send_notification("error", f"Log Error: {e}")
 
+    def _search_log(self, cmd):
+        """Команда search_log: ищем по app.log здесь, боту уходят только совпавшие строки"""
+        try:
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            query = LogQuery(wallet=cmd.get("wallet"), level=cmd.get("level"), module=cmd.get("module"),
+                             regex=cmd.get("regex"))
+            limit = min(int(cmd.get("limit") or SEARCH_LIMIT), SEARCH_LIMIT)
+            budget = min(float(cmd.get("budget") or SEARCH_BUDGET), SEARCH_BUDGET)
+            result = search_log(os.path.join(base_dir, "app.log"), query, limit, budget)
+            result["ok"] = True
+        except Exception as e:  # в т.ч. кривой regex
+            result = {"ok": False, "error": str(e)}
+        send_reply(self.writer, cmd, result)
+
     def send_notification(self, type_, text, project_override=None):
+        """Ставит уведомление в очередь фоновой отправки (XADD - в потоке BotSender, прямая отправка - в BotDirect)"""
         if not self.running: return
         self._mark_activity()
 
         proj = project_override if project_override else self.project_name
         try:
-            if self.writer.get("settings:mute_all") == "1": return
-            if self.writer.get(f"settings:mute:{proj}") == "1": return
-
-            payload = {
-                "type": type_, "project": proj, "worker": self.worker_name, "text": text
-            }
-            json_data = json.dumps(payload)
-            listeners_count = self.writer.publish("telegram_alerts", json_data)
-
-            if listeners_count == 0:
-                self._fallback_send_direct(type_, proj, text)
+            self.get_setting("settings:mute_all")  # подгружает кэш, если он устарел
+            if self.settings.is_muted(proj):
+                NOTIFICATIONS_TOTAL.inc(type=type_, route="muted")
+                return
         except Exception as e:
-            if DEBUG_MODE: print(f"Send error: {e}")
+            if DEBUG_MODE: print(f"Settings error: {e}")
 
-    def _fallback_send_direct(self, type_, project, text):
+        payload = {
+            "type": type_, "project": proj, "worker": self.worker_name, "text": text,
+            "ts": time.time()  # для замера задержки на стороне бота
+        }
+        self.sender.submit(lambda pipe: push_alert(pipe, payload),
+                           done=lambda results: self._notification_done(type_, proj, text, results),
+                           priority=PRIORITY_KEEP if type_ == "worker_finished" else PRIORITY_NORMAL)
+
+    def _notification_done(self, type_, proj, text, results):
+        # results[0] - id записи в потоке; None - бот не запущен (или Redis недоступен) -> напрямую в Telegram
+        if results and results[0] is not None and not isinstance(results[0], Exception):
+            NOTIFICATIONS_TOTAL.inc(type=type_, route="stream")
+            return
+        if DEBUG_MODE and results: print(f"Send error: {results[0]}")
+        # Колбэк выполняется в потоке BotSender: HTTP до Telegram (до 5 сек) здесь задержал бы всю очередь
+        if not self._direct_slots.acquire(blocking=False):
+            NOTIFICATIONS_TOTAL.inc(type=type_, route="dropped")
+            return
+        NOTIFICATIONS_TOTAL.inc(type=type_, route="direct")
+        try:
+            future = self.direct_pool.submit(self._fallback_send_direct, type_, proj, text)
+        except RuntimeError:
+            # Выход процесса: пул остановлен раньше atexit-дописывания очереди - шлем сами, с коротким таймаутом
+            try:
+                self._fallback_send_direct(type_, proj, text, timeout=DIRECT_EXIT_TIMEOUT)
+            finally:
+                self._direct_slots.release()
+            return
+        future.add_done_callback(lambda _: self._direct_slots.release())
+
+    def _fallback_send_direct(self, type_, project, text, timeout=5):
         try:
             token = getattr(config, 'TG_BOT_TOKEN', None)
             uid = getattr(config, 'TG_USER_ID', None)
@@ -267,34 +409,53 @@ class BotLink:
             requests.post(
                 f"https://api.telegram.org/bot{token}/sendMessage",
                 json={"chat_id": uid, "text": msg, "parse_mode": "HTML"},
-                timeout=5
+                timeout=timeout
             )
         except:
             pass
 
     def _listener_loop(self):
-        channel = f"cmd:{self.project_name}:{self.worker_name}"
+        channel = command_channel(self.project_name, self.worker_name)
         try:
-            self.pubsub.subscribe(channel)
+            self.pubsub.subscribe(channel, SETTINGS_CHANNEL)
         except:
             return
+        # Грузим настройки уже после подписки, чтобы не пропустить изменения между ними.
+        # Не загрузились - слушаем команды дальше, get_setting догрузит кэш сам (loaded_at остался 0)
+        try:
+            self.settings.load(self.reader)
+        except Exception as e:
+            print(f"⚠️ [BotLink] Settings load error: {e}")
 
         while self.running:
             try:
                 msg = self.pubsub.get_message(timeout=1)
                 if msg and msg['type'] == 'message':
                     data = msg['data']
-                    if data == "get_log":
-                        threading.Thread(target=self._send_log).start()
-                    elif data == "update_status":
-                        stats = self._extract_stats()
-                        if stats:
-                            self.writer.hset(f"status:{self.project_name}", self.worker_name, json.dumps(stats))
-                            self._mark_activity()
+                    if msg['channel'] == SETTINGS_CHANNEL:
+                        if self.settings.apply_message(data):
+                            self.settings.load(self.reader)
+                    else:
+                        self._handle_command(parse_command(data))
             except:
                 time.sleep(1)
             time.sleep(0.1)
 
+    def _handle_command(self, cmd):
+        name = cmd.get("cmd")
+        if name == "get_log":
+            threading.Thread(target=self._send_log).start()
+        elif name == "search_log":
+            threading.Thread(target=self._search_log, args=(cmd,), daemon=True).start()
+        elif name == "update_status":
+            stats = self._extract_stats()
+            status = None
+            if stats:
+                status = write_status(self.writer, self.project_name, self.worker_name, stats, sample=(0, 0, 0))
+                self._mark_activity()
+            # Бот ждет именно этот ответ (по id) вместо фиксированной паузы
+            send_reply(self.writer, cmd, {"ok": status is not None, "status": status})
+
     def _heartbeat_loop(self):
         while self.running:
             if not ENABLE_HEARTBEAT:
@@ -309,7 +470,8 @@ class BotLink:
                     if self.project_name != "UnknownProject" and self.active_client:
                         stats = self._extract_stats()
                         if stats:
-                            self.writer.hset(f"status:{self.project_name}", self.worker_name, json.dumps(stats))
+                            # Нулевая точка в time-series: воркер жив, но аккаунтов не закрывал
+                            write_status(self.writer, self.project_name, self.worker_name, stats, sample=(0, 0, 0))
                             self._mark_activity()
             except Exception:
                 pass
@@ -0,0 +1,98 @@
+# modules/perf.py
+"""
+Профилирование хендлеров дашборда (для /perf).
+
+На время хендлера в contextvar кладется счетчик HandlerIO: Redis-клиент и сессия Telegram
+дописывают туда свои вызовы/байты/время. После хендлера замер уходит в кольцо PerfRing -
+по PERF_RING_SIZE последних замеров на хендлер, так что память ограничена.
+"""
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+
+PERF_RING_SIZE = 200  # замеров на один хендлер
+
+current_io = contextvars.ContextVar("handler_io", default=None)
+
+
+class HandlerIO:
+    __slots__ = ("redis_calls", "redis_bytes", "redis_time", "tg_calls", "tg_time")
+
+    def __init__(self):
+        self.redis_calls = 0
+        self.redis_bytes = 0
+        self.redis_time = 0.0
+        self.tg_calls = 0
+        self.tg_time = 0.0
+
+
+def approx_size(value) -> int:
+    """Грубый размер ответа Redis в байтах (строки считаем по символам)"""
+    if value is None: return 0
+    if isinstance(value, (str, bytes, bytearray)): return len(value)
+    if isinstance(value, dict): return sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)): return sum(approx_size(v) for v in value)
+    return 8
+
+
+def track_redis(calls: int, elapsed: float, args=(), result=None):
+    io = current_io.get()
+    if io is None: return
+    io.redis_calls += calls
+    io.redis_time += elapsed
+    io.redis_bytes += sum(approx_size(a) for a in args) + approx_size(result)
+
+
+def track_telegram(elapsed: float):
+    io = current_io.get()
+    if io is None: return
+    io.tg_calls += 1
+    io.tg_time += elapsed
+
+
+def percentile(sorted_values: list, q: float):
+    if not sorted_values: return 0.0
+    idx = max(0, math.ceil(q * len(sorted_values)) - 1)
+    return sorted_values[idx]
+
+
+class PerfRing:
+    def __init__(self, size: int = PERF_RING_SIZE):
+        self.size = size
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration: float, io: HandlerIO):
+        sample = (duration, io.redis_calls, io.redis_bytes, io.redis_time, io.tg_calls, io.tg_time, time.time())
+        with self._lock:
+            ring = self._rings.get(name)
+            if ring is None:
+                ring = self._rings[name] = deque(maxlen=self.size)
+            ring.append(sample)
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+
+    def summary(self) -> list:
+        """[{name, count, p50, p95, p99, redis_calls, redis_kb, redis_ms, tg_ms}], самые медленные (p95) сверху"""
+        with self._lock:
+            rings = {name: list(ring) for name, ring in self._rings.items()}
+        rows = []
+        for name, samples in rings.items():
+            n = len(samples)
+            durations = sorted(s[0] for s in samples)
+            rows.append({
+                "name": name, "count": n,
+                "p50": percentile(durations, 0.50),
+                "p95": percentile(durations, 0.95),
+                "p99": percentile(durations, 0.99),
+                "redis_calls": sum(s[1] for s in samples) / n,
+                "redis_kb": sum(s[2] for s in samples) / n / 1024,
+                "redis_ms": sum(s[3] for s in samples) / n * 1000,
+                "tg_ms": sum(s[5] for s in samples) / n * 1000,
+            })
+        rows.sort(key=lambda row: row["p95"], reverse=True)
+        return rows
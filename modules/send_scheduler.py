@@ -0,0 +1,288 @@
+# modules/send_scheduler.py
+"""
+Очередь исходящих сообщений бота в Telegram.
+
+Алерты не отправляются прямо из слушателя - они кладутся в очередь (submit), а одна фоновая
+задача (run) отправляет их с учетом лимитов Telegram:
+    * token bucket на каждый чат и общий на бота (не ловим 429 на всплесках);
+    * полосы приоритета: ошибки и завершения уходят раньше успехов;
+    * 429 (retry_after) - чат замораживается на указанное время, сообщение остается первым в очереди;
+    * всплеск алертов одного типа от одного воркера склеивается в дайджест: первый уходит сразу,
+      следующие в пределах окна копятся и уходят одним сообщением "×N".
+Объем памяти ограничен: max_pending записей в очереди и DIGEST_MAX_ITEMS текстов в одном дайджесте.
+
+К алерту можно привязать ref (id записи в потоке алертов) - когда сообщение отправлено или
+окончательно отброшено, все его ref уходят в on_done (бот по ним делает XACK).
+Отброшенные из-за переполнения очереди уходят в on_drop (если задан) - их не подтверждают:
+запись остается в потоке и будет прочитана снова, когда место появится.
+"""
+import asyncio
+import html
+import itertools
+import re
+import time
+from collections import OrderedDict
+
+# Полосы: меньше - раньше
+LANE_URGENT, LANE_NORMAL, LANE_LOW = 0, 1, 2
+TYPE_LANES = {
+    "error": LANE_URGENT,
+    "worker_finished": LANE_URGENT,
+    "worker_silent": LANE_URGENT,
+    "worker_recovered": LANE_NORMAL,
+    "log_delivery": LANE_NORMAL,
+    "success": LANE_LOW,
+}
+
+DIGEST_MAX_ITEMS = 50  # текстов в одном дайджесте, остальные только считаем
+MAX_ATTEMPTS = 5  # попыток на сетевые ошибки (429 не считается)
+TG_TEXT_LIMIT = 4096
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд можно отправить (0 - уже можно)"""
+        if now < self.blocked_until: return self.blocked_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float):
+        """retry_after от Telegram: до конца паузы ничего, после - без накопленного запаса"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = self.blocked_until
+
+
+class Outgoing:
+    __slots__ = ("key", "chat_id", "lane", "data", "texts", "count", "ready_at", "attempts", "refs")
+
+    def __init__(self, key, chat_id, lane: int, data: dict, ready_at: float, ref=None):
+        self.key = key
+        self.chat_id = chat_id
+        self.lane = lane
+        self.data = data
+        self.texts = [data.get("text") or ""]
+        self.count = 1
+        self.ready_at = ready_at
+        self.attempts = 0
+        self.refs = [ref] if ref is not None else []
+
+    def merge(self, other: "Outgoing"):
+        room = DIGEST_MAX_ITEMS - len(self.texts)
+        if room > 0: self.texts.extend(other.texts[:room])
+        self.count += other.count
+        self.refs.extend(other.refs)
+
+
+def clip_html(text: str, limit: int) -> str:
+    """Обрезает HTML-текст до limit символов. Теги снимаем: обрезка посреди <pre> сломала бы разметку."""
+    if len(text) <= limit: return text
+    plain = html.unescape(re.sub(r"<[^>]*>", "", text))
+    cut = limit - 1
+    while True:
+        clipped = html.escape(plain[:cut], quote=False) + "…"
+        if len(clipped) <= limit or cut <= 0: return clipped
+        # &amp; и т.п. длиннее исходного символа - уменьшаем пропорционально
+        cut = min(cut - 1, cut * (limit - 1) // (len(clipped) - 1))
+
+
+def digest_text(texts: list, count: int, limit: int) -> str:
+    """Склеивает тексты дайджеста целыми кусками, не вылезая за limit символов (первый - обрезается)"""
+    first = clip_html(texts[0], limit - 40 if count > 1 else limit)  # 40 - запас под "и еще N"
+    parts = [first]
+    used = len(first)
+    for text in texts[1:]:
+        if used + len(text) + 40 > limit: break  # 40 - запас под разделитель и "и еще N"
+        parts.append(text)
+        used += len(text) + 3
+    rest = count - len(parts)
+    body = "\n—\n".join(parts)
+    if rest > 0: body += f"\n\n… и еще {rest}"
+    return body
+
+
+class SendScheduler:
+    """
+    send(chat_id, data, texts, count) - корутина, которая реально отправляет сообщение.
+    Ошибки с атрибутом retry_after (TelegramRetryAfter) замораживают чат, ошибки из retry_on
+    повторяются с экспоненциальной паузой, остальные - сообщение отбрасывается.
+    on_done(refs) - синхронный колбэк, когда записи больше не нужны (отправлены/отброшены).
+    on_drop(refs) - синхронный колбэк для вытесненных из-за переполнения (по умолчанию - тот же on_done).
+    """
+
+    def __init__(self, send, global_rate: float = 25, chat_rate: float = 1, chat_burst: float = 3,
+                 digest_window: float = 30, max_pending: int = 500, retry_on=(), on_done=None,
+                 on_drop=None, clock=time.monotonic):
+        self._send = send
+        self._on_done = on_done
+        self._on_drop = on_drop if on_drop is not None else on_done
+        self._clock = clock
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.digest_window = digest_window
+        self.max_pending = max_pending
+        self.retry_on = tuple(retry_on)
+        self._lanes = [OrderedDict() for _ in range(LANE_LOW + 1)]  # ключ -> Outgoing
+        self._last_sent = {}  # ключ дайджеста -> когда ушло последнее сообщение
+        self._chats = {}
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.stats = {"queued": 0, "sent": 0, "merged": 0, "retried": 0, "failed": 0, "dropped": 0}
+
+    def pending(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self._clock())
+        return bucket
+
+    def _done(self, entry: Outgoing):
+        if self._on_done is not None and entry.refs: self._on_done(entry.refs)
+
+    def _dropped(self, entry: Outgoing):
+        if self._on_drop is not None and entry.refs: self._on_drop(entry.refs)
+
+    def room(self) -> int:
+        """Сколько новых записей поместится без вытеснения"""
+        return max(0, self.max_pending - self.pending())
+
+    def submit(self, chat_id, data: dict, coalesce: bool = True, ref=None) -> bool:
+        """Кладет алерт в очередь. False - очередь переполнена и алерт отброшен."""
+        now = self._clock()
+        msg_type = data.get("type", "info")
+        lane = TYPE_LANES.get(msg_type, LANE_LOW)
+        if coalesce:
+            key = (chat_id, msg_type, data.get("project"), data.get("worker"))
+        else:
+            key = (chat_id, msg_type, "#", next(self._seq))
+        self.stats["queued"] += 1
+
+        entry = Outgoing(key, chat_id, lane, data, now, ref)
+        existing = self._lanes[lane].get(key)
+        if existing is not None:
+            existing.merge(entry)
+            self.stats["merged"] += 1
+            return True
+
+        if self.pending() >= self.max_pending and not self._evict(lane):
+            self.stats["dropped"] += 1
+            self._dropped(entry)
+            return False
+
+        # Свежая отправка по этому ключу - копим дайджест до конца окна
+        last = self._last_sent.get(key)
+        if coalesce and last is not None and now - last < self.digest_window:
+            entry.ready_at = last + self.digest_window
+
+        self._lanes[lane][key] = entry
+        self._idle.clear()
+        self._wakeup.set()
+        return True
+
+    def _evict(self, lane: int) -> bool:
+        """Освобождает место, выкидывая самое старое из полосы ниже приоритетом (или той же)"""
+        for victim_lane in range(LANE_LOW, lane - 1, -1):
+            if self._lanes[victim_lane]:
+                _, victim = self._lanes[victim_lane].popitem(last=False)
+                self.stats["dropped"] += victim.count
+                self._dropped(victim)
+                return True
+        return False
+
+    def _requeue(self, entry: Outgoing):
+        lane = self._lanes[entry.lane]
+        existing = lane.pop(entry.key, None)
+        if existing is not None: entry.merge(existing)
+        lane[entry.key] = entry
+        lane.move_to_end(entry.key, last=False)
+
+    def _next(self, now: float):
+        """(запись, 0) - можно отправлять; (None, сек) - ждать; (None, None) - очередь пуста"""
+        if not self.pending(): return None, None
+        wait = self._global.wait_time(now)
+        if wait > 0: return None, wait
+        wait = None
+        for lane in self._lanes:
+            for entry in lane.values():
+                delay = max(entry.ready_at - now, self._bucket(entry.chat_id).wait_time(now))
+                if delay <= 0: return entry, 0
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _prune(self, now: float):
+        if len(self._last_sent) < 1000: return
+        self._last_sent = {k: ts for k, ts in self._last_sent.items() if now - ts < self.digest_window}
+
+    async def run(self):
+        while True:
+            now = self._clock()
+            entry, wait = self._next(now)
+            if entry is None:
+                if wait is None: self._idle.set()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            del self._lanes[entry.lane][entry.key]
+            self._global.take(now)
+            self._bucket(entry.chat_id).take(now)
+            try:
+                await self._send(entry.chat_id, entry.data, entry.texts, entry.count)
+            except asyncio.CancelledError:
+                self._requeue(entry)
+                raise
+            except Exception as e:
+                now = self._clock()
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is not None:
+                    self.stats["retried"] += 1
+                    self._bucket(entry.chat_id).block(now, float(retry_after))
+                    self._requeue(entry)
+                elif isinstance(e, self.retry_on) and entry.attempts + 1 < MAX_ATTEMPTS:
+                    self.stats["retried"] += 1
+                    entry.attempts += 1
+                    entry.ready_at = now + 2 ** entry.attempts
+                    self._requeue(entry)
+                else:
+                    self.stats["failed"] += entry.count
+                    self._done(entry)
+                    print(f"Send Error ({entry.data.get('type')}): {e}")
+                continue
+
+            self.stats["sent"] += 1
+            self._done(entry)
+            self._last_sent[entry.key] = self._clock()
+            self._prune(now)
+
+    async def drain(self, timeout: float):
+        """Ждет, пока очередь опустеет (при остановке бота), но не дольше timeout. Дайджесты не ждут окна."""
+        for lane in self._lanes:
+            for entry in lane.values(): entry.ready_at = 0.0
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,208 @@
+# modules/sender.py
+"""
+Фоновая отправка в Redis для воркера: аккаунт только кладет операцию в очередь,
+а поток BotSender забирает всё накопившееся и отправляет одним пайплайном.
+
+    sender.submit(lambda pipe: queue_status(pipe, ...), priority=PRIORITY_STATUS)    # записать статус
+    sender.submit(lambda pipe: pipe.eval(...), done=lambda res: ...)                # + разобрать ответ
+    sender.submit(lambda pipe: queue_inventory(...), priority=PRIORITY_KEEP, atomic=True)
+
+queue_fn(pipe) ставит команды в пайплайн, done(results) получает ответы именно этих команд
+(уже в потоке отправки - колбэк должен быть быстрым, медленное вроде HTTP отдавайте в свой поток).
+results=None - Redis недоступен или операция отброшена при переполнении.
+Пачка уходит пайплайном и при сетевой ошибке отправляется заново - это годится только для
+идемпотентных операций (HSET, ZADD, EVAL со сбросом вклада). atomic=True - неидемпотентные
+(HINCRBYFLOAT лута, счетчики скорости): пачка с такими операциями уходит одним MULTI/EXEC,
+и после обрыва повторяются только идемпотентные - неизвестно, дошел ли EXEC, и лучше потерять
+прибавку, чем посчитать ее дважды. Порядок операций сохраняется.
+
+Очередь ограничена, при переполнении действует политика:
+    drop_oldest - выкинуть самую старую операцию (по умолчанию: аккаунты не ждут Redis)
+    drop_new    - не принимать новую
+    block       - ждать места (до SUBMIT_TIMEOUT), потом как drop_new
+Выкидываются только операции с priority ниже PRIORITY_KEEP, сначала PRIORITY_STATUS, потом
+уведомления. PRIORITY_STATUS - только для чистой перезаписи, которую все равно перезапишет
+следующий статус; приращения так не отправляйте - потерянное уже не восстановится.
+PRIORITY_KEEP (лут, упавшие кошельки, завершение воркера) при полной очереди встает сверх
+maxsize, но не больше чем на keep_reserve операций - дальше ждет места до SUBMIT_TIMEOUT
+и только потом отбрасывается.
+При выходе из процесса (atexit) очередь дописывается, но не дольше flush_timeout.
+"""
+import atexit
+from collections import deque
+import threading
+import time
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_new", "block")
+SEND_BATCH = 100  # операций на один пайплайн
+SEND_RETRIES = 3  # попыток на пачку при сетевой ошибке
+SUBMIT_TIMEOUT = 5.0  # сек ожидания места в очереди (политика block и PRIORITY_KEEP сверх запаса)
+
+# Порядок выкидывания при переполнении: меньше - раньше
+PRIORITY_STATUS, PRIORITY_NORMAL, PRIORITY_KEEP = 0, 1, 2
+
+
+class BackgroundSender:
+    def __init__(self, client, maxsize: int = 1000, overflow: str = "drop_oldest", flush_timeout: float = 10.0,
+                 on_event=None, keep_reserve: int = None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow: ожидалось одно из {OVERFLOW_POLICIES}, получено {overflow!r}")
+        self.client = client
+        self.overflow = overflow
+        self.flush_timeout = flush_timeout
+        self.on_event = on_event  # on_event(event, count) - для метрик (queued / sent / dropped / failed)
+        self.maxsize = maxsize
+        self.keep_reserve = maxsize if keep_reserve is None else keep_reserve  # места сверх maxsize для KEEP
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._unfinished = 0  # в очереди + в отправке, для flush
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def _event(self, event: str, count: int = 1):
+        if self.on_event is not None: self.on_event(event, count)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="BotSender")
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _limit(self, priority: int) -> int:
+        return self.maxsize + (self.keep_reserve if priority >= PRIORITY_KEEP else 0)
+
+    def _has_room(self, priority: int) -> bool:
+        return len(self._items) < self._limit(priority)
+
+    def _evict(self, priority: int) -> bool:
+        """Выкидывает самую старую операцию с наименьшим priority, но не важнее новой. Под self._cond."""
+        victim = None
+        for i, queued in enumerate(self._items):
+            if queued[2] < PRIORITY_KEEP and queued[2] <= priority and \
+                    (victim is None or queued[2] < self._items[victim][2]):
+                victim = i
+                if queued[2] == PRIORITY_STATUS: break
+        if victim is None: return None
+        evicted = self._items[victim]
+        del self._items[victim]
+        self._unfinished -= 1
+        return evicted
+
+    def submit(self, queue_fn, done=None, priority: int = PRIORITY_NORMAL, atomic: bool = False) -> bool:
+        """Кладет операцию в очередь. False - операция отброшена из-за переполнения."""
+        item = (queue_fn, done, priority, atomic)
+        evicted = None
+        with self._cond:
+            # Выкидываем, только если это освободит место (сверх maxsize очередь держат KEEP-операции)
+            if self.overflow == "drop_oldest" and len(self._items) == self._limit(priority):
+                evicted = self._evict(priority)
+            if not self._has_room(priority) and (self.overflow == "block" or priority >= PRIORITY_KEEP):
+                self._cond.wait_for(lambda: self._has_room(priority), timeout=SUBMIT_TIMEOUT)
+            accepted = self._has_room(priority)
+            if accepted:
+                self._items.append(item)
+                self._unfinished += 1
+                self._cond.notify_all()
+        if evicted is not None: self._drop(evicted)
+        if not accepted:
+            if priority >= PRIORITY_KEEP:
+                print(f"⚠️ [BotSender] Queue overflow, important operation dropped ({len(self._items)} queued)")
+            self._drop(item)
+            return False
+        self._event("queued")
+        return True
+
+    def _drop(self, item):
+        # Отброшенная операция для done неотличима от потерянной - пусть отработает запасной путь
+        self._event("dropped")
+        done = item[1]
+        if done is None: return
+        try:
+            done(None)
+        except Exception as e:
+            print(f"⚠️ [BotSender] Callback error: {e}")
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            self._cond.wait_for(lambda: self._items)
+            batch = [self._items.popleft() for _ in range(min(SEND_BATCH, len(self._items)))]
+            self._cond.notify_all()  # место освободилось - будим ждущих submit
+        return batch
+
+    def _task_done(self, count: int):
+        with self._cond:
+            self._unfinished -= count
+            self._cond.notify_all()
+
+    def _build(self, batch: list, transaction: bool = False):
+        pipe = self.client.pipeline(transaction=transaction)
+        spans = []
+        for queue_fn, done, _priority, _atomic in batch:
+            start = len(pipe)
+            try:
+                queue_fn(pipe)
+            except Exception as e:
+                print(f"⚠️ [BotSender] Bad operation: {e}")
+            spans.append((start, len(pipe), done))
+        return pipe, spans
+
+    def _execute(self, batch: list, transaction: bool):
+        pipe, spans = self._build(batch, transaction=transaction)
+        try:
+            return spans, (pipe.execute(raise_on_error=False) if len(pipe) else []), None
+        except Exception as e:
+            return spans, None, e
+
+    def _finish(self, spans: list, results, error):
+        if error is None:
+            self._event("sent", len(spans))
+        else:
+            self._event("failed", len(spans))
+            print(f"⚠️ [BotSender] Redis unavailable, {len(spans)} operation(s) lost: {error}")
+        for start, end, done in spans:
+            if done is None: continue
+            try:
+                done(None if error is not None else results[start:end])
+            except Exception as e:
+                print(f"⚠️ [BotSender] Callback error: {e}")
+
+    def _send_batch(self, batch: list):
+        attempt = 0
+        if any(item[3] for item in batch):
+            # Есть atomic-операции: вся пачка одним MULTI/EXEC (порядок сохраняется, пайплайн один).
+            # После обрыва atomic теряем, а идемпотентные повторяем отдельно
+            spans, results, error = self._execute(batch, transaction=True)
+            if error is None:
+                self._finish(spans, results, None)
+                return
+            self._finish([span for item, span in zip(batch, spans) if item[3]], None, error)
+            batch = [item for item in batch if not item[3]]
+            if not batch: return
+            attempt = 1
+            time.sleep(0.5)
+        while True:
+            # Пайплайн после execute пустой - на повтор собираем заново
+            spans, results, error = self._execute(batch, transaction=False)
+            attempt += 1
+            if error is None or attempt >= SEND_RETRIES: break
+            time.sleep(0.5 * 2 ** (attempt - 1))
+        self._finish(spans, results, error)
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self._send_batch(batch)
+            finally:
+                self._task_done(len(batch))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Ждет, пока очередь отправится (atexit). False - не успели за timeout."""
+        if self._thread is None: return self._unfinished == 0
+        with self._cond:
+            return self._cond.wait_for(lambda: self._unfinished == 0,
+                                       timeout=self.flush_timeout if timeout is None else timeout)
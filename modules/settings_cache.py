@@ -0,0 +1,133 @@
+# modules/settings_cache.py
+import json
+import threading
+import time
+
+# Канал, в который бот (дашборд) шлет изменения настроек
+SETTINGS_CHANNEL = "settings_changed"
+# Все настройки - один hash {"settings:mute_all": "1", ...}: загрузка = один HGETALL, без SCAN по базе
+SETTINGS_KEY = "settings"
+# Старый формат - по строковому ключу на настройку. Бот пишет и его (для воркеров старых версий)
+# и при первом запуске переносит в hash (migrate_legacy_settings)
+SETTINGS_PATTERN = "settings:*"
+
+# Раз в сколько секунд кэш все равно перечитывается целиком (страховка от потерянных сообщений)
+SETTINGS_MAX_AGE = 300
+
+
+def make_change_message(changes: dict) -> str:
+    """changes: {key: value}, value=None значит ключ удален"""
+    return json.dumps({"changes": changes}, ensure_ascii=False)
+
+
+def make_reload_message() -> str:
+    return json.dumps({"reload": True})
+
+
+def queue_settings(pipe, changes: dict):
+    """Ставит изменения в пайплайн: hash + строковые ключи старого формата (value=None - удалить)"""
+    for key, value in changes.items():
+        if value is None:
+            pipe.hdel(SETTINGS_KEY, key)
+            pipe.delete(key)
+        else:
+            pipe.hset(SETTINGS_KEY, key, value)
+            pipe.set(key, value)
+
+
+async def migrate_legacy_settings(client, force: bool = False) -> int:
+    """
+    Собирает строковые settings:* в hash (async-клиент, только бот - SCAN по базе делается здесь один раз).
+    Без force - только если hash еще нет; force - после восстановления бэкапа (старые бэкапы без hash).
+    """
+    if not force and await client.exists(SETTINGS_KEY): return 0
+    keys = [k async for k in client.scan_iter(match=SETTINGS_PATTERN, count=500)]
+    values = await client.mget(keys) if keys else []
+    data = {k: v for k, v in zip(keys, values) if v is not None}
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.delete(SETTINGS_KEY)
+        if data: pipe.hset(SETTINGS_KEY, mapping=data)
+        await pipe.execute()
+    return len(data)
+
+
+class SettingsCache:
+    """
+    Локальная копия всех настроек.
+    Один раз грузится (HGETALL settings), дальше все чтения идут из памяти.
+    Обновляется по сообщениям из канала settings_changed.
+    Общий для бота (async-клиент, aload) и воркеров (sync-клиент, load).
+    """
+
+    def __init__(self, max_age: float = SETTINGS_MAX_AGE):
+        self._data = {}
+        self._lock = threading.Lock()
+        self.max_age = max_age
+        self.loaded_at = 0.0
+
+    # === ЗАГРУЗКА ===
+    def load(self, client):
+        self._replace(client.hgetall(SETTINGS_KEY))
+
+    async def aload(self, client):
+        self._replace(await client.hgetall(SETTINGS_KEY))
+
+    def _replace(self, data: dict):
+        with self._lock:
+            self._data = {k: v for k, v in data.items() if v is not None}
+            self.loaded_at = time.time()
+
+    def is_stale(self) -> bool:
+        return time.time() - self.loaded_at >= self.max_age
+
+    # === ОБНОВЛЕНИЯ ===
+    def apply_changes(self, changes: dict):
+        with self._lock:
+            for key, value in changes.items():
+                if value is None:
+                    self._data.pop(key, None)
+                else:
+                    self._data[key] = str(value)
+
+    def apply_message(self, raw) -> bool:
+        """Применяет сообщение из канала. Возвращает True, если нужна полная перезагрузка."""
+        try:
+            msg = json.loads(raw)
+        except (TypeError, ValueError):
+            return True
+        if msg.get("reload"):
+            return True
+        self.apply_changes(msg.get("changes") or {})
+        return False
+
+    # === ЧТЕНИЕ ===
+    def get(self, key: str, default=None):
+        return self._data.get(key, default)
+
+    def is_muted(self, project_name: str) -> bool:
+        if self.get("settings:mute_all") == "1": return True
+        if self.get(f"settings:mute:{project_name}") == "1": return True
+        return False
+
+    def is_notification_enabled(self, project_name: str, msg_type: str) -> bool:
+        if msg_type == "worker_finished" or msg_type == "log_delivery":
+            return not self.is_muted(project_name)
+
+        if msg_type in ("worker_silent", "worker_recovered"):
+            check_type = "error"  # сторож офлайна - та же категория, что и ошибки
+        elif "log" in msg_type:
+            check_type = "log"
+        elif "error" in msg_type:
+            check_type = "error"
+        elif "success" in msg_type:
+            check_type = "success"
+        else:
+            check_type = "info"
+
+        proj_setting = self.get(f"settings:notify:{project_name}:{check_type}")
+        if proj_setting is not None: return proj_setting == "1"
+
+        global_setting = self.get(f"settings:notify:GLOBAL:{check_type}")
+        if global_setting is not None: return global_setting == "1"
+
+        return True
@@ -1,4 +1,3 @@
-import json
 import threading
 import requests
 import redis
@@ -26,9 +25,15 @@ except ImportError as e:
 # 🔥 ВАЖНО: Импортируем bot_link, чтобы узнавать динамическое имя (--worker)
 # Используем try-except, чтобы избежать циклических импортов, если они возникнут
 try:
-    from .notifications import bot_link
+    from .notifications import bot_link, HEARTBEAT_THRESHOLD
 except ImportError:
     bot_link = None
+    HEARTBEAT_THRESHOLD = None
+
+from .status_store import write_status, queue_status
+from .inventory import add_inventory, queue_inventory, drop_worker_inventory
+from .timeseries import queue_sample
+from .sender import PRIORITY_STATUS, PRIORITY_NORMAL, PRIORITY_KEEP
 
 class StatusManager:
     _instance = None
@@ -58,30 +63,49 @@ class StatusManager:
             print(f"⚠️ [StatusManager] Redis Connection Failed: {e}")
             self._redis = None
 
-    def update_status(self, project_name: str, data: dict):
+    def _sender(self):
+        """Фоновая очередь BotLink (None - пишем сами, синхронно)"""
+        return getattr(bot_link, 'sender', None) if bot_link else None
+
+    def _device_name(self):
+        # 👇 ЛОГИКА ОПРЕДЕЛЕНИЯ ИМЕНИ
+        # 1. Сначала пробуем узнать имя у bot_link (оно там правильное, с учетом флагов запуска)
+        if bot_link and hasattr(bot_link, 'worker_name'):
+            return bot_link.worker_name
+        # 2. Если не вышло - берем стандартное из конфига
+        return getattr(config, 'DEVICE_NAME', getattr(config, 'WORKER_NAME', 'Unknown_Device'))
+
+    def update_status(self, project_name: str, data: dict, sample=None):
         """
         Отправляет статус в Redis.
         Имя воркера берется динамически, если задан аргумент --worker.
+        sample - (done, success, fail) для графика скорости, например (1, 1, 0) после успешного аккаунта.
         """
         if not self._redis: return
 
         try:
-            # 👇 ЛОГИКА ОПРЕДЕЛЕНИЯ ИМЕНИ
-            # 1. Сначала пробуем узнать имя у bot_link (оно там правильное, с учетом флагов запуска)
-            if bot_link and hasattr(bot_link, 'worker_name'):
-                device_name = bot_link.worker_name
-            else:
-                # 2. Если не вышло - берем стандартное из конфига
-                device_name = getattr(config, 'DEVICE_NAME', getattr(config, 'WORKER_NAME', 'Unknown_Device'))
+            device_name = self._device_name()
 
             # Добавляем время последнего обновления
             data["last_updated"] = time.time()
-
-            data_str = json.dumps(data, ensure_ascii=False)
-
-            # Пишем в Redis под правильным (динамическим) именем
-            self._redis.hset(f"status:{project_name}", device_name, data_str)
-            self._redis.expire(f"status:{project_name}", 86400)
+            # И порог пульса, чтобы бот не считал долгие задачи "офлайном"
+            if HEARTBEAT_THRESHOLD and "heartbeat" not in data:
+                data["heartbeat"] = HEARTBEAT_THRESHOLD
+
+            # Пишем в Redis под правильным (динамическим) именем (+ регистрируем проект в реестре).
+            # Через фоновую очередь - аккаунт не ждет ответа Redis
+            sender = self._sender()
+            if sender:
+                sender.submit(lambda pipe: queue_status(pipe, project_name, device_name, data),
+                              priority=PRIORITY_STATUS)
+                if sample is not None:
+                    # Приращения скорости неидемпотентны: отдельно от статуса (его можно выкинуть и повторить),
+                    # одним MULTI без повторов
+                    now = data["last_updated"]
+                    sender.submit(lambda pipe: queue_sample(pipe, project_name, device_name, now, *sample),
+                                  priority=PRIORITY_NORMAL, atomic=True)
+            else:
+                write_status(self._redis, project_name, device_name, data, sample=sample)
 
             if DEBUG_MODE:
                 print(f"📤 [DEBUG] Status sent for {device_name}")
@@ -90,6 +114,39 @@ class StatusManager:
             if DEBUG_MODE:
                 print(f"❌ [StatusManager] Redis Write Error: {e}")
 
+    # === 🎒 ИТОГИ ЛУТА ПО ФЛОТУ ===
+    def add_inventory(self, project_name: str, loot: dict):
+        """Прибавляет лут успешного аккаунта к общим итогам проекта (inv:{project})"""
+        if not self._redis: return
+        try:
+            device_name = self._device_name()
+            sender = self._sender()
+            if sender:
+                # HINCRBYFLOAT неидемпотентен: MULTI и без повторов (см. sender.py)
+                sender.submit(lambda pipe: queue_inventory(pipe, project_name, device_name, loot),
+                              priority=PRIORITY_KEEP, atomic=True)
+            else:
+                add_inventory(self._redis, project_name, device_name, loot)
+        except Exception as e:
+            if DEBUG_MODE:
+                print(f"❌ [StatusManager] Inventory Write Error: {e}")
+
+    def reset_inventory(self, project_name: str):
+        """Убирает вклад этого воркера из итогов проекта (новый цикл / перезапуск)"""
+        if not self._redis: return
+        try:
+            device_name = self._device_name()
+            sender = self._sender()
+            if sender:
+                # Тоже через очередь - иначе сброс обгонит еще не отправленные прибавки лута
+                sender.submit(lambda pipe: drop_worker_inventory(pipe, project_name, device_name),
+                              priority=PRIORITY_KEEP)
+            else:
+                drop_worker_inventory(self._redis, project_name, device_name)
+        except Exception as e:
+            if DEBUG_MODE:
+                print(f"❌ [StatusManager] Inventory Reset Error: {e}")
+
     def send_alert(self, text: str, status: str = "Info"):
         if not getattr(config, 'USE_TG_BOT', False): return
 
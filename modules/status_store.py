@@ -0,0 +1,143 @@
+# modules/status_store.py
+import hashlib
+import json
+import re
+import time
+
+from .timeseries import queue_sample
+from .worker_index import queue_index
+
+# Реестр проектов: множество имен, в которые пишут воркеры.
+# Бот строит меню по нему, а не через KEYS status:* (это O(всей базы) на сервере).
+PROJECTS_KEY = "projects"
+
+# Канал, в который воркер анонсирует каждую запись статуса.
+# Бот держит снимок всего флота в памяти и патчит его по этим сообщениям.
+STATUS_CHANNEL = "status_updates"
+
+# Сколько живет хэш статусов проекта без обновлений (сек)
+STATUS_TTL = 86400
+
+# === 📦 ПРОТОКОЛ СТАТУСА v2 ===
+# Вместо строки "12/500 (✅10 ❌2)" и инвентаря вперемешку с системными полями -
+# числовые поля + отдельный словарь inv. Пишется компактным JSON.
+# {"v": 2, "status": "Working 🟢", "account": "0x..", "last_updated": 1700000000.0, "heartbeat": 3600,
+#  "done": 12, "total": 500, "success": 10, "fail": 2, "position": 13, "error": "...", "inv": {"💰 Coins": 5}}
+STATUS_VERSION = 2
+PROGRESS_FIELDS = ("done", "total", "success", "fail", "position")
+
+# Старые (v1) имена полей -> v2
+_V1_FIELDS = {
+    "current_account": "account",
+    "heartbeat_threshold": "heartbeat",
+    "pos_current": "position",
+    "pos_total": "total",
+}
+_SYSTEM_FIELDS = {"v", "status", "account", "last_updated", "heartbeat", "error", "inv", "progress"} | set(PROGRESS_FIELDS)
+_PROGRESS_RE = re.compile(r"(\d+)/(\d+).*?✅\s*(\d+).*?❌\s*(\d+)")
+
+
+def _to_int(value, default=0):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def normalize_status(data: dict) -> dict:
+    """
+    Приводит статус к v2. Принимает как v2, так и старый v1-словарь
+    (строка progress, pos_*, инвентарь в корне) - это и есть шим совместимости.
+    """
+    if data.get("v") == STATUS_VERSION:
+        return data
+
+    src = {_V1_FIELDS.get(k, k): v for k, v in data.items()}
+    st = {
+        "v": STATUS_VERSION,
+        "status": str(src.get("status", "Unknown")),
+        "last_updated": float(src.get("last_updated") or 0),
+    }
+    if src.get("account") not in (None, ""): st["account"] = str(src["account"])
+    if src.get("heartbeat"): st["heartbeat"] = _to_int(src["heartbeat"])
+    if src.get("error"): st["error"] = str(src["error"])
+
+    for field in PROGRESS_FIELDS:
+        if src.get(field) not in (None, ""):
+            st[field] = _to_int(src[field])
+
+    # v1: разбираем строку прогресса один раз здесь, а не на каждом рендере
+    progress = src.get("progress")
+    if isinstance(progress, str) and "success" not in st:
+        match = _PROGRESS_RE.search(progress)
+        if match:
+            st.setdefault("total", int(match.group(2)))
+            st["success"] = int(match.group(3))
+            st["fail"] = int(match.group(4))
+            st["done"] = st["success"] + st["fail"]
+
+    inv = dict(src.get("inv") or {})
+    for k, v in src.items():
+        if k not in _SYSTEM_FIELDS: inv[k] = v
+    if inv: st["inv"] = inv
+    return st
+
+
+def _prepare_for_write(data: dict) -> dict:
+    status = normalize_status(data)
+    if not status.get("last_updated"):
+        status = dict(status, last_updated=time.time())
+    return status
+
+
+def encode_status(data: dict) -> str:
+    return json.dumps(_prepare_for_write(data), ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_status(raw):
+    """JSON-строка или словарь (v1/v2) -> словарь v2. None, если разобрать нельзя."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return None
+    if not isinstance(raw, dict):
+        return None
+    return normalize_status(raw)
+
+
+def queue_status(pipe, project_name: str, worker_name: str, data: dict, sample=None) -> dict:
+    """
+    Ставит запись статуса в пайплайн: сам статус + регистрация проекта в реестре
+    + индексы для постраничного списка + анонс в канал обновлений для снимка бота.
+    sample - (done, success, fail): приращения для time-series скорости (см. timeseries.py).
+    """
+    status = _prepare_for_write(data)
+    data_str = json.dumps(status, ensure_ascii=False, separators=(",", ":"))
+    delta = json.dumps({"project": project_name, "worker": worker_name, "status": status},
+                       ensure_ascii=False, separators=(",", ":"))
+
+    pipe.hset(f"status:{project_name}", worker_name, data_str)
+    pipe.expire(f"status:{project_name}", STATUS_TTL)
+    pipe.sadd(PROJECTS_KEY, project_name)
+    queue_index(pipe, project_name, worker_name, status, STATUS_TTL)
+    pipe.publish(STATUS_CHANNEL, delta)
+    if sample is not None:
+        queue_sample(pipe, project_name, worker_name, status["last_updated"], *sample)
+    return status
+
+
+def write_status(client, project_name: str, worker_name: str, data: dict, sample=None):
+    """Записывает статус воркера одним пайплайном (client - синхронный redis.Redis)"""
+    pipe = client.pipeline(transaction=False)
+    status = queue_status(pipe, project_name, worker_name, data, sample)
+    pipe.execute()
+    return status
+
+
+def short_wallet_id(wallet_address: str) -> str:
+    """
+    Короткий стабильный id кошелька для callback_data (лимит Telegram - 64 байта).
+    Воркер пишет индекс fail_ids:{project}:{worker} = {short_id: wallet}, бот по нему находит кошелек одним HGET.
+    """
+    return hashlib.blake2b(wallet_address.encode("utf-8"), digest_size=5).hexdigest()
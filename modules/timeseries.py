@@ -0,0 +1,106 @@
+# modules/timeseries.py
+"""
+Компактный time-series скорости воркера в Redis.
+
+Два кольцевых буфера на воркера (hash: слот -> "bucket:done:success:fail"):
+    ts:{project}:{worker}:1m - минутные бакеты за сутки (1440 слотов)
+    ts:{project}:{worker}:1h - часовые бакеты за 30 дней (720 слотов)
+Каждая запись статуса обновляет оба буфера одним EVALSHA; старый бакет в слоте просто затирается,
+поэтому память на воркера ограничена, а даунсэмплинг происходит сам собой.
+Чтение - HMGET только нужных слотов (последний час / сутки), без обхода истории.
+"""
+
+RESOLUTIONS = (("1m", 60, 1440), ("1h", 3600, 720))
+TS_TTL = 30 * 86400
+
+TS_WRITE_LUA = """
+local now = tonumber(ARGV[1])
+local specs = {{KEYS[1], 60, 1440}, {KEYS[2], 3600, 720}}
+for _, spec in ipairs(specs) do
+    local bucket = math.floor(now / spec[2])
+    local slot = bucket % spec[3]
+    local cur = redis.call('HGET', spec[1], slot)
+    local d, s, f = 0, 0, 0
+    if cur then
+        local b, cd, cs, cf = string.match(cur, '^(%d+):(%d+):(%d+):(%d+)$')
+        if tonumber(b) == bucket then
+            d, s, f = tonumber(cd), tonumber(cs), tonumber(cf)
+        end
+    end
+    redis.call('HSET', spec[1], slot, string.format('%d:%d:%d:%d', bucket, d + ARGV[2], s + ARGV[3], f + ARGV[4]))
+    redis.call('EXPIRE', spec[1], ARGV[5])
+end
+return 1
+"""
+
+
+def ts_keys(project_name: str, worker_name: str) -> list:
+    return [f"ts:{project_name}:{worker_name}:{name}" for name, _, _ in RESOLUTIONS]
+
+
+_write_script = None  # Script (EVALSHA), создается при первой записи
+
+
+def queue_sample(pipe, project_name: str, worker_name: str, now: float, done=0, success=0, fail=0):
+    """Добавляет точку в пайплайн (done/success/fail = приращения; нули - просто отметка 'жив')"""
+    global _write_script
+    if _write_script is None: _write_script = pipe.register_script(TS_WRITE_LUA)
+    # В пайплайне redis-py сам проверит SCRIPT EXISTS и догрузит скрипт перед execute
+    _write_script(keys=ts_keys(project_name, worker_name),
+                  args=[now, int(done), int(success), int(fail), TS_TTL], client=pipe)
+
+
+def _slots(now: float, step: int, size: int, count: int) -> list:
+    """Последние count бакетов (от текущего назад): [(bucket, slot), ...]"""
+    current = int(now // step)
+    return [(b, b % size) for b in range(current, current - count, -1)]
+
+
+def _parse(raw, bucket: int):
+    if not raw: return None
+    try:
+        b, d, s, f = (int(x) for x in raw.split(":"))
+    except ValueError:
+        return None
+    return (d, s, f) if b == bucket else None
+
+
+def _rate(rows):
+    success = sum(r[1] for r in rows)
+    fail = sum(r[2] for r in rows)
+    return success * 100 // (success + fail) if success + fail else None
+
+
+async def read_throughput(client, project_name: str, worker_name: str, now: float) -> dict:
+    """
+    Скорость и успешность по кольцам (async-клиент бота), один round-trip:
+    {"per_hour": аккаунтов/час, "success_1h": %, "success_6h": %, "success_24h": %}
+    """
+    key_1m, key_1h = ts_keys(project_name, worker_name)
+    minutes = _slots(now, 60, 1440, 60)
+    hours = _slots(now, 3600, 720, 24)
+
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.hmget(key_1m, [slot for _, slot in minutes])
+        pipe.hmget(key_1h, [slot for _, slot in hours])
+        raw_min, raw_hour = await pipe.execute()
+
+    min_rows = [(b, _parse(raw, b)) for (b, _), raw in zip(minutes, raw_min)]
+    min_rows = [(b, row) for b, row in min_rows if row]
+    # i = сколько часов назад
+    hour_rows = [(i, _parse(raw, b)) for i, ((b, _), raw) in enumerate(zip(hours, raw_hour))]
+    hour_rows = [(i, row) for i, row in hour_rows if row]
+
+    result = {"per_hour": None, "success_1h": None, "success_6h": None, "success_24h": None}
+    if min_rows:
+        done = sum(row[0] for _, row in min_rows)
+        # Если воркер стартовал меньше часа назад - считаем по фактическому окну
+        first_bucket = min(b for b, _ in min_rows)
+        elapsed = max(60.0, now - first_bucket * 60)
+        result["per_hour"] = done * 3600 / elapsed
+        result["success_1h"] = _rate([row for _, row in min_rows])
+
+    if hour_rows:
+        result["success_6h"] = _rate([row for i, row in hour_rows if i < 6])
+        result["success_24h"] = _rate([row for _, row in hour_rows])
+    return result
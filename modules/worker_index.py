@@ -0,0 +1,144 @@
+# modules/worker_index.py
+"""
+Отсортированные индексы воркеров проекта - по ним бот листает список страницами,
+не вытаскивая весь флот в одну клавиатуру.
+
+    workers:{project}:seen - score = -last_updated          (🕒 свежие сверху)
+    workers:{project}:prio - score = ранг * 1e10 - last_updated (⚡️ ошибки и молчащие > активные > остальные,
+                             внутри - свежие)
+    workers:{project}:az   - score = 0, порядок по имени     (🔤)
+
+Порядок ZRANGE по возрастанию и есть порядок показа. Индексы обновляются в том же пайплайне,
+что и статус (write_status), и живут столько же, сколько хэш статусов.
+Страница = один EVAL: позиция якоря (последний/первый воркер прошлой страницы) + ZRANGE на N строк.
+
+Плюс общий индекс для сторожа офлайна (бот, watchdog_loop):
+    watchdog:deadlines - {"project|worker": last_updated + heartbeat}, только для работающих воркеров.
+Бот раз в тик берет ZRANGEBYSCORE до (now - SAFETY_BUFFER) и забирает каждого через CLAIM_DEADLINE_LUA
+(ZREM, только если дедлайн тот же, что видели - воркер мог успеть его продлить) -
+кто удалил, тот и шлет алерт (без дублей) и переносит воркера в ранг ошибок в prio (queue_silent):
+сам воркер молчит, так что пересчитать его ранг больше некому.
+Следующая запись статуса вернет воркера в оба индекса с обычным рангом.
+"""
+
+INDEX_MODES = ("seen", "prio", "az")
+
+# settings:sort_dev -> индекс
+SORT_TO_INDEX = {"priority": "prio", "latest": "seen", "az": "az"}
+
+DEADLINES_KEY = "watchdog:deadlines"
+DEFAULT_HEARTBEAT = 900  # если воркер не прислал свой порог
+
+_RANK_SPAN = 1e10  # больше любого unix time, так что ранг всегда главнее времени
+
+# KEYS: watchdog:deadlines; ARGV: member, дедлайн из ZRANGEBYSCORE. 1 - захватили, 0 - уже забрали или продлен
+CLAIM_DEADLINE_LUA = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) == tonumber(ARGV[2]) then
+    return redis.call('ZREM', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# ARGV: якорь ("" - первая страница), направление next/prev, размер страницы, score якоря (если он исчез),
+# "lex" - индекс с одинаковыми score (az): место исчезнувшего якоря ищем по имени, а не по score
+PAGE_LUA = """
+local size = tonumber(ARGV[3])
+local total = redis.call('ZCARD', KEYS[1])
+local start = 0
+if ARGV[1] ~= '' then
+    local rank = redis.call('ZRANK', KEYS[1], ARGV[1])
+    if not rank then
+        -- якорь удален: встаем туда, где он был бы по score (в az все score = 0 - по имени)
+        if ARGV[5] == 'lex' then
+            rank = redis.call('ZLEXCOUNT', KEYS[1], '-', '(' .. ARGV[1])
+        else
+            rank = redis.call('ZCOUNT', KEYS[1], '-inf', '(' .. ARGV[4])
+        end
+        if ARGV[2] == 'next' then rank = rank - 1 end
+    end
+    if ARGV[2] == 'prev' then
+        start = math.max(0, rank - size)
+    else
+        start = rank + 1
+    end
+end
+return {start, total, redis.call('ZRANGE', KEYS[1], start, start + size - 1, 'WITHSCORES')}
+"""
+
+
+def index_key(project_name: str, mode: str) -> str:
+    return f"workers:{project_name}:{mode}"
+
+
+def page_args(mode: str, anchor: str, direction: str, size: int, anchor_score: float) -> list:
+    """ARGV для PAGE_LUA"""
+    return [anchor, direction, size, anchor_score, "lex" if mode == "az" else ""]
+
+
+def is_working(status: str) -> bool:
+    st = str(status).lower()
+    return "working" in st or "active" in st
+
+
+def priority_rank(status: str, silent: bool = False) -> int:
+    """0 - ошибки и молчащие 'работающие' (для пользователя это offline), 1 - активные, 2 - остальные"""
+    st = str(status).lower()
+    if silent or "error" in st or "fail" in st: return 0
+    if is_working(st): return 1
+    return 2
+
+
+def deadline_member(project_name: str, worker_name: str) -> str:
+    return f"{project_name}|{worker_name}"
+
+
+def status_deadline(status: dict):
+    """Когда воркер станет 'молчащим' (без буфера бота). None - статус не рабочий, следить не нужно."""
+    if not is_working(status.get("status", "")): return None
+    ts = float(status.get("last_updated") or 0)
+    return ts + int(status.get("heartbeat") or DEFAULT_HEARTBEAT)
+
+
+def index_scores(status: dict, silent: bool = False) -> dict:
+    ts = float(status.get("last_updated") or 0)
+    return {
+        "seen": -ts,
+        "prio": priority_rank(status.get("status", ""), silent) * _RANK_SPAN - ts,
+        "az": 0,
+    }
+
+
+def queue_index(pipe, project_name: str, worker_name: str, status: dict, ttl: int, watch: bool = True,
+                silent: bool = False):
+    """
+    Обновляет позицию воркера во всех индексах и его дедлайн для сторожа (в пайплайн записи статуса).
+    watch=False - только списки (перестройка индексов ботом не должна будить сторожа).
+    silent=True - воркер уже пропустил дедлайн (перестройка ботом), в prio он идет к ошибкам.
+    """
+    for mode, score in index_scores(status, silent).items():
+        key = index_key(project_name, mode)
+        pipe.zadd(key, {worker_name: score})
+        pipe.expire(key, ttl)
+    if not watch: return
+
+    deadline = status_deadline(status)
+    if deadline is None:
+        pipe.zrem(DEADLINES_KEY, deadline_member(project_name, worker_name))
+    else:
+        pipe.zadd(DEADLINES_KEY, {deadline_member(project_name, worker_name): deadline})
+
+
+def queue_silent(client, project_name: str, worker_name: str, status: dict):
+    """
+    Сторож: воркер пропустил дедлайн - в prio поднимаем его к ошибкам (XX: удаленного не возвращаем).
+    Работает с обоими клиентами и с пайплайном (у async-клиента результат надо await-ить).
+    """
+    return client.zadd(index_key(project_name, "prio"), {worker_name: index_scores(status, silent=True)["prio"]},
+                       xx=True)
+
+
+def queue_remove(pipe, project_name: str, worker_name: str):
+    for mode in INDEX_MODES:
+        pipe.zrem(index_key(project_name, mode), worker_name)
+    pipe.zrem(DEADLINES_KEY, deadline_member(project_name, worker_name))